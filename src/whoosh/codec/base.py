@@ -30,6 +30,7 @@ This module contains base classes/interfaces for "codec" objects.
 """
 
 from bisect import bisect_right
+from threading import Lock
 
 from whoosh import columns
 from whoosh.automata import lev
@@ -37,6 +38,7 @@ from whoosh.compat import abstractmethod, izip, unichr, xrange
 from whoosh.filedb.compound import CompoundStorage
 from whoosh.system import emptybytes
 from whoosh.util import random_name
+from whoosh.util.cache import LRUCache
 
 
 # Exceptions
@@ -45,6 +47,29 @@ class OutOfOrderError(Exception):
     pass
 
 
+# Shared cache of decoded posting blocks
+
+# Maximum number of blocks in the process-wide block cache
+SHARED_BLOCK_CACHE_SIZE = 4096
+
+_block_cache = None
+_block_cache_lock = Lock()
+
+
+def shared_block_cache():
+    """Returns the process-wide :class:`whoosh.util.cache.LRUCache` of decoded
+    posting blocks, which is used by readers opened with ``blockcache=True``.
+    The cache holds up to ``SHARED_BLOCK_CACHE_SIZE`` blocks.
+    """
+
+    global _block_cache
+
+    with _block_cache_lock:
+        if _block_cache is None:
+            _block_cache = LRUCache(SHARED_BLOCK_CACHE_SIZE)
+        return _block_cache
+
+
 # Base classes
 
 class Codec(object):
@@ -85,6 +110,16 @@ class Codec(object):
     def per_document_reader(self, storage, segment):
         raise NotImplementedError
 
+    def bloom_filters(self, storage, segment):
+        """Returns a dictionary mapping the names of the segment's unique
+        fields to :class:`whoosh.filedb.filetables.BloomFilter` objects
+        containing the terms in the field, which readers use to avoid looking
+        up keys that aren't in the segment. Codecs that don't write Bloom
+        filters return an empty dictionary.
+        """
+
+        return {}
+
     # Segments and generations
 
     @abstractmethod
@@ -118,6 +153,9 @@ class WrappingCodec(Codec):
     def per_document_reader(self, storage, segment):
         return self._child.per_document_reader(storage, segment)
 
+    def bloom_filters(self, storage, segment):
+        return self._child.bloom_filters(storage, segment)
+
     def new_segment(self, storage, indexname):
         return self._child.new_segment(storage, indexname)
 
@@ -157,6 +195,13 @@ class PerDocumentWriter(object):
     def close(self):
         pass
 
+    def cancel(self):
+        """Called instead of :meth:`close` when the segment being written is
+        thrown away. The default implementation just calls :meth:`close`.
+        """
+
+        self.close()
+
 
 class FieldWriter(object):
     def add_postings(self, schema, lengths, items):
@@ -167,6 +212,7 @@ class FieldWriter(object):
         start_field = self.start_field
         start_term = self.start_term
         add = self.add
+        add_raw = self.add_raw
         finish_term = self.finish_term
         finish_field = self.finish_field
 
@@ -224,6 +270,13 @@ class FieldWriter(object):
                 start_term(btext)
                 lasttext = btext
 
+            # If the value is a RawPostings object, this "posting" is really
+            # the whole posting list of the term in a segment being merged,
+            # still encoded, starting at this document number
+            if isinstance(value, RawPostings):
+                add_raw(docnum, value)
+                continue
+
             # Add this posting
             length = dfl(docnum, fieldname)
             if value is None:
@@ -247,6 +300,23 @@ class FieldWriter(object):
     def add(self, docnum, weight, vbytes, length):
         raise NotImplementedError
 
+    def raw_source(self, reader):
+        """Returns a function that takes a field name and a term (as bytes) and
+        returns a :class:`RawPostings` object for the term's posting list in
+        the given reader, or None if the postings have to be decoded instead.
+        Returns None if this writer can't copy encoded posting lists from the
+        reader at all, which is what the default implementation does.
+        """
+
+        return None
+
+    def add_raw(self, docnum, rawpostings):
+        """Copies an encoded posting list (see :meth:`raw_source`) into the
+        current term, shifting its IDs so the first one is ``docnum``.
+        """
+
+        raise NotImplementedError
+
     def add_spell_word(self, fieldname, text):
         raise NotImplementedError
 
@@ -260,9 +330,30 @@ class FieldWriter(object):
     def close(self):
         pass
 
+    def cancel(self):
+        """Called instead of :meth:`close` when the segment being written is
+        thrown away. The default implementation just calls :meth:`close`.
+        """
+
+        self.close()
+
 
 # Postings
 
+class RawPostings(object):
+    """Stands in for the whole posting list of a term, still encoded by the
+    codec that wrote it, in a stream of postings passed to
+    :meth:`FieldWriter.add_postings`. This lets merges copy posting lists
+    without decoding and re-encoding every posting.
+    """
+
+    def __init__(self, terminfo):
+        self.terminfo = terminfo
+
+    def min_id(self):
+        return self.terminfo.min_id()
+
+
 class PostingsWriter(object):
     @abstractmethod
     def start_postings(self, format_, terminfo):
@@ -344,6 +435,18 @@ class TermsReader(object):
     def indexed_field_names(self):
         raise NotImplementedError
 
+    def set_block_cache(self, cache, segid):
+        """Sets a cache object (such as :class:`whoosh.util.cache.LRUCache`)
+        to share decoded posting blocks between matchers and readers. The
+        segment ID is used to key the blocks in the cache. Readers that don't
+        support caching blocks ignore this.
+
+        :param cache: the cache object, or None to stop caching blocks.
+        :param segid: the ID of the segment this reader reads from.
+        """
+
+        pass
+
     def close(self):
         pass
 
@@ -468,7 +571,7 @@ class PerDocumentReader(object):
     # Stored
 
     @abstractmethod
-    def stored_fields(self, docnum):
+    def stored_fields(self, docnum, fieldnames=None):
         raise NotImplementedError
 
     def all_stored_fields(self):
@@ -494,6 +597,8 @@ class Segment(object):
 
     # Extension for compound segment files
     COMPOUND_EXT = ".seg"
+    # Extension for files of deleted document numbers
+    DELETIONS_EXT = ".del"
 
     # self.indexname
     # self.segid
@@ -628,9 +733,58 @@ class Segment(object):
 
         raise NotImplementedError
 
+    def deletion_version(self):
+        """Returns a string identifying this segment's current set of
+        deleted documents, or None if no documents are deleted. Segment
+        objects with the same segment ID and deletion version have the same
+        deleted documents, so caches can use the pair to identify a version of
+        the segment without copying the deleted document numbers. The version
+        is pickled with the segment, so copies read from the TOC keep it.
+        """
+
+        if not self.has_deletions():
+            return None
+        version = getattr(self, "_delversion", None)
+        if version is None:
+            version = self._delversion = self._random_id()
+        return version
+
+    def _deletions_changed(self):
+        # Subclasses call this whenever they delete or undelete a document, so
+        # deletion_version() makes up a new version next time it's called
+        self._delversion = None
+
     def should_assemble(self):
         return True
 
+    # Deletion files
+
+    def deletions_filename(self):
+        """Returns the name of the file holding this segment's deleted
+        document numbers, or None if the segment doesn't keep its deletions in
+        a separate file (the default is to pickle them with the segment in
+        the TOC).
+        """
+
+        return None
+
+    def save_deletions(self, storage, generation):
+        """Called by the TOC before it pickles this segment, so segments that
+        keep their deletions in a separate file can write any changes to a
+        file for the given generation. The default implementation does
+        nothing.
+        """
+
+        pass
+
+    def open_deletions(self, storage):
+        """Called by the TOC after it unpickles this segment, so segments that
+        keep their deletions in a separate file can load them. The default
+        implementation does nothing.
+        """
+
+        pass
+
 
 # Wrapping Segment
 
@@ -686,6 +840,18 @@ class WrappingSegment(Segment):
     def is_deleted(self, docnum):
         return self._child.is_deleted(docnum)
 
+    def deletion_version(self):
+        return self._child.deletion_version()
+
+    def deletions_filename(self):
+        return self._child.deletions_filename()
+
+    def save_deletions(self, storage, generation):
+        self._child.save_deletions(storage, generation)
+
+    def open_deletions(self, storage):
+        self._child.open_deletions(storage)
+
     def set_doc_count(self, doccount):
         self._child.set_doc_count(doccount)
 
@@ -179,8 +179,11 @@ class MemPerDocReader(base.PerDocumentReader):
         ids, weights, values = zip(*items)
         return ListMatcher(ids, weights, values, format_)
 
-    def stored_fields(self, docnum):
-        return self._segment._stored[docnum]
+    def stored_fields(self, docnum, fieldnames=None):
+        sfs = self._segment._stored[docnum]
+        if fieldnames is not None:
+            sfs = dict((name, sfs[name]) for name in fieldnames if name in sfs)
+        return sfs
 
     def close(self):
         pass
@@ -316,6 +319,7 @@ class MemSegment(base.Segment):
             del self._stored[docnum]
             del self._lengths[docnum]
             del self._vectors[docnum]
+            self._deletions_changed()
 
     def has_deletions(self):
         with self._lock:
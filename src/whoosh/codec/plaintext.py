@@ -291,10 +291,13 @@ class PlainPerDocReader(base.PerDocumentReader, LineReader):
             c = self._find_line(2, "DOCFIELD")
         return sfs
 
-    def stored_fields(self, docnum):
+    def stored_fields(self, docnum, fieldnames=None):
         if not self._find_doc(docnum):
             raise Exception
-        return self._read_stored_fields()
+        sfs = self._read_stored_fields()
+        if fieldnames is not None:
+            sfs = dict((name, sfs[name]) for name in fieldnames if name in sfs)
+        return sfs
 
     def iter_docs(self):
         return enumerate(self.all_stored_fields())
@@ -448,5 +451,9 @@ class PlainSegment(base.Segment):
     def doc_count(self):
         return self._doccount
 
+    def deleted_count(self):
+        # This codec doesn't support deleting documents
+        return 0
+
     def should_assemble(self):
         return False
@@ -35,7 +35,7 @@ from collections import defaultdict
 
 from whoosh import columns, formats
 from whoosh.compat import b, bytes_type, string_type, integer_types
-from whoosh.compat import dumps, loads, iteritems, xrange
+from whoosh.compat import dumps, loads, iteritems, izip, xrange
 from whoosh.codec import base
 from whoosh.filedb import compound, filetables
 from whoosh.matching import ListMatcher, ReadTooFar, LeafMatcher
@@ -73,11 +73,29 @@ class W3Codec(base.Codec):
     POSTS_EXT = ".pst"  # Term postings
     VPOSTS_EXT = ".vps"  # Vector postings
     COLUMN_EXT = ".col"  # Per-document value columns
+    BLOOM_EXT = ".blm"  # Bloom filters of unique fields
+
+    # Codecs pickled before this option existed don't have the attribute
+    _compressthreads = 0
+
+    def __init__(self, blocklimit=128, compression=3, inlinelimit=1,
+                 compressthreads=0):
+        """
+        :param blocklimit: the maximum number of postings in a block.
+        :param compression: the zlib compression level for posting blocks, or
+            0 to not compress them.
+        :param inlinelimit: posting lists with fewer postings than this are
+            stored in the term info instead of the postings file.
+        :param compressthreads: if this is greater than 0, the writers
+            compress posting blocks and stored field values on this many
+            threads while the writer keeps working. The files written are
+            exactly the same as without threads.
+        """
 
-    def __init__(self, blocklimit=128, compression=3, inlinelimit=1):
         self._blocklimit = blocklimit
         self._compression = compression
         self._inlinelimit = inlinelimit
+        self._compressthreads = compressthreads
 
     # def automata(self):
 
@@ -91,10 +109,19 @@ class W3Codec(base.Codec):
 
     # Postings
 
-    def postings_writer(self, dbfile, byteids=False):
+    def postings_writer(self, dbfile, byteids=False, compressor=None):
         return W3PostingsWriter(dbfile, blocklimit=self._blocklimit,
                                 byteids=byteids, compression=self._compression,
-                                inlinelimit=self._inlinelimit)
+                                inlinelimit=self._inlinelimit,
+                                compressor=compressor)
+
+    def _compressor(self):
+        # Returns a ParallelCompressor for a writer to use, or None if the
+        # writers should compress inline
+        if self._compressthreads > 0:
+            from whoosh.util.compression import ParallelCompressor
+
+            return ParallelCompressor(self._compressthreads)
 
     def postings_reader(self, dbfile, terminfo, format_, term=None, scorer=None):
         if terminfo.is_inlined():
@@ -123,6 +150,22 @@ class W3Codec(base.Codec):
 
         return W3TermsReader(self, tifile, tilen, postfile)
 
+    def bloom_filters(self, storage, segment):
+        filename = segment.make_filename(self.BLOOM_EXT)
+        if not storage.file_exists(filename):
+            # The segment has no unique fields, or was written before Bloom
+            # filters were added
+            return {}
+
+        f = storage.open_file(filename)
+        try:
+            data = f.read_pickle()
+        finally:
+            f.close()
+        from_bytes = filetables.BloomFilter.from_bytes
+        return dict((fieldname, from_bytes(bs, numhashes))
+                    for fieldname, (numhashes, bs) in iteritems(data))
+
     # Graph methods provided by CodecWithGraph
 
     # Columns
@@ -154,15 +197,25 @@ def _lenfield(fieldname):
 # Per-doc information writer
 
 class W3PerDocWriter(base.PerDocWriterWithColumns):
+    # The name and type of the column the stored fields dictionaries are
+    # written to
+    _storedname = "_stored"
+    _storedcolumn = STORED_COLUMN
+
     def __init__(self, codec, storage, segment):
         self._codec = codec
         self._storage = storage
         self._segment = segment
 
-        tempst = storage.temp_storage("%s.tmp" % segment.indexname)
-        self._cols = compound.CompoundWriter(tempst)
+        # Buffer the columns in a temporary directory of this segment's own,
+        # so other writers on the index (such as a background merge) cleaning
+        # up the index's shared temporary directory don't disturb it
+        self._tempstorage = storage.temp_storage("%s.tmp"
+                                                 % segment.segment_id())
+        self._cols = compound.CompoundWriter(self._tempstorage)
+        self._compressor = codec._compressor()
         self._colwriters = {}
-        self._create_column("_stored", STORED_COLUMN)
+        self._create_column(self._storedname, self._storedcolumn)
 
         self._fieldlengths = defaultdict(int)
         self._doccount = 0
@@ -187,7 +240,9 @@ class W3PerDocWriter(base.PerDocWriterWithColumns):
             raise Exception("Already added column %r" % fieldname)
 
         f = self._cols.create_file(fieldname)
-        writers[fieldname] = column.writer(f)
+        writer = writers[fieldname] = column.writer(f)
+        if self._compressor is not None:
+            writer.set_compressor(self._compressor)
 
     def _get_column(self, fieldname):
         return self._colwriters[fieldname]
@@ -247,7 +302,7 @@ class W3PerDocWriter(base.PerDocWriterWithColumns):
     def finish_doc(self):
         sf = self._storedfields
         if sf:
-            self.add_column_value("_stored", STORED_COLUMN, sf)
+            self.add_column_value(self._storedname, self._storedcolumn, sf)
             sf.clear()
         self._indoc = False
 
@@ -264,7 +319,10 @@ class W3PerDocWriter(base.PerDocWriterWithColumns):
         # Finish open columns and close the columns writer
         for writer in self._colwriters.values():
             writer.finish(self._doccount)
+        if self._compressor is not None:
+            self._compressor.close()
         self._cols.save_as_files(self._storage, self._column_filename)
+        self._tempstorage.destroy()
 
         # If vectors were written, close the vector writers
         if self._vpostfile:
@@ -272,6 +330,13 @@ class W3PerDocWriter(base.PerDocWriterWithColumns):
 
         self.is_closed = True
 
+    def cancel(self):
+        # Don't wait for the compression threads to finish data that's going
+        # to be thrown away
+        if self._compressor is not None:
+            self._compressor.terminate()
+        self.close()
+
 
 class W3FieldWriter(base.FieldWriter):
     def __init__(self, codec, storage, segment):
@@ -286,18 +351,38 @@ class W3FieldWriter(base.FieldWriter):
         self._format = None
 
         _tifile = self._create_file(W3Codec.TERMS_EXT)
-        self._tindex = filetables.OrderedHashWriter(_tifile)
+        self._tindex = self._create_term_index(_tifile)
         self._fieldmap = self._tindex.extras["fieldmap"] = {}
 
         self._postfile = self._create_file(W3Codec.POSTS_EXT)
+        # If the codec compresses on threads, the posting blocks and term
+        # index entries are written by callbacks from the compressor
+        self._compressor = codec._compressor()
 
         self._postwriter = None
         self._infield = False
+        # Maps the names of unique fields to arrays of the hash pairs of their
+        # terms, for building the segment's Bloom filters
+        self._bloomhashes = {}
+        self._hashes = None
         self.is_closed = False
 
     def _create_file(self, ext):
         return self._segment.create_file(self._storage, ext)
 
+    def _create_term_index(self, dbfile):
+        return filetables.OrderedHashWriter(dbfile)
+
+    def add_postings(self, schema, lengths, items):
+        try:
+            base.FieldWriter.add_postings(self, schema, lengths, items)
+        except Exception:
+            # Don't leave the compression threads running if writing the
+            # postings fails
+            if self._compressor is not None:
+                self._compressor.terminate()
+            raise
+
     def start_field(self, fieldname, fieldobj):
         fmap = self._fieldmap
         if fieldname in fmap:
@@ -310,15 +395,25 @@ class W3FieldWriter(base.FieldWriter):
         self._fieldobj = fieldobj
         self._format = fieldobj.format
         self._infield = True
+        if fieldobj.unique:
+            self._hashes = self._bloomhashes.setdefault(fieldname, array("I"))
+        else:
+            self._hashes = None
 
         # Start a new postwriter for this field
-        self._postwriter = self._codec.postings_writer(self._postfile)
+        if self._compressor is not None:
+            self._postwriter = self._codec.postings_writer(
+                self._postfile, compressor=self._compressor)
+        else:
+            self._postwriter = self._codec.postings_writer(self._postfile)
 
     def start_term(self, btext):
         if self._postwriter is None:
             raise Exception("Called start_term before start_field")
         self._btext = btext
         self._postwriter.start_postings(self._fieldobj.format,  W3TermInfo())
+        if self._hashes is not None:
+            self._hashes.extend(filetables.bloom_hashes(btext))
 
     def add(self, docnum, weight, vbytes, length):
         self._postwriter.add_posting(docnum, weight, vbytes, length)
@@ -328,8 +423,14 @@ class W3FieldWriter(base.FieldWriter):
 
         # Add row to term info table
         keybytes = pack_ushort(self._fieldid) + self._btext
-        valbytes = terminfo.to_bytes()
-        self._tindex.add(keybytes, valbytes)
+        if self._compressor is not None:
+            # The term's extent isn't known until its blocks are written
+            self._compressor.call(self._add_term, keybytes, terminfo)
+        else:
+            self._add_term(keybytes, terminfo)
+
+    def _add_term(self, keybytes, terminfo):
+        self._tindex.add(keybytes, terminfo.to_bytes())
 
     # FieldWriterWithGraph.add_spell_word
 
@@ -339,11 +440,31 @@ class W3FieldWriter(base.FieldWriter):
         self._infield = False
         self._postwriter = None
 
+    def _write_bloom_filters(self):
+        data = {}
+        for fieldname, hashes in iteritems(self._bloomhashes):
+            pairs = izip(hashes[0::2], hashes[1::2])
+            bf = filetables.BloomFilter.from_hashes(pairs, len(hashes) // 2)
+            data[fieldname] = (bf.numhashes, bf.to_bytes())
+
+        f = self._create_file(W3Codec.BLOOM_EXT)
+        f.write_pickle(data)
+        f.close()
+
     def close(self):
+        if self._compressor is not None:
+            self._compressor.close()
         self._tindex.close()
         self._postfile.close()
+        if self._bloomhashes:
+            self._write_bloom_filters()
         self.is_closed = True
 
+    def cancel(self):
+        if self._compressor is not None:
+            self._compressor.terminate()
+        self.close()
+
 
 # Reader objects
 
@@ -358,6 +479,7 @@ class W3PerDocReader(base.PerDocumentReader):
         self._readers = {}
         self._minlengths = {}
         self._maxlengths = {}
+        self._laststored = (None, None)
 
     def close(self):
         for colfile, _, _ in self._colfiles.values():
@@ -490,12 +612,22 @@ class W3PerDocReader(base.PerDocumentReader):
 
     # Stored fields
 
-    def stored_fields(self, docnum):
-        reader = self._cached_reader("_stored", STORED_COLUMN)
-        v = reader[docnum]
-        if v is None:
-            v = {}
-        return v
+    def stored_fields(self, docnum, fieldnames=None):
+        # Remember the last document, since callers that only want some of the
+        # fields (such as Hit.__getitem__) often ask for the same document
+        # several times in a row
+        if self._laststored[0] == docnum:
+            v = self._laststored[1]
+        else:
+            reader = self._cached_reader("_stored", STORED_COLUMN)
+            v = reader[docnum]
+            if v is None:
+                v = {}
+            self._laststored = (docnum, v)
+
+        if fieldnames is None:
+            return dict(v)
+        return dict((name, v[name]) for name in fieldnames if name in v)
 
 
 class W3FieldCursor(base.FieldCursor):
@@ -560,14 +692,19 @@ class W3TermsReader(base.TermsReader):
     def __init__(self, codec, dbfile, length, postfile):
         self._codec = codec
         self._dbfile = dbfile
-        self._tindex = filetables.OrderedHashReader(dbfile, length)
+        self._tindex = self._open_term_index(dbfile, length)
         self._fieldmap = self._tindex.extras["fieldmap"]
         self._postfile = postfile
+        self._blockcache = None
+        self._segid = None
 
         self._fieldunmap = [None] * len(self._fieldmap)
         for fieldname, num in iteritems(self._fieldmap):
             self._fieldunmap[num] = fieldname
 
+    def _open_term_index(self, dbfile, length):
+        return filetables.OrderedHashReader(dbfile, length)
+
     def _keycoder(self, fieldname, tbytes):
         assert isinstance(tbytes, bytes_type), "tbytes=%r" % tbytes
         fnum = self._fieldmap.get(fieldname, 65535)
@@ -634,8 +771,15 @@ class W3TermsReader(base.TermsReader):
         terminfo = self.term_info(fieldname, tbytes)
         m = self._codec.postings_reader(self._postfile, terminfo, format_,
                                         term=(fieldname, tbytes), scorer=scorer)
+        if self._blockcache is not None and isinstance(m, W3LeafMatcher):
+            m.set_block_cache(self._blockcache,
+                              (self._segid, fieldname, tbytes))
         return m
 
+    def set_block_cache(self, cache, segid):
+        self._blockcache = cache
+        self._segid = segid
+
     def close(self):
         self._tindex.close()
         self._postfile.close()
@@ -647,15 +791,21 @@ class W3PostingsWriter(base.PostingsWriter):
     """This object writes posting lists to the postings file. It groups postings
     into blocks and tracks block level statistics to makes it easier to skip
     through the postings.
+
+    If the writer has a :class:`whoosh.util.compression.ParallelCompressor`,
+    blocks are compressed on its threads and written by its callbacks, so the
+    extent of a term's postings isn't set on the term info returned by
+    :meth:`finish_postings` until the compressor gets to the end of the term.
     """
 
     def __init__(self, postfile, blocklimit, byteids=False, compression=3,
-                 inlinelimit=1):
+                 inlinelimit=1, compressor=None):
         self._postfile = postfile
         self._blocklimit = blocklimit
         self._byteids = byteids
         self._compression = compression
         self._inlinelimit = inlinelimit
+        self._compressor = compressor
 
         self._blockcount = 0
         self._format = None
@@ -679,7 +829,10 @@ class W3PostingsWriter(base.PostingsWriter):
         # Remember terminfo object passed to us
         self._terminfo = terminfo
         # Remember where we started in the posting file
-        self._startoffset = self._postfile.tell()
+        if self._compressor is not None:
+            self._compressor.call(self._start_extent, terminfo)
+        else:
+            self._startoffset = self._postfile.tell()
 
     def add_posting(self, id_, weight, vbytes, length=None):
         # Add a posting to the buffered block
@@ -724,9 +877,12 @@ class W3PostingsWriter(base.PostingsWriter):
             # If there are leftover items in the current block, write them out
             if self._ids:
                 self._write_block(last=True)
-            startoffset = self._startoffset
-            length = self._postfile.tell() - startoffset
-            terminfo.set_extent(startoffset, length)
+            if self._compressor is not None:
+                self._compressor.call(self._finish_extent, terminfo)
+            else:
+                startoffset = self._startoffset
+                length = self._postfile.tell() - startoffset
+                terminfo.set_extent(startoffset, length)
 
         # Clear self._terminfo to indicate we're between terms
         self._terminfo = None
@@ -747,12 +903,23 @@ class W3PostingsWriter(base.PostingsWriter):
         self._maxlength = 0
         self._maxweight = 0
 
+    def _start_extent(self, terminfo):
+        terminfo.set_extent(self._postfile.tell(), 0)
+
+    def _finish_extent(self, terminfo):
+        startoffset = terminfo.extent()[0]
+        terminfo.set_extent(startoffset, self._postfile.tell() - startoffset)
+
     def _write_block(self, last=False):
         # Write the buffered block to the postings file
 
         # If this is the first block, write a small header first
         if not self._blockcount:
-            self._postfile.write(WHOOSH3_HEADER_MAGIC)
+            if self._compressor is not None:
+                self._compressor.call(self._postfile.write,
+                                      WHOOSH3_HEADER_MAGIC)
+            else:
+                self._postfile.write(WHOOSH3_HEADER_MAGIC)
 
         # Add this block's statistics to the terminfo object, which tracks the
         # overall statistics for all term postings
@@ -767,8 +934,6 @@ class W3PostingsWriter(base.PostingsWriter):
             comp = 0
         # Compress the pickle (if self._compression > 0)
         comp = self._compression
-        if comp:
-            databytes = zlib.compress(databytes, comp)
 
         # Make a tuple of block info. The posting reader can check this info
         # and decide whether to skip the block without having to decompress the
@@ -786,6 +951,23 @@ class W3PostingsWriter(base.PostingsWriter):
                            length_to_byte(self._maxlength),
                            ), 2)
 
+        compressor = self._compressor
+        if compressor is not None and comp:
+            compressor.compress(zlib.compress, databytes, comp,
+                                self._write_block_data, infobytes, last)
+        elif compressor is not None:
+            compressor.call(self._write_block_data, infobytes, last,
+                            databytes)
+        else:
+            if comp:
+                databytes = zlib.compress(databytes, comp)
+            self._write_block_data(infobytes, last, databytes)
+
+        self._blockcount += 1
+        # Reset block buffer
+        self._new_block()
+
+    def _write_block_data(self, infobytes, last, databytes):
         # Write block length
         postfile = self._postfile
         blocklength = len(infobytes) + len(databytes)
@@ -798,10 +980,6 @@ class W3PostingsWriter(base.PostingsWriter):
         # Write block data
         postfile.write(databytes)
 
-        self._blockcount += 1
-        # Reset block buffer
-        self._new_block()
-
     # Methods to reduce the byte size of the various lists
 
     def _mini_ids(self):
@@ -870,6 +1048,11 @@ class W3LeafMatcher(LeafMatcher):
     :class:`whoosh.matching.Matcher` interface.
     """
 
+    # Cache of decoded blocks shared with other matchers, and the key prefix
+    # for this posting list's blocks
+    _blockcache = None
+    _cachekey = None
+
     def __init__(self, postfile, startoffset, length, format_, term=None,
                  byteids=None, scorer=None):
         self._postfile = postfile
@@ -912,10 +1095,21 @@ class W3LeafMatcher(LeafMatcher):
         # Consume first block
         self._goto(self._baseoffset)
 
+    def set_block_cache(self, cache, key):
+        """Shares decoded blocks with other matchers through the given cache
+        object (such as :class:`whoosh.util.cache.LRUCache`). Blocks are
+        stored in the cache under ``key + (blockoffset,)``, so the key must
+        uniquely identify this posting list.
+        """
+
+        self._blockcache = cache
+        self._cachekey = key
+
     def _goto(self, position):
         # Read the posting block at the given position
 
         postfile = self._postfile
+        self._blockpos = position
 
         # Reset block data -- we'll lazy load the data from the new block as
         # needed
@@ -1064,17 +1258,31 @@ class W3LeafMatcher(LeafMatcher):
         return self._maxweight
 
     def _read_data(self):
+        cache = self._blockcache
+        if cache is None:
+            self._data = self._load_data()
+            return
+
+        # Try to get the decoded block from the shared cache
+        key = self._cachekey + (self._blockpos,)
+        data = cache.get(key)
+        if data is None:
+            data = self._load_data()
+            cache.put(key, data)
+        self._data = data
+
+    def _load_data(self):
         # Load block data tuple from disk
 
         datalen = self._nextoffset - self._dataoffset
-        b = self._postfile.get(self._dataoffset, datalen)
+        b = self._postfile.view(self._dataoffset, datalen)
 
         # Decompress the pickled data if necessary
         if self._compression:
             b = zlib.decompress(b)
 
-        # Unpickle the data tuple and save it in an attribute
-        self._data = loads(b)
+        # Unpickle the data tuple
+        return loads(b)
 
     def _read_ids(self):
         # If we haven't loaded the data from disk yet, load it now
@@ -1147,7 +1355,7 @@ class W3TermInfo(TermInfo):
         ml = block.min_length()
         if self._minlength is None:
             self._minlength = ml
-        else:
+        elif ml is not None:
             self._minlength = min(self._minlength, ml)
 
         self._maxlength = max(self._maxlength, block.max_length())
@@ -1156,6 +1364,25 @@ class W3TermInfo(TermInfo):
             self._minid = block.min_id()
         self._maxid = block.max_id()
 
+    def add_terminfo(self, terminfo, offset=0):
+        # Adds the statistics of another term info object, whose postings were
+        # copied into this term's postings with the given offset added to
+        # their IDs
+        self._weight += terminfo.weight()
+        self._df += terminfo.doc_frequency()
+
+        ml = terminfo.min_length()
+        if self._minlength is None:
+            self._minlength = ml
+        elif ml is not None:
+            self._minlength = min(self._minlength, ml)
+
+        self._maxlength = max(self._maxlength, terminfo.max_length())
+        self._maxweight = max(self._maxweight, terminfo.max_weight())
+        if self._minid is None:
+            self._minid = terminfo.min_id() + offset
+        self._maxid = terminfo.max_id() + offset
+
     def set_extent(self, offset, length):
         self._offset = offset
         self._length = length
@@ -1220,7 +1447,7 @@ class W3TermInfo(TermInfo):
             offpos = st.size
             lenpos = st.size + _LONG_SIZE
             terminfo._offset = unpack_long(s[offpos:lenpos])[0]
-            terminfo._length = unpack_int(s[lenpos:lenpos + _INT_SIZE])
+            terminfo._length = unpack_int(s[lenpos:lenpos + _INT_SIZE])[0]
 
         return terminfo
 
@@ -1283,7 +1510,8 @@ class W3Segment(base.Segment):
                 self._deleted = set()
             self._deleted.add(docnum)
         elif self._deleted is not None and docnum in self._deleted:
-            self._deleted.clear(docnum)
+            self._deleted.discard(docnum)
+        self._deletions_changed()
 
     def is_deleted(self, docnum):
         if self._deleted is None:
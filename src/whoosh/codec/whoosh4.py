@@ -0,0 +1,1241 @@
+# Copyright 2017 Matt Chaput. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY MATT CHAPUT ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL MATT CHAPUT OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation are
+# those of the authors and should not be interpreted as representing official
+# policies, either expressed or implied, of Matt Chaput.
+
+
+"""
+This module implements a "codec" for writing/reading Whoosh 4 posting lists.
+
+The W4 codec is the W3 codec with a different posting block format. Instead of
+pickling a tuple of the block's IDs, weights, and values, each block is stored
+as a fixed-size struct header followed by typed arrays: the IDs are stored as
+frame-of-reference deltas in the smallest unsigned array type that fits them,
+the weights are stored as an array of floats, and the values are stored as an
+array of lengths followed by the concatenated value bytes. Reading a block is
+then a handful of ``struct``/``array`` calls instead of an unpickle.
+
+Posting lists with more than one block end with a skip table containing the
+last ID and the offset of every block, so ``skip_to()`` can binary search for
+the block containing the target ID instead of reading every block header in
+between.
+
+Each block header also has an offset that is added to the block's IDs. When
+segments without deletions are merged, this lets the writer copy their
+posting blocks as they are (see :meth:`W4PostingsWriter.add_raw_postings`)
+and only rewrite the block headers, instead of decoding and re-encoding every
+posting.
+
+The term dictionary is a front-coded sorted table
+(:class:`whoosh.filedb.filetables.FrontCodedWriter`) instead of an ordered
+hash file. Keys are grouped into small blocks where each key only stores the
+suffix it doesn't share with the previous key, and a sparse index of the first
+key in each block is kept in memory. This makes the dictionary considerably
+smaller, and finding a term (or the next term after a given prefix, which is
+what the automaton-driven fuzzy/wildcard expansion does for every step) is a
+binary search over the in-memory index plus decoding a single block.
+
+Stored fields are written in compressed blocks of several documents (see
+:class:`StoredFieldsColumn`) with each field value pickled separately, so
+asking for only some of the fields of a document with
+``stored_fields(docnum, fieldnames=...)`` doesn't unpickle the others.
+
+To use it for new segments, pass the codec to the writer::
+
+    from whoosh.codec.whoosh4 import W4Codec
+
+    with myindex.writer(codec=W4Codec()) as w:
+        ...
+
+Deleted document numbers are kept in a bit set and saved in a separate file
+for each generation of the index (see :class:`W4Segment`) instead of being
+pickled into the TOC.
+
+Segments remember the codec that wrote them, so an index can contain a mixture
+of W3 and W4 segments. To rewrite the existing W3 segments of an index in the
+new format, use :func:`migrate`.
+"""
+
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain, repeat
+
+from whoosh import columns
+from whoosh.compat import b, bytes_type, text_type, xrange
+from whoosh.compat import array_frombytes, array_tobytes
+from whoosh.compat import BytesIO, dumps, iteritems, loads, pickle
+from whoosh.codec import base
+from whoosh.codec.whoosh3 import W3Codec, W3PerDocReader, W3PerDocWriter
+from whoosh.codec.whoosh3 import W3PostingsWriter
+from whoosh.codec.whoosh3 import W3FieldWriter, W3TermsReader, W3TermInfo
+from whoosh.codec.whoosh3 import W3LeafMatcher, W3Segment
+from whoosh.filedb import filetables
+from whoosh.idsets import BitSet
+from whoosh.matching import ListMatcher, ReadTooFar
+from whoosh.system import IS_LITTLE, emptybytes
+from whoosh.util.cache import LRUCache
+from whoosh.util.numlists import GrowableArray, delta_encode, delta_decode
+from whoosh.util.numeric import length_to_byte, byte_to_length
+
+try:
+    import zlib
+except ImportError:
+    zlib = None
+
+
+# This byte sequence is written at the start of a posting list to identify the
+# codec/version
+WHOOSH4_HEADER_MAGIC = b("W4Bl")
+
+# Block header
+#
+# i   | Length of the block data (negative if this is the last block)
+# I   | Number of postings in block
+# I   | Last ID in block (0 if the IDs are bytes)
+# f   | Maximum weight in block
+# B   | Compression level
+# B   | Minimum length byte
+# B   | Maximum length byte
+# B   | ID encoding
+# B   | Weight encoding
+# I   | Offset added to the decoded IDs (blocks copied from another segment
+#     | during a merge keep their data as it is and only change this)
+_blockheader = struct.Struct("!iIIfBBBBBI")
+
+# First ID and frame-of-reference base of the deltas
+_idheader = struct.Struct("!II")
+
+# Skip table, written after the last block of posting lists with more than one
+# block
+#
+# I * n | Last ID of each block (little-endian array)
+# I * n | Offset of each block relative to the end of the header magic
+# I     | Number of blocks (n)
+_skipcount = struct.Struct("!I")
+
+# ID encodings: the code is the index of the array typecode used to store the
+# deltas, so 0 means every delta is equal to the base and nothing is stored
+_ID_TYPECODES = (None, "B", "H", "I")
+# IDs are UTF-8 strings (vector postings)
+_BYTE_IDS = 255
+
+# Weight encodings
+_ALL_ONES = 0  # All weights are 1.0, nothing is stored
+_ALL_SAME = 1  # All weights are the same, store a single float
+_FLOATS = 2  # Store an array of floats
+
+_float_struct = struct.Struct("!f")
+
+# Stored fields column footer
+#
+# I   | Number of blocks
+# c   | Typecode of the block offsets array
+# c   | Typecode of the block start document numbers array
+# B   | 1 if the blocks are compressed
+_storedfooter = struct.Struct("!IccB")
+
+# Stored fields block header
+#
+# I   | Length of the pickled list of field names
+# I   | Number of values in the block
+# c   | Typecode of the value lengths array
+_storedhead = struct.Struct("!IIc")
+
+
+# Typed array helpers. Arrays are stored little-endian, so on the common
+# platforms loading them is a single copy.
+
+def _array_to_bytes(arry):
+    if not IS_LITTLE:
+        arry = array(arry.typecode, arry)
+        arry.byteswap()
+    return array_tobytes(arry)
+
+
+def _array_from_bytes(typecode, bs):
+    arry = array(typecode)
+    array_frombytes(arry, bs)
+    if not IS_LITTLE:
+        arry.byteswap()
+    return arry
+
+
+def _itemsize(typecode):
+    return array(typecode).itemsize
+
+
+def _encode_ids(ids):
+    # Returns an ID encoding code and the encoded bytes for a list of
+    # increasing integer IDs
+
+    deltas = array("I", delta_encode(ids))
+    first = deltas[0]
+    rest = deltas[1:]
+    if rest:
+        base = min(rest)
+        top = max(rest) - base
+    else:
+        base = top = 0
+
+    if top == 0:
+        code = 0
+    elif top < 256:
+        code = 1
+    elif top < 65536:
+        code = 2
+    else:
+        code = 3
+
+    idbytes = _idheader.pack(first, base)
+    if code:
+        typecode = _ID_TYPECODES[code]
+        idbytes += _array_to_bytes(array(typecode, (d - base for d in rest)))
+    return code, idbytes
+
+
+def _decode_ids(code, data, count, offset=0):
+    # Returns a tuple of the decoded IDs (plus the given offset) and the offset
+    # of the end of the ID data
+
+    first, base = _idheader.unpack_from(data, 0)
+    # The IDs are deltas from the first ID, so adding the offset to it shifts
+    # all of them
+    first += offset
+    start = _idheader.size
+    if code == 0:
+        deltas = repeat(base, count - 1)
+        end = start
+    else:
+        typecode = _ID_TYPECODES[code]
+        end = start + _itemsize(typecode) * (count - 1)
+        deltas = _array_from_bytes(typecode, data[start:end])
+        if base:
+            deltas = (d + base for d in deltas)
+    ids = array("I", delta_decode(chain((first,), deltas)))
+    return ids, end
+
+
+def _encode_strings(strings):
+    # Encodes a list of byte/unicode strings as an array of lengths followed by
+    # the concatenated bytes
+
+    strings = [s.encode("utf8") if isinstance(s, text_type) else s
+               for s in strings]
+    lengths = array("I", (len(s) for s in strings))
+    return _array_to_bytes(lengths) + emptybytes.join(strings)
+
+
+def _decode_strings(data, offset, count):
+    # Returns a list of byte strings and the offset of the end of the data.
+    # The data may be a buffer view, so the strings are copied out of it
+
+    end = offset + _itemsize("I") * count
+    lengths = _array_from_bytes("I", data[offset:end])
+    strings = []
+    for length in lengths:
+        strings.append(bytes_type(data[end:end + length]))
+        end += length
+    return strings, end
+
+
+class W4Codec(W3Codec):
+    def __init__(self, blocklimit=128, compression=3, inlinelimit=1,
+                 compressthreads=0):
+        W3Codec.__init__(self, blocklimit=blocklimit, compression=compression,
+                         inlinelimit=inlinelimit,
+                         compressthreads=compressthreads)
+
+    def field_writer(self, storage, segment):
+        return W4FieldWriter(self, storage, segment)
+
+    # Postings
+
+    def postings_writer(self, dbfile, byteids=False, compressor=None):
+        return W4PostingsWriter(dbfile, blocklimit=self._blocklimit,
+                                byteids=byteids, compression=self._compression,
+                                inlinelimit=self._inlinelimit,
+                                compressor=compressor)
+
+    def postings_reader(self, dbfile, terminfo, format_, term=None,
+                        scorer=None):
+        if terminfo.is_inlined():
+            ids, weights, values = terminfo.inlined_postings()
+            m = ListMatcher(ids, weights, values, format_, scorer=scorer,
+                            term=term, terminfo=terminfo)
+        else:
+            offset, length = terminfo.extent()
+            m = W4LeafMatcher(dbfile, offset, length, format_, term=term,
+                              scorer=scorer)
+        return m
+
+    # Readers
+
+    def terms_reader(self, storage, segment):
+        tiname = segment.make_filename(self.TERMS_EXT)
+        tilen = storage.file_length(tiname)
+        tifile = storage.open_file(tiname)
+
+        postfile = segment.open_file(storage, self.POSTS_EXT)
+
+        return W4TermsReader(self, tifile, tilen, postfile)
+
+    def per_document_reader(self, storage, segment):
+        return W4PerDocReader(storage, segment)
+
+    # Per-document value writer
+
+    def per_document_writer(self, storage, segment):
+        return W4PerDocWriter(self, storage, segment)
+
+    # Segments and generations
+
+    def new_segment(self, storage, indexname):
+        return W4Segment(self, indexname)
+
+
+# Stored fields
+
+# The values in a stored fields block are pickled without the protocol header,
+# the STOP opcode, or any memo opcodes, so one value can be loaded by adding
+# the header and STOP back, and a run of values can be loaded at once by
+# wrapping them in the MARK and TUPLE opcodes
+_PICKLE_START = b("\x80\x02")
+_PICKLE_END = b(".")
+_PICKLE_TUPLE_START = b("\x80\x02(")
+_PICKLE_TUPLE_END = b("t.")
+
+
+def _pickle_fragment(value):
+    f = BytesIO()
+    pickler = pickle.Pickler(f, 2)
+    # Don't use the memo, so the pickle doesn't refer to anything outside
+    # itself
+    pickler.fast = True
+    pickler.dump(value)
+    return f.getvalue()[len(_PICKLE_START):-len(_PICKLE_END)]
+
+
+class StoredFieldsColumn(columns.Column):
+    """Stores the stored fields dictionaries of the documents in compressed
+    blocks of several documents each, followed by a table of the offset and
+    first document number of each block.
+
+    Each field value is pickled separately inside the block, so a reader that
+    only wants some of the fields (for example, the title to display in a
+    results list) only has to unpickle those fields, while loading all the
+    fields of a document is still a single unpickle. The reader keeps the most
+    recently decompressed blocks in a small cache, so looking up documents
+    that are close together (such as the hits on a results page, or all the
+    documents in order) only decompresses each block once.
+    """
+
+    def __init__(self, blocksize=16, blockbytes=16 * 1024, level=3,
+                 cachesize=8):
+        """
+        :param blocksize: the maximum number of documents in a block.
+        :param blockbytes: start a new block when the pickled values in the
+            current block reach this many bytes, even if it has fewer than
+            ``blocksize`` documents.
+        :param level: the zlib compression level to use.
+        :param cachesize: the number of decompressed blocks each reader keeps
+            in memory.
+        """
+
+        self._blocksize = blocksize
+        self._blockbytes = blockbytes
+        self._level = level
+        self._cachesize = cachesize
+
+    def writer(self, dbfile):
+        return self.Writer(dbfile, self._blocksize, self._blockbytes,
+                           self._level)
+
+    def reader(self, dbfile, basepos, length, doccount):
+        return self.Reader(dbfile, basepos, length, doccount, self._cachesize)
+
+    # Each block starts with a header giving the length of the pickled
+    # document list, the number of values, and the typecode of the value
+    # lengths array. The document list contains a tuple of field names for
+    # each document (or None if the document has no stored fields). It is
+    # followed by the array of the lengths of the pickled values and then the
+    # pickled values themselves.
+
+    class Writer(columns.ColumnWriter):
+        def __init__(self, dbfile, blocksize, blockbytes, level):
+            self._dbfile = dbfile
+            self._blocksize = blocksize
+            self._blockbytes = blockbytes
+            self._level = level if zlib else 0
+            self._compressor = None
+
+            self._base = dbfile.tell()
+            self._startdocs = GrowableArray(allow_longs=False)
+            self._offsets = GrowableArray()
+            self._reset()
+
+        def __repr__(self):
+            return "<StoredFields.Writer>"
+
+        def _reset(self):
+            self._startdoc = None
+            self._docs = []
+            # Use the same tuple object for documents with the same field
+            # names, so it's only pickled once per block
+            self._namesets = {}
+            self._lengths = GrowableArray(allow_longs=False)
+            self._values = []
+            self._size = 0
+
+        def set_compressor(self, compressor):
+            self._compressor = compressor
+
+        def _emit(self):
+            self._startdocs.append(self._startdoc)
+
+            docbytes = dumps(self._docs, 2)
+            lengths = self._lengths
+            data = emptybytes.join([
+                _storedhead.pack(len(docbytes), len(lengths),
+                                 lengths.typecode.encode("ascii")),
+                docbytes,
+                _array_to_bytes(lengths.array),
+            ] + self._values)
+            if self._compressor is not None and self._level:
+                self._compressor.compress(zlib.compress, data, self._level,
+                                          self._write_block)
+            else:
+                if self._level:
+                    data = zlib.compress(data, self._level)
+                self._write_block(data)
+            self._reset()
+
+        def _write_block(self, data):
+            dbfile = self._dbfile
+            self._offsets.append(dbfile.tell() - self._base)
+            dbfile.write(data)
+
+        def add(self, docnum, v):
+            docs = self._docs
+            if self._startdoc is None:
+                self._startdoc = docnum
+            # Documents without stored fields are represented by None
+            while self._startdoc + len(docs) < docnum:
+                docs.append(None)
+
+            names = tuple(sorted(v))
+            docs.append(self._namesets.setdefault(names, names))
+            for name in names:
+                vbytes = _pickle_fragment(v[name])
+                self._lengths.append(len(vbytes))
+                self._values.append(vbytes)
+                self._size += len(vbytes)
+
+            if len(docs) >= self._blocksize or self._size >= self._blockbytes:
+                self._emit()
+
+        def finish(self, doccount):
+            dbfile = self._dbfile
+            if self._docs:
+                self._emit()
+            if self._compressor is not None:
+                self._compressor.flush()
+
+            startdocs = self._startdocs
+            offsets = self._offsets
+            # Add the end of the last block to the offsets, so the length of
+            # every block is the difference between consecutive offsets
+            offsets.append(dbfile.tell() - self._base)
+            offsets.to_file(dbfile)
+            startdocs.to_file(dbfile)
+            dbfile.write(_storedfooter.pack(len(startdocs),
+                                            offsets.typecode.encode("ascii"),
+                                            startdocs.typecode.encode("ascii"),
+                                            int(bool(self._level))))
+
+    class Reader(columns.ColumnReader):
+        def __init__(self, dbfile, basepos, length, doccount, cachesize):
+            columns.ColumnReader.__init__(self, dbfile, basepos, length,
+                                          doccount)
+
+            footerpos = basepos + length - _storedfooter.size
+            footer = dbfile.get(footerpos, _storedfooter.size)
+            count, otype, stype, compressed = _storedfooter.unpack(footer)
+            otype = otype.decode("ascii")
+            stype = stype.decode("ascii")
+
+            startspos = footerpos - count * struct.calcsize(stype)
+            offspos = startspos - (count + 1) * struct.calcsize(otype)
+            dbfile.seek(offspos)
+            self._offsets = columns.read_qsafe_array(otype, count + 1, dbfile)
+            self._startdocs = columns.read_qsafe_array(stype, count, dbfile)
+            self._compressed = compressed
+            self._cache = LRUCache(maxsize=cachesize)
+
+        def __repr__(self):
+            return "<StoredFields.Reader>"
+
+        def _block(self, blocknum):
+            # Returns a tuple of the list of field name tuples for each
+            # document in the given block, the index of each document's first
+            # value, the offsets of the values, and the block data
+            block = self._cache.get(blocknum)
+            if block is None:
+                offsets = self._offsets
+                start = offsets[blocknum]
+                data = self._dbfile.get(self._basepos + start,
+                                        offsets[blocknum + 1] - start)
+                if self._compressed:
+                    data = zlib.decompress(data)
+
+                docslen, count, typecode = _storedhead.unpack_from(data, 0)
+                typecode = typecode.decode("ascii")
+                pos = _storedhead.size
+                docs = loads(data[pos:pos + docslen])
+                pos += docslen
+                end = pos + _itemsize(typecode) * count
+                lengths = _array_from_bytes(typecode, data[pos:end])
+
+                firsts = []
+                i = 0
+                for names in docs:
+                    firsts.append(i)
+                    if names:
+                        i += len(names)
+                voffsets = [end]
+                for length in lengths:
+                    end += length
+                    voffsets.append(end)
+
+                block = (docs, firsts, voffsets, data)
+                self._cache.put(blocknum, block)
+            return block
+
+        def fields(self, docnum, fieldnames=None):
+            """Returns a dictionary of the stored fields of the given document.
+            If ``fieldnames`` is not None, only the named fields are loaded.
+            """
+
+            startdocs = self._startdocs
+            blocknum = bisect_right(startdocs, docnum) - 1
+            if blocknum < 0:
+                return {}
+
+            docs, firsts, voffsets, data = self._block(blocknum)
+            i = docnum - startdocs[blocknum]
+            if i >= len(docs) or docs[i] is None:
+                return {}
+
+            names = docs[i]
+            first = firsts[i]
+            if fieldnames is None:
+                # The values of a document are next to each other, so they
+                # can be loaded all at once as a tuple
+                start = voffsets[first]
+                end = voffsets[first + len(names)]
+                values = loads(_PICKLE_TUPLE_START + data[start:end]
+                               + _PICKLE_TUPLE_END)
+                return dict(zip(names, values))
+
+            d = {}
+            for name in fieldnames:
+                if name in names:
+                    j = first + names.index(name)
+                    vbytes = data[voffsets[j]:voffsets[j + 1]]
+                    d[name] = loads(_PICKLE_START + vbytes + _PICKLE_END)
+            return d
+
+        def __getitem__(self, docnum):
+            return self.fields(docnum) or None
+
+
+# Column type to store values of stored fields
+STORED_FIELDS_COLUMN = StoredFieldsColumn()
+
+
+# Per-doc information writer
+
+class W4PerDocWriter(W3PerDocWriter):
+    _storedname = "_storedblocks"
+    _storedcolumn = STORED_FIELDS_COLUMN
+
+
+# Per-doc information reader
+
+class W4PerDocReader(W3PerDocReader):
+    def stored_fields(self, docnum, fieldnames=None):
+        reader = self._cached_reader("_storedblocks", STORED_FIELDS_COLUMN)
+        return reader.fields(docnum, fieldnames)
+
+    def vector(self, docnum, fieldname, format_):
+        if self._vpostfile is None:
+            self._prep_vectors()
+        offset, length = self._vector_extent(docnum, fieldname)
+        if not offset:
+            raise Exception("Field %r has no vector in docnum %s" %
+                            (fieldname, docnum))
+        m = W4LeafMatcher(self._vpostfile, offset, length, format_,
+                          byteids=True)
+        return m
+
+
+# Terms
+
+class W4FieldWriter(W3FieldWriter):
+    def raw_source(self, reader):
+        # Posting lists can be copied from segments written by a W4 codec
+        terms = getattr(reader, "_terms", None)
+        if isinstance(terms, W4TermsReader):
+            return terms.raw_postings
+
+    def add_raw(self, docnum, rawpostings):
+        offset = docnum - rawpostings.min_id()
+        self._postwriter.add_raw_postings(rawpostings, offset)
+
+    def _create_term_index(self, dbfile):
+        return filetables.FrontCodedWriter(dbfile)
+
+
+class W4FieldCursor(base.FieldCursor):
+    def __init__(self, tindex, fieldname, keycoder, fieldobj):
+        self._tindex = tindex
+        self._fieldname = fieldname
+        self._keycoder = keycoder
+        self._fieldobj = fieldobj
+
+        # All keys in this field start with the same two-byte field number
+        self._prefix = keycoder(fieldname, emptybytes)
+        self._items = None
+        self._text = None
+        self._valbytes = None
+        self.first()
+
+    def first(self):
+        self._items = self._tindex.items_from(self._prefix)
+        return self.next()
+
+    def find(self, term):
+        if not isinstance(term, bytes_type):
+            term = self._fieldobj.to_bytes(term)
+        key = self._keycoder(self._fieldname, term)
+        self._items = self._tindex.items_from(key)
+        return self.next()
+
+    def next(self):
+        if self._items is not None:
+            prefix = self._prefix
+            for keybytes, valbytes in self._items:
+                if keybytes.startswith(prefix):
+                    text = keybytes[len(prefix):]
+                    self._text = self._fieldobj.from_bytes(text)
+                    self._valbytes = valbytes
+                    return self._text
+                break
+
+        self._items = self._text = self._valbytes = None
+        return None
+
+    def text(self):
+        return self._text
+
+    def term_info(self):
+        if self._valbytes is None:
+            return None
+        return W3TermInfo.from_bytes(self._valbytes)
+
+    def is_valid(self):
+        return self._items is not None
+
+
+class W4TermsReader(W3TermsReader):
+    def _open_term_index(self, dbfile, length):
+        return filetables.FrontCodedReader(dbfile, length)
+
+    def cursor(self, fieldname, fieldobj):
+        return W4FieldCursor(self._tindex, fieldname, self._keycoder,
+                             fieldobj)
+
+    def frequency(self, fieldname, tbytes):
+        valbytes = self._tindex[self._keycoder(fieldname, tbytes)]
+        return W3TermInfo.from_bytes(valbytes).weight()
+
+    def doc_frequency(self, fieldname, tbytes):
+        valbytes = self._tindex[self._keycoder(fieldname, tbytes)]
+        return W3TermInfo.from_bytes(valbytes).doc_frequency()
+
+    def raw_postings(self, fieldname, tbytes):
+        """Returns a :class:`W4RawPostings` object for the encoded posting list
+        of the given term, or None if the postings are inlined in the term
+        info.
+        """
+
+        terminfo = self.term_info(fieldname, tbytes)
+        if terminfo.is_inlined():
+            return None
+        return W4RawPostings(self._postfile, terminfo)
+
+
+class W4RawPostings(base.RawPostings):
+    """The encoded posting list of a term in a W4 postings file, which
+    :meth:`W4PostingsWriter.add_raw_postings` can copy block by block into
+    another segment.
+    """
+
+    def __init__(self, postfile, terminfo):
+        base.RawPostings.__init__(self, terminfo)
+        self._postfile = postfile
+
+    def blocks(self):
+        """Yields a ``(header, databytes)`` tuple for each block in the posting
+        list, where ``header`` is a tuple of the block header fields (not
+        including the data length).
+        """
+
+        postfile = self._postfile
+        offset, length = self.terminfo.extent()
+
+        pos = offset + 4
+        while True:
+            header = _blockheader.unpack(postfile.get(pos, _blockheader.size))
+            datalength = header[0]
+            pos += _blockheader.size
+            databytes = postfile.get(pos, abs(datalength))
+            pos += abs(datalength)
+            yield header[1:], databytes
+            if datalength < 0:
+                break
+
+
+# Postings
+
+class W4PostingsWriter(W3PostingsWriter):
+    """Writes posting lists in the W4 block format. The buffering and block
+    statistics are inherited from
+    :class:`whoosh.codec.whoosh3.W3PostingsWriter`, only the encoding of the
+    blocks is different.
+
+    If the writer has a :class:`whoosh.util.compression.ParallelCompressor`,
+    blocks are written by its callbacks, so the skip table of a posting list
+    is built by the callbacks as well.
+    """
+
+    def start_postings(self, format_, terminfo):
+        W3PostingsWriter.start_postings(self, format_, terminfo)
+        # A block copied by add_raw_postings() that hasn't been written yet,
+        # because we don't know yet whether it's the last block
+        self._pending = None
+
+    def written(self):
+        return self._blockcount > 0 or self._pending is not None
+
+    def add_raw_postings(self, raw, offset):
+        """Copies the blocks of a posting list written by another W4 writer
+        (see :class:`W4RawPostings`) into the current posting list, adding
+        ``offset`` to their IDs. The block data is copied as it is, only the
+        block headers are rewritten.
+        """
+
+        # Write out any buffered postings first
+        if self._ids:
+            self._write_block()
+
+        for header, databytes in raw.blocks():
+            if self._pending is not None:
+                self._write_pending()
+            (count, lastid, maxweight, comp, mnlen, mxlen, idcode, weightcode,
+             idoffset) = header
+            self._pending = ((count, lastid + offset, maxweight, comp, mnlen,
+                              mxlen, idcode, weightcode, idoffset + offset),
+                             databytes)
+
+        self._terminfo.add_terminfo(raw.terminfo, offset)
+
+    def finish_postings(self):
+        if self._pending is not None and not self._ids:
+            # The last copied block is the last block of the posting list
+            self._write_pending(last=True)
+        return W3PostingsWriter.finish_postings(self)
+
+    def _write_pending(self, last=False):
+        header, databytes = self._pending
+        self._pending = None
+        self._write_data(header, databytes, last, 0)
+
+    def _write_block(self, last=False):
+        # Write the buffered block to the postings file
+
+        # A copied block waiting to be written comes before this one
+        if self._pending is not None:
+            self._write_pending()
+
+        # Add this block's statistics to the terminfo object
+        self._terminfo.add_block(self)
+
+        ids = self._ids
+        if self._byteids:
+            idcode = _BYTE_IDS
+            lastid = 0
+            idbytes = _encode_strings(ids)
+        else:
+            idcode, idbytes = _encode_ids(ids)
+            lastid = ids[-1]
+        weightcode, weightbytes = self._encode_weights()
+        databytes = idbytes + weightbytes + self._encode_values()
+
+        # If the data is less than 20 bytes, don't bother compressing
+        comp = self._compression if len(databytes) >= 20 else 0
+
+        header = (len(ids), lastid, self._maxweight, comp,
+                  length_to_byte(self._minlength),
+                  length_to_byte(self._maxlength), idcode, weightcode, 0)
+        self._write_data(header, databytes, last, comp)
+        # Reset block buffer
+        self._new_block()
+
+    def _write_data(self, header, databytes, last, comp):
+        # Writes a block with the given header fields (not including the data
+        # length) and data to the postings file, compressing the data first if
+        # comp is not 0
+
+        first = not self._blockcount
+        self._blockcount += 1
+        # This is called with last=True from finish_postings(), so write the
+        # skip table after the last block, where the reader can find it from
+        # the end of the posting list's extent
+        skiptable = last and self._blockcount > 1 and not self._byteids
+
+        compressor = self._compressor
+        if compressor is not None and comp:
+            compressor.compress(zlib.compress, databytes, comp,
+                                self._write_block_data, header, first, last,
+                                skiptable)
+        elif compressor is not None:
+            compressor.call(self._write_block_data, header, first, last,
+                            skiptable, databytes)
+        else:
+            if comp:
+                databytes = zlib.compress(databytes, comp)
+            self._write_block_data(header, first, last, skiptable, databytes)
+
+    def _write_block_data(self, header, first, last, skiptable, databytes):
+        postfile = self._postfile
+
+        # If this is the first block, write a small header first
+        if first:
+            postfile.write(WHOOSH4_HEADER_MAGIC)
+            self._blockbase = postfile.tell()
+            self._skipids = array("I")
+            self._skipoffsets = array("I")
+
+        datalength = len(databytes)
+        if last:
+            # If this is the last block, use a negative number
+            datalength *= -1
+        # Remember the block's entry in the skip table
+        self._skipids.append(header[1])
+        self._skipoffsets.append(postfile.tell() - self._blockbase)
+        postfile.write(_blockheader.pack(datalength, *header))
+        postfile.write(databytes)
+
+        if skiptable:
+            postfile.write(_array_to_bytes(self._skipids) +
+                           _array_to_bytes(self._skipoffsets) +
+                           _skipcount.pack(len(self._skipids)))
+
+    def _encode_weights(self):
+        weights = self._weights
+
+        if all(w == 1.0 for w in weights):
+            return _ALL_ONES, emptybytes
+        elif all(w == weights[0] for w in weights):
+            return _ALL_SAME, _float_struct.pack(weights[0])
+        else:
+            return _FLOATS, _array_to_bytes(weights)
+
+    def _encode_values(self):
+        fixedsize = self._format.fixed_value_size()
+        values = self._values
+
+        if fixedsize is None or fixedsize < 0:
+            return _encode_strings(values)
+        elif fixedsize == 0:
+            return emptybytes
+        else:
+            return emptybytes.join(values)
+
+
+class W4LeafMatcher(W3LeafMatcher):
+    """Reads on-disk postings written by :class:`W4PostingsWriter` and
+    presents the :class:`whoosh.matching.Matcher` interface.
+    """
+
+    def _read_header(self):
+        # Check the header tag at the start of the postings
+        magic = self._postfile.get(self._startoffset, 4)
+        if magic != WHOOSH4_HEADER_MAGIC:
+            raise Exception("Block tag error %r" % magic)
+
+        # Remember the base offset (start of postings, after the header)
+        self._baseoffset = self._startoffset + 4
+        # The skip table is loaded the first time it's needed
+        self._skipids = None
+        self._skipoffsets = None
+
+    def _goto(self, position):
+        # Read the posting block header at the given position
+
+        # Reset block data -- we'll lazy load the data from the new block as
+        # needed
+        self._blockpos = position
+        self._entry = None
+        self._data = None
+        self._ids = None
+        self._weights = None
+        self._values = None
+        # Reset pointer into the block
+        self._i = 0
+
+        header = self._postfile.view(position, _blockheader.size)
+        (datalength, self._blocklength, self._maxid, self._maxweight,
+         self._compression, mnlen, mxlen, self._idcode,
+         self._weightcode, self._idoffset) = _blockheader.unpack(header)
+
+        # If the data length is negative, that means this is the last block
+        if datalength < 0:
+            self._lastblock = True
+            datalength *= -1
+
+        # Remember the offsets of the block data and the next block
+        self._dataoffset = position + _blockheader.size
+        self._nextoffset = self._dataoffset + datalength
+        # Offset of the weights in the block data, set when the IDs are decoded
+        self._weightsoffset = None
+
+        self._minlength = byte_to_length(mnlen)
+        self._maxlength = byte_to_length(mxlen)
+
+    def block_max_id(self):
+        if self._idcode == _BYTE_IDS:
+            # The header doesn't store byte IDs, so get it from the data
+            if self._ids is None:
+                self._read_ids()
+            return self._ids[-1]
+        return self._maxid
+
+    def _read_skips(self):
+        # Load the skip table from the end of the posting list
+        postfile = self._postfile
+        end = self._startoffset + self._length - _skipcount.size
+        count = _skipcount.unpack(postfile.view(end, _skipcount.size))[0]
+        size = _itemsize("I") * count
+        start = end - size * 2
+        self._skipids = _array_from_bytes("I", postfile.view(start, size))
+        self._skipoffsets = _array_from_bytes("I", postfile.view(start + size,
+                                                                size))
+
+    def _skip_to_id(self, targetid):
+        # Go directly to the block that would contain the target ID
+
+        if self._lastblock:
+            # There are no more blocks (a single-block posting list doesn't
+            # have a skip table)
+            self._atend = True
+            return
+
+        if self._skipids is None:
+            self._read_skips()
+        i = bisect_left(self._skipids, targetid)
+        if i == len(self._skipids):
+            self._atend = True
+        else:
+            self._goto(self._baseoffset + self._skipoffsets[i])
+
+    def skip_to(self, targetid):
+        # Skip to the next ID equal to or greater than the given target ID
+
+        if self._byteids:
+            # Vector postings don't have a skip table (their IDs are strings)
+            return W3LeafMatcher.skip_to(self, targetid)
+
+        if not self.is_active():
+            raise ReadTooFar
+
+        # If we're already at or past target ID, do nothing
+        if targetid <= self.id():
+            return
+
+        # Jump to the block that would contain the target ID
+        if targetid > self._maxid:
+            self._skip_to_id(targetid)
+
+        # The target is now in the current block, so find it in the block's
+        # IDs
+        if self.is_active():
+            if self._ids is None:
+                self._read_ids()
+            self._i = bisect_left(self._ids, targetid, self._i)
+
+    def _read_data(self):
+        cache = self._blockcache
+        if cache is None:
+            self._data = self._load_data()
+            return
+
+        # The cache holds a list of the block data and the decoded IDs,
+        # weights, and values, which are filled in as matchers decode them
+        key = self._cachekey + (self._blockpos,)
+        entry = cache.get(key)
+        if entry is None:
+            # Copy the data so the cache doesn't keep the memory map open
+            entry = [bytes_type(self._load_data()), None, None, None]
+            cache.put(key, entry)
+        self._entry = entry
+        self._data = entry[0]
+
+    def _load_data(self):
+        # Load the block data from disk. If the postings file is memory-mapped
+        # this is a view of the map, so uncompressed blocks are decoded in
+        # place without copying them
+        datalen = self._nextoffset - self._dataoffset
+        data = self._postfile.view(self._dataoffset, datalen)
+
+        # Decompress the data if necessary
+        if self._compression:
+            data = zlib.decompress(data)
+        return data
+
+    def _read_ids(self):
+        # If we haven't loaded the data from disk yet, load it now
+        if self._data is None:
+            self._read_data()
+
+        entry = self._entry
+        if entry is not None and entry[1] is not None:
+            self._ids, self._weightsoffset = entry[1]
+            return
+
+        if self._idcode == _BYTE_IDS:
+            ids, end = _decode_strings(self._data, 0, self._blocklength)
+            self._ids = [bs.decode("utf8") for bs in ids]
+        else:
+            self._ids, end = _decode_ids(self._idcode, self._data,
+                                         self._blocklength, self._idoffset)
+        self._weightsoffset = end
+        if entry is not None:
+            entry[1] = (self._ids, end)
+
+    def _values_offset(self):
+        # Returns the offset of the values in the block data
+        if self._weightsoffset is None:
+            self._read_ids()
+
+        code = self._weightcode
+        if code == _ALL_ONES:
+            return self._weightsoffset
+        elif code == _ALL_SAME:
+            return self._weightsoffset + _float_struct.size
+        else:
+            return self._weightsoffset + _itemsize("f") * self._blocklength
+
+    def _read_weights(self):
+        if self._data is None:
+            self._read_data()
+        if self._weightsoffset is None:
+            self._read_ids()
+
+        entry = self._entry
+        if entry is not None and entry[2] is not None:
+            self._weights = entry[2]
+            return
+
+        code = self._weightcode
+        postcount = self._blocklength
+        offset = self._weightsoffset
+        if code == _ALL_ONES:
+            self._weights = array("f", (1.0,)) * postcount
+        elif code == _ALL_SAME:
+            weight = _float_struct.unpack_from(self._data, offset)[0]
+            self._weights = array("f", (weight,)) * postcount
+        else:
+            end = offset + _itemsize("f") * postcount
+            self._weights = _array_from_bytes("f", self._data[offset:end])
+        if entry is not None:
+            entry[2] = self._weights
+
+    def _read_values(self):
+        if self._data is None:
+            self._read_data()
+
+        fixedsize = self._fixedsize
+        postcount = self._blocklength
+        if fixedsize == 0:
+            self._values = (None,) * postcount
+            return
+
+        entry = self._entry
+        if entry is not None and entry[3] is not None:
+            self._values = entry[3]
+            return
+
+        data = self._data
+        offset = self._values_offset()
+        if fixedsize is None or fixedsize < 0:
+            self._values, _ = _decode_strings(data, offset, postcount)
+        else:
+            end = offset + fixedsize * postcount
+            self._values = tuple(bytes_type(data[i:i + fixedsize]) for i
+                                 in xrange(offset, end, fixedsize))
+        if entry is not None:
+            entry[3] = self._values
+
+
+# Segment implementation
+
+class W4Segment(W3Segment):
+    """Keeps the segment's deleted document numbers in a
+    :class:`whoosh.idsets.BitSet` instead of a ``set``, and saves them to a
+    separate file (named with the segment ID and the index generation, for
+    example ``MAIN_xxx.3.del``) instead of pickling them into the TOC. Only the
+    generation of the file and the number of deletions are pickled, so the TOC
+    stays small and committing doesn't get slower as deletions pile up.
+    """
+
+    def __init__(self, codec, indexname, doccount=0, segid=None, deleted=None):
+        W3Segment.__init__(self, codec, indexname, doccount=doccount,
+                           segid=segid)
+        # Generation of the deletions file, or None if there isn't one
+        self._delgen = None
+        self._delcount = 0
+        # Whether the deletions changed since they were last saved
+        self._dirty = False
+        if deleted:
+            self._deleted = BitSet(deleted)
+            self._delcount = len(self._deleted)
+            self._dirty = True
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if not self._dirty:
+            # The deletions are in the file for _delgen, so don't pickle them
+            state["_deleted"] = None
+        return state
+
+    def _deletions_filename(self, generation):
+        return self.make_filename(".%d%s" % (generation, self.DELETIONS_EXT))
+
+    def deletions_filename(self):
+        if self._delgen is None:
+            return None
+        return self._deletions_filename(self._delgen)
+
+    def save_deletions(self, storage, generation):
+        if not self._dirty:
+            return
+
+        if self._delcount:
+            f = storage.create_file(self._deletions_filename(generation))
+            self._deleted.to_disk(f)
+            f.close()
+            self._delgen = generation
+        else:
+            self._delgen = None
+        self._dirty = False
+
+    def open_deletions(self, storage):
+        if self._deleted is not None or self._delgen is None:
+            return
+
+        # Read the whole bit array at once, so the segment doesn't depend on
+        # the file still existing after a later commit cleans it up
+        f = storage.open_file(self.deletions_filename())
+        self._deleted = BitSet.from_bytes(f.read())
+        f.close()
+
+    def deleted_count(self):
+        return self._delcount
+
+    def deleted_docs(self):
+        if not self._delcount:
+            return ()
+        return iter(self._deleted)
+
+    def delete_document(self, docnum, delete=True):
+        deleted = self._deleted
+        if delete:
+            if deleted is None:
+                deleted = self._deleted = BitSet()
+            if docnum not in deleted:
+                deleted.add(docnum)
+                self._delcount += 1
+                self._dirty = True
+                self._deletions_changed()
+        elif deleted is not None and docnum in deleted:
+            deleted.discard(docnum)
+            self._delcount -= 1
+            self._dirty = True
+            self._deletions_changed()
+
+    def is_deleted(self, docnum):
+        if not self._delcount:
+            return False
+        return docnum in self._deleted
+
+
+# Migration
+
+def MIGRATE(writer, segments):
+    """Merge policy that rewrites every segment that was not written with a
+    :class:`W4Codec` into the writer's new segment, and leaves W4 segments
+    alone. Use this with a writer created with a W4 codec.
+    """
+
+    from whoosh.reading import SegmentReader
+
+    unchanged = []
+    for seg in segments:
+        if isinstance(seg.codec(), W4Codec):
+            unchanged.append(seg)
+        else:
+            reader = SegmentReader(writer.storage, writer.schema, seg)
+            writer.add_reader(reader)
+            reader.close()
+    return unchanged
+
+
+def migrate(ix, codec=None, **writerargs):
+    """Rewrites any segments in the given index that were written by an older
+    codec using the W4 block format::
+
+        from whoosh.codec.whoosh4 import migrate
+        migrate(myindex)
+
+    :param ix: the :class:`whoosh.index.Index` to migrate.
+    :param codec: the :class:`W4Codec` object to use to write the new segment.
+        If this is None, the function uses ``W4Codec()``.
+    """
+
+    codec = codec or W4Codec()
+    writer = ix.writer(codec=codec, **writerargs)
+    writer.commit(mergetype=MIGRATE)
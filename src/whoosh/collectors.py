@@ -73,6 +73,12 @@ method uses many of these when you specify various parameters.
 
 NOTE: collectors are not designed to be reentrant or thread-safe. It is
 generally a good idea to create a new collector for each search.
+
+A searcher with an ``executor`` (see :class:`whoosh.searching.Searcher`)
+searches segments concurrently if its collector supports it. It runs a
+:meth:`Collector.copy` of the collector on each segment, and then gives the
+:meth:`Collector.state` of each copy to :meth:`Collector.merge_state` on the
+original collector.
 """
 
 import os
@@ -283,6 +289,39 @@ class Collector(object):
         else:
             return self.matcher.all_ids()
 
+    def can_merge(self):
+        """Returns True if this collector supports searching segments
+        concurrently, using the :meth:`Collector.copy`,
+        :meth:`Collector.state`, and :meth:`Collector.merge_state` methods.
+        The default implementation returns False.
+        """
+
+        return False
+
+    def copy(self):
+        """Returns a new, unprepared collector with the same settings as this
+        one, to collect the matches in one segment for a concurrent search.
+        This is called after this collector is prepared.
+        """
+
+        raise NotImplementedError
+
+    def state(self):
+        """Returns a (picklable) object containing what this collector
+        collected, which can be passed to :meth:`Collector.merge_state` on
+        another collector of the same type.
+        """
+
+        raise NotImplementedError
+
+    def merge_state(self, state):
+        """Adds what a copy of this collector collected in another segment
+        (the return value of the copy's :meth:`Collector.state` method) to this
+        collector. The states of the segments are merged in segment order.
+        """
+
+        raise NotImplementedError
+
     def finish(self):
         """This method is called after a search.
 
@@ -424,24 +463,46 @@ class TopCollector(ScoredCollector):
     """A collector that only returns the top "N" scored results.
     """
 
-    def __init__(self, limit=10, usequality=True, **kwargs):
+    def __init__(self, limit=10, usequality=True, after=None, **kwargs):
         """
         :param limit: the maximum number of results to return.
         :param usequality: whether to use block-quality optimizations. This may
             be useful for debugging.
+        :param after: an optional ``(score, docnum)`` tuple. If given, the
+            collector ignores documents ranked at or above this position, and
+            returns the top N documents after it. See
+            :meth:`whoosh.searching.Searcher.search_after`.
         """
 
         ScoredCollector.__init__(self, **kwargs)
         self.limit = limit
         self.usequality = usequality
+        self.after = after
         self.total = 0
 
+    def prepare(self, top_searcher, q, context):
+        ScoredCollector.prepare(self, top_searcher, q, context)
+        self.total = 0
+        # The cursor in the same (score, negated docnum) form as the heap items
+        if self.after is not None:
+            score, docnum = self.after
+            self._after = (score, 0 - docnum)
+        else:
+            self._after = None
+        # Number of documents ignored because they rank at or above the cursor
+        self.preceding = 0
+        # Whether the counts merged from concurrently searched segments are
+        # all exact, or None if nothing was merged
+        self._exactcount = None
+
     def _use_block_quality(self):
         return (self.usequality
                 and not self.top_searcher.weighting.use_final
                 and self.matcher.supports_block_quality())
 
     def computes_count(self):
+        if self._exactcount is not None:
+            return self._exactcount
         return not self._use_block_quality()
 
     def all_ids(self):
@@ -462,6 +523,12 @@ class TopCollector(ScoredCollector):
         items = self.items
         self.total += 1
 
+        after = self._after
+        if after is not None and (score, 0 - global_docnum) >= after:
+            # The document comes before the cursor
+            self.preceding += 1
+            return 0
+
         # Document numbers are negated before putting them in the heap so that
         # higher document numbers have lower "priority" in the queue. Lower
         # document numbers should always come before higher document numbers
@@ -495,6 +562,29 @@ class TopCollector(ScoredCollector):
                 self.minscore = items[0][0] if items else 0
                 return
 
+    def can_merge(self):
+        return True
+
+    def copy(self):
+        return self.__class__(self.limit, usequality=self.usequality,
+                              after=self.after, replace=self.replace)
+
+    def state(self):
+        return self.items, self.total, self.computes_count(), self.preceding
+
+    def merge_state(self, state):
+        items, total, exact, preceding = state
+        heap = self.items
+        limit = self.limit
+        for item in items:
+            if len(heap) < limit:
+                heappush(heap, item)
+            elif item > heap[0]:
+                heapreplace(heap, item)
+        self.total += total
+        self._exactcount = exact and self._exactcount is not False
+        self.preceding += preceding
+
     def results(self):
         # The items are stored (postive score, negative docnum) so the heap
         # keeps the highest scores and lowest docnums, in order from lowest to
@@ -504,7 +594,9 @@ class TopCollector(ScoredCollector):
         items.sort(reverse=True)
         # De-negate the docnums for presentation to the user
         items = [(score, 0 - docnum) for score, docnum in items]
-        return self._results(items)
+        r = self._results(items)
+        r.offset = self.preceding
+        return r
 
 
 class UnlimitedCollector(ScoredCollector):
@@ -522,6 +614,20 @@ class UnlimitedCollector(ScoredCollector):
         # Negate score to act as sort key so higher scores appear first
         return 0 - score
 
+    def can_merge(self):
+        return True
+
+    def copy(self):
+        return self.__class__(reverse=self.reverse)
+
+    def state(self):
+        return self.items, self.docset
+
+    def merge_state(self, state):
+        items, docset = state
+        self.items.extend(items)
+        self.docset.update(docset)
+
     def results(self):
         # Sort by negated scores so that higher scores go first, then by
         # document number to keep the order stable when documents have the
@@ -536,19 +642,28 @@ class SortingCollector(Collector):
     """A collector that returns results sorted by a given
     :class:`whoosh.sorting.Facet` object. See :doc:`/facets` for more
     information.
+
+    If the collector has a limit and the sort categorizer can bound the keys
+    of runs of documents (for example, a numeric column with a zone map), the
+    collector skips runs of documents that can't make it into the top N.
     """
 
-    def __init__(self, sortedby, limit=10, reverse=False):
+    def __init__(self, sortedby, limit=10, reverse=False, after=None):
         """
         :param sortedby: see :doc:`/facets`.
         :param reverse: If True, reverse the overall results. Note that you
             can reverse individual facets in a multi-facet sort key as well.
+        :param after: an optional ``(sortkey, docnum)`` tuple. If given, the
+            collector ignores documents sorted at or before this position, and
+            returns the first N documents after it. See
+            :meth:`whoosh.searching.Searcher.search_after`.
         """
 
         Collector.__init__(self)
         self.sortfacet = sorting.MultiFacet.from_sortedby(sortedby)
         self.limit = limit
         self.reverse = reverse
+        self.after = after
 
     def prepare(self, top_searcher, q, context):
         self.categorizer = self.sortfacet.categorizer(top_searcher)
@@ -559,27 +674,134 @@ class SortingCollector(Collector):
 
         # List of (sortkey, docnum) pairs
         self.items = []
+        # Sorted list of the best N keys collected so far
+        self.topkeys = []
+        # Number of runs of documents skipped using the categorizer's key
+        # ranges (for debugging)
+        self.skipped_times = 0
+        # Number of documents ignored because they sort at or before the
+        # cursor
+        self.preceding = 0
 
     def set_subsearcher(self, subsearcher, offset):
         Collector.set_subsearcher(self, subsearcher, offset)
         self.categorizer.set_searcher(subsearcher, offset)
 
+    def computes_count(self):
+        return not self.skipped_times
+
+    def all_ids(self):
+        # If the collector skipped documents, re-run the search using
+        # docs_for_query to get all matched docs
+        if self.computes_count():
+            return self.docset
+        return self.top_searcher.docs_for_query(self.q)
+
+    def count(self):
+        if self.computes_count():
+            return len(self.docset)
+        else:
+            return ilen(self.all_ids())
+
+    def collect_matches(self):
+        matcher = self.matcher
+        key_range = self.categorizer.key_range
+        if (not self.limit or not matcher.is_active()
+                or key_range(matcher.id()) is None):
+            return Collector.collect_matches(self)
+
+        collect = self.collect
+        limit = self.limit
+        reverse = self.reverse
+        topkeys = self.topkeys
+        after = self.after
+        offset = self.offset
+        while matcher.is_active():
+            sub_docnum = matcher.id()
+            if len(topkeys) >= limit:
+                # If none of the documents in the categorizer's next run can
+                # beat the worst key in the top N, skip the run
+                keyrange = key_range(sub_docnum)
+                if keyrange is not None:
+                    enddoc, minkey, maxkey = keyrange
+                    if reverse:
+                        skip = maxkey < topkeys[0]
+                    else:
+                        skip = minkey > topkeys[-1]
+                    if skip:
+                        self.skipped_times += 1
+                        matcher.skip_to(enddoc)
+                        continue
+
+            sortkey = collect(sub_docnum)
+            if after is not None and self._precedes(sortkey,
+                                                    offset + sub_docnum):
+                # The document isn't a candidate for the top N
+                matcher.next()
+                continue
+            if len(topkeys) < limit:
+                insort(topkeys, sortkey)
+            elif reverse and sortkey > topkeys[0]:
+                insort(topkeys, sortkey)
+                topkeys.pop(0)
+            elif not reverse and sortkey < topkeys[-1]:
+                insort(topkeys, sortkey)
+                topkeys.pop()
+            matcher.next()
+
     def sort_key(self, sub_docnum):
         return self.categorizer.key_for(self.matcher, sub_docnum)
 
+    def _precedes(self, sortkey, global_docnum):
+        # Returns True if the given document sorts at or before the cursor
+        if self.reverse:
+            return (sortkey, global_docnum) >= self.after
+        else:
+            return (sortkey, global_docnum) <= self.after
+
     def collect(self, sub_docnum):
         global_docnum = self.offset + sub_docnum
         sortkey = self.sort_key(sub_docnum)
-        self.items.append((sortkey, global_docnum))
         self.docset.add(global_docnum)
+        if self.after is not None and self._precedes(sortkey, global_docnum):
+            self.preceding += 1
+        else:
+            self.items.append((sortkey, global_docnum))
         return sortkey
 
+    def can_merge(self):
+        return True
+
+    def copy(self):
+        c = self.__class__((), limit=self.limit, reverse=self.reverse,
+                           after=self.after)
+        c.sortfacet = self.sortfacet
+        return c
+
+    def state(self):
+        items = self.items
+        if self.limit:
+            # Only the top N of each segment can make the overall top N
+            items.sort(reverse=self.reverse)
+            items = items[:self.limit]
+        return items, self.docset, self.skipped_times, self.preceding
+
+    def merge_state(self, state):
+        items, docset, skipped_times, preceding = state
+        self.items.extend(items)
+        self.docset.update(docset)
+        self.skipped_times += skipped_times
+        self.preceding += preceding
+
     def results(self):
         items = self.items
         items.sort(reverse=self.reverse)
         if self.limit:
             items = items[:self.limit]
-        return self._results(items, docset=self.docset)
+        docset = self.docset if self.computes_count() else None
+        r = self._results(items, docset=docset)
+        r.offset = self.preceding
+        return r
 
 
 class UnsortedCollector(Collector):
@@ -592,6 +814,20 @@ class UnsortedCollector(Collector):
         self.items.append((None, global_docnum))
         self.docset.add(global_docnum)
 
+    def can_merge(self):
+        return True
+
+    def copy(self):
+        return self.__class__()
+
+    def state(self):
+        return self.items, self.docset
+
+    def merge_state(self, state):
+        items, docset = state
+        self.items.extend(items)
+        self.docset.update(docset)
+
     def results(self):
         items = self.items
         return self._results(items, docset=self.docset)
@@ -645,6 +881,16 @@ class WrappingCollector(Collector):
     def matches(self):
         return self.child.matches()
 
+    def can_merge(self):
+        # A wrapping collector usually keeps some state of its own, so it can
+        # only be used in a concurrent search if its class knows how to copy
+        # and merge it. Otherwise the search runs serially
+        cls = type(self)
+        for name in ("copy", "state", "merge_state"):
+            if getattr(cls, name) == getattr(Collector, name):
+                return False
+        return self.child.can_merge()
+
     def finish(self):
         self.child.finish()
 
@@ -747,6 +993,21 @@ class FilterCollector(WrappingCollector):
             # just forward the call to the child collector
             child.collect_matches()
 
+    def copy(self):
+        # Give the copy the sets this collector already made from the allow
+        # and restrict objects, so they aren't computed again for every
+        # segment
+        return self.__class__(self.child.copy(), allow=self._allow,
+                              restrict=self._restrict)
+
+    def state(self):
+        return self.child.state(), self.filtered_count
+
+    def merge_state(self, state):
+        childstate, filtered_count = state
+        self.child.merge_state(childstate)
+        self.filtered_count += filtered_count
+
     def results(self):
         r = self.child.results()
         r.collector = self
@@ -839,6 +1100,25 @@ class FacetCollector(WrappingCollector):
 
         return sortkey
 
+    def can_merge(self):
+        # Custom facet map types might not know how to merge
+        return (self.child.can_merge() and
+                all(type(fm).merge != sorting.FacetMap.merge
+                    for fm in itervalues(self.facetmaps)))
+
+    def copy(self):
+        return self.__class__(self.child.copy(), self.facets,
+                              maptype=self.maptype)
+
+    def state(self):
+        return self.child.state(), self.facetmaps
+
+    def merge_state(self, state):
+        childstate, facetmaps = state
+        self.child.merge_state(childstate)
+        for name, facetmap in iteritems(facetmaps):
+            self.facetmaps[name].merge(facetmap)
+
     def results(self):
         r = self.child.results()
         r._facetmaps = self.facetmaps
@@ -947,6 +1227,10 @@ class CollapseCollector(WrappingCollector):
         else:
             return ilen(self.all_ids())
 
+    def can_merge(self):
+        # Collapsing may remove documents collected in earlier segments
+        return False
+
     def collect_matches(self):
         lists = self.lists
         limit = self.limit
@@ -1074,6 +1358,10 @@ class TimeLimitCollector(WrappingCollector):
     def _was_signaled(self, signum, frame):
         raise TimeLimit
 
+    def can_merge(self):
+        # The time limit is enforced in the searching thread
+        return False
+
     def collect_matches(self):
         child = self.child
         greedy = self.greedy
@@ -1158,8 +1446,32 @@ class TermsCollector(WrappingCollector):
                 termdocs[term].append(global_docnum)
                 docterms[global_docnum].append(term)
 
+    def copy(self):
+        return self.__class__(self.child.copy(), settype=self.settype)
+
+    def state(self):
+        return self.child.state(), dict(self.termdocs), dict(self.docterms)
+
+    def merge_state(self, state):
+        childstate, termdocs, docterms = state
+        self.child.merge_state(childstate)
+        for term, docnums in iteritems(termdocs):
+            self.termdocs[term].extend(docnums)
+        self.docterms.update(docterms)
+
     def results(self):
         r = self.child.results()
-        r.termdocs = dict(self.termdocs)
-        r.docterms = dict(self.docterms)
+        # Only report the terms of the documents in the results. Which other
+        # documents got collected depends on how many the matcher skipped,
+        # which differs between searching the segments one after another and
+        # searching them concurrently
+        docnums = set(docnum for _, docnum in r.top_n)
+        termdocs = {}
+        for term, docs in iteritems(self.termdocs):
+            docs = array("I", (docnum for docnum in docs if docnum in docnums))
+            if docs:
+                termdocs[term] = docs
+        r.termdocs = termdocs
+        r.docterms = dict((docnum, terms) for docnum, terms
+                          in iteritems(self.docterms) if docnum in docnums)
         return r
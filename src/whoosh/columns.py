@@ -57,17 +57,21 @@ except ImportError:
     zlib = None
 
 from whoosh.compat import b, bytes_type, BytesIO
-from whoosh.compat import array_tobytes, xrange
+from whoosh.compat import array_frombytes, array_tobytes, xrange
 from whoosh.compat import dumps, loads
 from whoosh.filedb.structfile import StructFile
 from whoosh.idsets import BitSet, OnDiskBitSet
-from whoosh.system import emptybytes
+from whoosh.system import emptybytes, IS_LITTLE
 from whoosh.util.cache import lru_cache
 from whoosh.util.numeric import typecode_max, typecode_min
 from whoosh.util.numlists import GrowableArray
 from whoosh.util.varints import varint, read_varint
 
 
+# Footer of a fixed-length column's zone map: zone size, number of zones
+_zonetail = struct.Struct("!II")
+
+
 # Utility functions
 
 def _mintype(maxn):
@@ -187,6 +191,14 @@ class ColumnWriter(object):
     def add(self, docnum, value):
         raise NotImplementedError
 
+    def set_compressor(self, compressor):
+        """Gives this writer a
+        :class:`whoosh.util.compression.ParallelCompressor` to compress values
+        with, if it compresses values. The default implementation ignores it.
+        """
+
+        pass
+
     def finish(self, docnum):
         pass
 
@@ -211,6 +223,33 @@ class ColumnReader(object):
         for i in xrange(self._doccount):
             yield self[i]
 
+    def read_range(self, start, end):
+        """Returns a sequence of the values for documents ``start`` up to but
+        not including ``end``. Readers that can decode a run of values at once
+        override this to avoid the overhead of calling ``__getitem__`` for
+        every document.
+        """
+
+        end = min(end, len(self))
+        return [self[i] for i in xrange(start, end)]
+
+    def zone_size(self):
+        """Returns the number of documents in each "zone" of this column, or 0
+        if the column doesn't keep a zone map. See :meth:`ColumnReader.zone`.
+        """
+
+        return 0
+
+    def zone(self, zonenum):
+        """Returns a ``(minvalue, maxvalue)`` tuple bounding the values of the
+        documents in the given zone (the documents from
+        ``zonenum * zone_size()`` up to ``(zonenum + 1) * zone_size()``). This
+        lets callers skip whole runs of documents that can't match a range
+        without reading their values.
+        """
+
+        raise NotImplementedError
+
     def load(self):
         return list(self)
 
@@ -415,6 +454,64 @@ class FixedBytesColumn(Column):
             self._dbfile.write(v)
             self._count = docnum + 1
 
+        # Subclasses that keep a zone map set _zonesize to the number of
+        # documents in each zone, call _add_to_zone() with each value they
+        # write, and implement _pack_value()
+
+        _zonesize = 0
+
+        def _add_to_zone(self, docnum, v):
+            # Updates the [min, max, count] of the zone containing docnum
+            zonenum = docnum // self._zonesize
+            zones = self._zones
+            if zonenum >= len(zones):
+                zones.extend([None] * (zonenum + 1 - len(zones)))
+            zone = zones[zonenum]
+            if zone is None:
+                zones[zonenum] = [v, v, 1]
+            else:
+                if v < zone[0]:
+                    zone[0] = v
+                elif v > zone[1]:
+                    zone[1] = v
+                zone[2] += 1
+
+        def finish(self, doccount):
+            if self._zonesize:
+                self._write_zones(doccount)
+
+        def _write_zones(self, doccount):
+            # Writes the zone map after the values: the packed minimum of each
+            # zone, the packed maximum of each zone, then the zone size and
+            # number of zones
+            zonesize = self._zonesize
+            zones = self._zones
+            default = self._default
+            pack = self._pack_value
+
+            zonecount = (doccount + zonesize - 1) // zonesize
+            mins = []
+            maxes = []
+            for zonenum in xrange(zonecount):
+                zone = zones[zonenum] if zonenum < len(zones) else None
+                size = min(zonesize, doccount - zonenum * zonesize)
+                if zone is None:
+                    lo = hi = default
+                else:
+                    lo, hi, count = zone
+                    # If some documents in the zone weren't given a value,
+                    # they have the default
+                    if count < size:
+                        lo = min(lo, default)
+                        hi = max(hi, default)
+                mins.append(pack(lo))
+                maxes.append(pack(hi))
+
+            dbfile = self._dbfile
+            dbfile.write(emptybytes.join(mins))
+            dbfile.write(emptybytes.join(maxes))
+            dbfile.write(_zonetail.pack(zonesize, zonecount))
+
     class Reader(ColumnReader):
         def __init__(self, dbfile, basepos, length, doccount, fixedlen,
                      default):
@@ -425,6 +522,39 @@ class FixedBytesColumn(Column):
             self._default = self._defaultbytes = default
             self._count = length // fixedlen
 
+        _zonesize = 0
+        _zones = None
+
+        def _read_zone_tail(self, length):
+            # Reads the zone map header from the end of the column and returns
+            # the length of the values
+            tailpos = self._basepos + length - _zonetail.size
+            zonesize, zonecount = _zonetail.unpack(self._dbfile.get(
+                tailpos, _zonetail.size))
+            self._zonesize = zonesize
+            self._zonecount = zonecount
+            self._zonepos = tailpos - zonecount * self._fixedlen * 2
+            return self._zonepos - self._basepos
+
+        def _unpack_value(self, bs):
+            return bs
+
+        def zone_size(self):
+            return self._zonesize
+
+        def zone(self, zonenum):
+            if self._zones is None:
+                fixedlen = self._fixedlen
+                zonecount = self._zonecount
+                unpack = self._unpack_value
+                data = self._dbfile.get(self._zonepos,
+                                        zonecount * fixedlen * 2)
+                values = [unpack(data[i:i + fixedlen])
+                          for i in xrange(0, len(data), fixedlen)]
+                self._zones = list(zip(values[:zonecount],
+                                       values[zonecount:]))
+            return self._zones[zonenum]
+
         def __repr__(self):
             return "<FixedBytes.Reader>"
 
@@ -443,6 +573,23 @@ class FixedBytesColumn(Column):
                 else:
                     yield default
 
+        def _read_bytes(self, start, end):
+            # Returns the stored bytes for documents start to end (which must
+            # be less than or equal to self._count) in one read
+            fixedlen = self._fixedlen
+            pos = self._basepos + fixedlen * start
+            return self._dbfile.get(pos, fixedlen * (end - start))
+
+        def read_range(self, start, end):
+            end = min(end, self._doccount)
+            stop = max(start, min(end, self._count))
+            fixedlen = self._fixedlen
+            data = self._read_bytes(start, stop)
+            values = [data[i:i + fixedlen]
+                      for i in xrange(0, len(data), fixedlen)]
+            values.extend([self._default] * (end - max(start, stop)))
+            return values
+
 
 # Variable/fixed length reference (enum) column
 
@@ -632,25 +779,32 @@ class NumericColumn(FixedBytesColumn):
     """
 
     reversible = True
+    # Columns pickled before zone maps existed don't have this attribute
+    _zonesize = 0
 
-    def __init__(self, typecode, default=0):
+    def __init__(self, typecode, default=0, zonesize=0):
         """
         :param typecode: a typecode character (as used by the ``struct``
             module) specifying the number type. For example, ``"i"`` for
             signed integers.
         :param default: the default value to use for documents that don't
             specify one.
+        :param zonesize: if this is not 0, the column records the minimum and
+            maximum value of every run of this many documents (a "zone map"),
+            which lets range queries and sorting skip whole runs of documents.
         """
 
         self._typecode = typecode
         self._default = default
+        self._zonesize = zonesize
 
     def writer(self, dbfile):
-        return self.Writer(dbfile, self._typecode, self._default)
+        return self.Writer(dbfile, self._typecode, self._default,
+                           self._zonesize)
 
     def reader(self, dbfile, basepos, length, doccount):
         return self.Reader(dbfile, basepos, length, doccount, self._typecode,
-                           self._default)
+                           self._default, self._zonesize)
 
     def default_value(self, reverse=False):
         v = self._default
@@ -659,13 +813,15 @@ class NumericColumn(FixedBytesColumn):
         return v
 
     class Writer(FixedBytesColumn.Writer):
-        def __init__(self, dbfile, typecode, default):
+        def __init__(self, dbfile, typecode, default, zonesize=0):
             self._dbfile = dbfile
-            self._pack = struct.Struct("!" + typecode).pack
+            self._pack = self._pack_value = struct.Struct("!" + typecode).pack
             self._default = default
             self._defaultbytes = self._pack(default)
             self._fixedlen = struct.calcsize(typecode)
             self._count = 0
+            self._zonesize = zonesize
+            self._zones = []
 
         def __repr__(self):
             return "<Numeric.Writer>"
@@ -677,10 +833,12 @@ class NumericColumn(FixedBytesColumn):
                 self.fill(docnum)
             self._dbfile.write(self._pack(v))
             self._count = docnum + 1
+            if self._zonesize:
+                self._add_to_zone(docnum, v)
 
     class Reader(FixedBytesColumn.Reader):
         def __init__(self, dbfile, basepos, length, doccount, typecode,
-                     default):
+                     default, zonesize=0):
             self._dbfile = dbfile
             self._basepos = basepos
             self._doccount = doccount
@@ -691,6 +849,8 @@ class NumericColumn(FixedBytesColumn):
             self._unpack = struct.Struct("!" + typecode).unpack
             self._defaultbytes = struct.pack("!" + typecode, default)
             self._fixedlen = struct.calcsize(typecode)
+            if zonesize:
+                length = self._read_zone_tail(length)
             self._count = length // self._fixedlen
 
         def __repr__(self):
@@ -700,6 +860,9 @@ class NumericColumn(FixedBytesColumn):
             s = FixedBytesColumn.Reader.__getitem__(self, docnum)
             return self._unpack(s)[0]
 
+        def _unpack_value(self, bs):
+            return self._unpack(bs)[0]
+
         def sort_key(self, docnum):
             key = self[docnum]
             if self._reverse:
@@ -712,6 +875,33 @@ class NumericColumn(FixedBytesColumn):
             else:
                 return array(self._typecode, self)
 
+        def read_range(self, start, end):
+            """Returns the values for documents ``start`` up to but not
+            including ``end`` as an ``array.array`` (or a list, if the platform
+            has no array type for this column's typecode), decoded from a
+            single read of the column file.
+            """
+
+            typecode = self._typecode
+            end = min(end, self._doccount)
+            stop = max(start, min(end, self._count))
+            data = self._read_bytes(start, stop)
+
+            try:
+                values = array(typecode)
+            except ValueError:
+                values = []
+            if isinstance(values, array) and values.itemsize == self._fixedlen:
+                # The column is stored big-endian
+                array_frombytes(values, data)
+                if IS_LITTLE:
+                    values.byteswap()
+            elif data:
+                values.extend(struct.unpack("!%d%s" % (stop - start, typecode),
+                                            data))
+            values.extend([self._default] * (end - max(start, stop)))
+            return values
+
         def set_reverse(self):
             self._reverse = True
 
@@ -846,13 +1036,28 @@ class CompressedBytesColumn(Column):
             VarBytesColumn.Writer.__init__(self, dbfile)
             self._level = level
             self._compress = __import__(module).compress
+            self._compressor = None
 
         def __repr__(self):
             return "<CompressedBytes.Writer>"
 
+        def set_compressor(self, compressor):
+            self._compressor = compressor
+
         def add(self, docnum, v):
-            v = self._compress(v, self._level)
-            VarBytesColumn.Writer.add(self, docnum, v)
+            if self._compressor is not None:
+                self._compressor.compress(self._compress, v, self._level,
+                                          VarBytesColumn.Writer.add, self,
+                                          docnum)
+            else:
+                v = self._compress(v, self._level)
+                VarBytesColumn.Writer.add(self, docnum, v)
+
+        def finish(self, doccount):
+            if self._compressor is not None:
+                # Write out any values still being compressed
+                self._compressor.flush()
+            VarBytesColumn.Writer.finish(self, doccount)
 
     class Reader(VarBytesColumn.Reader):
         def __init__(self, dbfile, basepos, length, doccount, module):
@@ -909,6 +1114,7 @@ class CompressedBlockColumn(Column):
             self._blocksize = blocksize * 1024
             self._level = level
             self._compress = __import__(module).compress
+            self._compressor = None
 
             self._reset()
 
@@ -920,12 +1126,23 @@ class CompressedBlockColumn(Column):
             self._block = emptybytes
             self._lengths = []
 
+        def set_compressor(self, compressor):
+            self._compressor = compressor
+
         def _emit(self):
+            if self._compressor is not None:
+                self._compressor.compress(self._compress, self._block,
+                                          self._level, self._write_block,
+                                          self._startdoc, self._lastdoc,
+                                          tuple(self._lengths))
+            else:
+                block = self._compress(self._block, self._level)
+                self._write_block(self._startdoc, self._lastdoc,
+                                  tuple(self._lengths), block)
+
+        def _write_block(self, startdoc, lastdoc, lengths, block):
             dbfile = self._dbfile
-            block = self._compress(self._block, self._level)
-            header = (self._startdoc, self._lastdoc, len(block),
-                      tuple(self._lengths))
-            dbfile.write_pickle(header)
+            dbfile.write_pickle((startdoc, lastdoc, len(block), lengths))
             dbfile.write(block)
 
         def add(self, docnum, v):
@@ -943,6 +1160,8 @@ class CompressedBlockColumn(Column):
             # If there's still a pending block, write it out
             if self._startdoc is not None:
                 self._emit()
+            if self._compressor is not None:
+                self._compressor.flush()
 
     class Reader(ColumnReader):
         def __init__(self, dbfile, basepos, length, doccount, module):
@@ -1014,36 +1233,57 @@ class CompressedBlockColumn(Column):
 
 
 class StructColumn(FixedBytesColumn):
-    def __init__(self, spec, default):
+    # Columns pickled before zone maps existed don't have this attribute
+    _zonesize = 0
+
+    def __init__(self, spec, default, zonesize=0):
+        """
+        :param spec: a ``struct`` format string for the values.
+        :param default: the default tuple to use for documents that don't
+            specify one.
+        :param zonesize: if this is not 0, the column records the minimum and
+            maximum tuple of every run of this many documents (see
+            :class:`NumericColumn`).
+        """
+
         self._spec = spec
         self._fixedlen = struct.calcsize(spec)
         self._default = default
+        self._zonesize = zonesize
 
     def writer(self, dbfile):
-        return self.Writer(dbfile, self._spec, self._default)
+        return self.Writer(dbfile, self._spec, self._default, self._zonesize)
 
     def reader(self, dbfile, basepos, length, doccount):
         return self.Reader(dbfile, basepos, length, doccount, self._spec,
-                           self._default)
+                           self._default, self._zonesize)
 
     class Writer(FixedBytesColumn.Writer):
-        def __init__(self, dbfile, spec, default):
+        def __init__(self, dbfile, spec, default, zonesize=0):
             self._dbfile = dbfile
             self._struct = struct.Struct(spec)
             self._fixedlen = self._struct.size
-            self._default = default
+            self._default = tuple(default)
             self._defaultbytes = self._struct.pack(*default)
             self._count = 0
+            self._zonesize = zonesize
+            self._zones = []
 
         def __repr__(self):
             return "<Struct.Writer>"
 
+        def _pack_value(self, v):
+            return self._struct.pack(*v)
+
         def add(self, docnum, v):
             b = self._struct.pack(*v)
             FixedBytesColumn.Writer.add(self, docnum, b)
+            if self._zonesize:
+                self._add_to_zone(docnum, tuple(v))
 
     class Reader(FixedBytesColumn.Reader):
-        def __init__(self, dbfile, basepos, length, doccount, spec, default):
+        def __init__(self, dbfile, basepos, length, doccount, spec, default,
+                     zonesize=0):
             self._dbfile = dbfile
             self._basepos = basepos
             self._doccount = doccount
@@ -1051,8 +1291,13 @@ class StructColumn(FixedBytesColumn):
             self._fixedlen = self._struct.size
             self._default = default
             self._defaultbytes = self._struct.pack(*default)
+            if zonesize:
+                length = self._read_zone_tail(length)
             self._count = length // self._fixedlen
 
+        def _unpack_value(self, bs):
+            return self._struct.unpack(bs)
+
         def __repr__(self):
             return "<Struct.Reader>"
 
@@ -1060,6 +1305,16 @@ class StructColumn(FixedBytesColumn):
             v = FixedBytesColumn.Reader.__getitem__(self, docnum)
             return self._struct.unpack(v)
 
+        def read_range(self, start, end):
+            end = min(end, self._doccount)
+            stop = max(start, min(end, self._count))
+            unpack_from = self._struct.unpack_from
+            data = self._read_bytes(start, stop)
+            values = [unpack_from(data, i)
+                      for i in xrange(0, len(data), self._fixedlen)]
+            values.extend([self._default] * (end - max(start, stop)))
+            return values
+
 
 # Utility readers
 
@@ -1083,6 +1338,10 @@ class EmptyColumnReader(ColumnReader):
     def __iter__(self):
         return (self._default for _ in xrange(self._doccount))
 
+    def read_range(self, start, end):
+        end = min(end, self._doccount)
+        return [self._default] * max(0, end - start)
+
     def load(self):
         return self
 
@@ -1109,6 +1368,8 @@ class MultiColumnReader(ColumnReader):
         else:
             assert len(offsets) == len(readers)
             self._doc_offsets = offsets
+            if readers:
+                self._doccount = offsets[-1] + len(readers[-1])
 
     def _document_reader(self, docnum):
         return max(0, bisect_right(self._doc_offsets, docnum) - 1)
@@ -1127,6 +1388,32 @@ class MultiColumnReader(ColumnReader):
             for v in r:
                 yield v
 
+    def read_range(self, start, end):
+        readers = self._readers
+        offsets = self._doc_offsets
+        end = min(end, self._doccount)
+        values = []
+        while start < end:
+            rnum = self._document_reader(start)
+            offset = offsets[rnum]
+            if rnum + 1 < len(readers):
+                stop = min(end, offsets[rnum + 1])
+            else:
+                stop = end
+            part = readers[rnum].read_range(start - offset, stop - offset)
+            if not values:
+                # Keep the sub-reader's sequence type (e.g. an array)
+                values = part
+            else:
+                try:
+                    values.extend(part)
+                except TypeError:
+                    values = list(values) + list(part)
+            # Fill in any documents the sub-reader didn't cover
+            values.extend([self[i] for i in xrange(start + len(part), stop)])
+            start = stop
+        return values
+
 
 class TranslatingColumnReader(ColumnReader):
     """Calls a function to "translate" values from an underlying column reader
@@ -1166,6 +1453,10 @@ class TranslatingColumnReader(ColumnReader):
         translate = self._translate
         return (translate(v) for v in self._reader)
 
+    def read_range(self, start, end):
+        translate = self._translate
+        return [translate(v) for v in self._reader.read_range(start, end)]
+
     def set_reverse(self):
         self._reader.set_reverse()
 
@@ -1196,6 +1487,9 @@ class WrappedColumnWriter(ColumnWriter):
     def add(self, docnum, value):
         return self._child.add(docnum, value)
 
+    def set_compressor(self, compressor):
+        self._child.set_compressor(compressor)
+
     def finish(self, docnum):
         return self._child.finish(docnum)
 
@@ -643,7 +643,7 @@ class NUMERIC(FieldType):
 
     def default_column(self):
         return columns.NumericColumn(self.sortable_typecode,
-                                     default=self.default)
+                                     default=self.default, zonesize=1024)
 
     def is_valid(self, x):
         try:
@@ -204,8 +204,8 @@ class SubFile(object):
         start = self._offset + position
         end = start + length
         name = name or self.name
-        assert self._offset >= start >= self._end
-        assert self._offset >= end >= self._end
+        assert self._offset <= start <= self._end
+        assert self._offset <= end <= self._end
         return SubFile(self._file, self._offset + position, length, name=name)
 
     def read(self, size=None):
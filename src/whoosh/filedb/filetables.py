@@ -31,12 +31,13 @@ D. J. Bernstein's CDB format (http://cr.yp.to/cdb.html).
 """
 
 import os, struct
+from array import array
 from binascii import crc32
-from bisect import bisect_left
+from bisect import bisect_left, bisect_right
 from hashlib import md5  # @UnresolvedImport
 
 from whoosh.compat import b, bytes_type
-from whoosh.compat import xrange
+from whoosh.compat import loads, xrange
 from whoosh.util.numlists import GrowableArray
 from whoosh.system import _INT_SIZE, emptybytes
 
@@ -67,6 +68,89 @@ def crc_hash(key):
 _hash_functions = (md5_hash, crc_hash, cdb_hash)
 
 
+# Bloom filter
+
+# Two uints taken from the MD5 digest of a key, which a Bloom filter combines
+# to get the key's bit positions
+_bloom_hashes = struct.Struct("!II")
+
+
+def bloom_hashes(key):
+    """Returns a pair of hashes of the given bytes key, which a
+    :class:`BloomFilter` uses to work out the key's bit positions.
+    """
+
+    return _bloom_hashes.unpack_from(md5(key).digest())
+
+
+class BloomFilter(object):
+    """A compact, probabilistic set of byte strings. Checking for a key that
+    was added always returns True, but checking for a key that wasn't added
+    may also return True (about 1% of the time at 10 bits per key).
+    """
+
+    def __init__(self, numbits, numhashes, bits=None):
+        """
+        :param numbits: the number of bits in the filter.
+        :param numhashes: the number of bits set for each key.
+        :param bits: the filter's bits as a ``bytearray``, for a filter read
+            from disk.
+        """
+
+        self.numbits = numbits
+        self.numhashes = numhashes
+        if bits is None:
+            bits = bytearray((numbits + 7) // 8)
+        self.bits = bits
+
+    @classmethod
+    def from_hashes(cls, hashes, count, bitsperkey=10):
+        """Returns a filter containing the keys with the given hashes.
+
+        :param hashes: an iterable of hash pairs from :func:`bloom_hashes`.
+        :param count: the number of hash pairs.
+        :param bitsperkey: the number of bits in the filter for each key.
+        """
+
+        # Round up to whole bytes, since a filter read from disk takes its
+        # size from the length of its bytes
+        numbits = (max(64, count * bitsperkey) + 7) // 8 * 8
+        # ln(2) * bits per key is the number of hashes that gives the fewest
+        # false positives
+        numhashes = max(1, int(round(bitsperkey * 0.693)))
+        bf = cls(numbits, numhashes)
+        for h1, h2 in hashes:
+            bf.add_hashes(h1, h2)
+        return bf
+
+    @classmethod
+    def from_bytes(cls, bs, numhashes):
+        return cls(len(bs) * 8, numhashes, bytearray(bs))
+
+    def to_bytes(self):
+        return bytes(self.bits)
+
+    def _positions(self, h1, h2):
+        numbits = self.numbits
+        for i in xrange(self.numhashes):
+            yield (h1 + i * h2) % numbits
+
+    def add_hashes(self, h1, h2):
+        bits = self.bits
+        for pos in self._positions(h1, h2):
+            bits[pos >> 3] |= 1 << (pos & 7)
+
+    def add(self, key):
+        self.add_hashes(*bloom_hashes(key))
+
+    def __contains__(self, key):
+        bits = self.bits
+        for pos in self._positions(*bloom_hashes(key)):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
 # Structs
 
 # Two uints before the key/value pair giving the length of the key and value
@@ -78,6 +162,11 @@ _dir_entry = struct.Struct("!qi")
 
 _directory_size = 256 * _dir_entry.size
 
+# The header of a front-coded block, giving the number of keys in the block
+# and the index of the typecode used for the key/value lengths array
+_fc_blockheader = struct.Struct("!HB")
+_fc_typecodes = "BHI"
+
 
 # Basic hash file
 
@@ -732,4 +821,323 @@ class FieldedOrderedHashReader(HashReader):
             yield (dbfile.get(keypos, keylen), dbfile.get(datapos, datalen))
 
 
+# Front-coded sorted table
+
+class FrontCodedWriter(object):
+    """Writes an immutable, sorted key-value table where the keys are
+    front-coded: the keys are grouped into blocks, and each key after the
+    first in a block is stored as the length of the prefix it shares with the
+    previous key plus the remaining suffix. Sorted term dictionaries usually
+    have long shared prefixes (especially since the keys start with the field
+    number), so this is much smaller than :class:`OrderedHashWriter`.
+
+    The first key of every block and the block positions are kept in a small
+    index at the end of the file, which :class:`FrontCodedReader` loads into
+    memory and binary searches to find the single block that can contain a
+    given key.
+    """
+
+    def __init__(self, dbfile, magic=b("FCT1"), blocksize=32):
+        """
+        :param dbfile: a :class:`~whoosh.filedb.structfile.StructFile` object
+            to write to.
+        :param magic: the format tag bytes to write at the start of the file.
+        :param blocksize: the number of keys to store in each front-coded
+            block. Larger blocks make the file (and the in-memory index)
+            smaller at the cost of decoding more keys for each lookup.
+        """
+
+        assert 0 < blocksize < 2 ** 16
+        self.dbfile = dbfile
+        self.blocksize = blocksize
+        # A place for subclasses to put extra metadata
+        self.extras = {}
+
+        self.startoffset = dbfile.tell()
+        # Write format tag
+        dbfile.write(magic)
+        # Unused future expansion bits
+        dbfile.write_int(0)
+
+        # The first key and the relative position of every block
+        self.firstkeys = []
+        self.positions = []
+        self.count = 0
+        # Keys and values for the block currently being built
+        self.keys = []
+        self.values = []
+        # Keep track of the last key added
+        self.lastkey = None
+
+    def tell(self):
+        return self.dbfile.tell()
+
+    def add(self, key, value):
+        """Adds a key/value pair to the file. Unlike :class:`HashWriter`, the
+        keys must be unique and must be added in increasing order.
+        """
+
+        assert isinstance(key, bytes_type)
+        assert isinstance(value, bytes_type)
+        if self.lastkey is not None and key <= self.lastkey:
+            raise ValueError("Keys must increase: %r..%r"
+                             % (self.lastkey, key))
+
+        self.keys.append(key)
+        self.values.append(value)
+        self.lastkey = key
+        self.count += 1
+        if len(self.keys) >= self.blocksize:
+            self._write_block()
+
+    def add_all(self, items):
+        """Convenience method to add a sequence of ``(key, value)`` pairs. This
+        is the same as calling :meth:`FrontCodedWriter.add` on each pair in
+        the sequence.
+        """
+
+        add = self.add
+        for key, value in items:
+            add(key, value)
+
+    def _write_block(self):
+        dbfile = self.dbfile
+        keys = self.keys
+        values = self.values
+
+        self.firstkeys.append(keys[0])
+        self.positions.append(dbfile.tell() - self.startoffset)
+
+        # The first key in the block is stored whole so a block can always be
+        # decoded without looking at the previous block
+        prefixes = array("B", [0])
+        suffixes = [keys[0]]
+        for i in xrange(1, len(keys)):
+            prefix = min(len(os.path.commonprefix((keys[i - 1], keys[i]))),
+                         255)
+            prefixes.append(prefix)
+            suffixes.append(keys[i][prefix:])
+
+        # Store the suffix lengths and value lengths in a single array using
+        # the smallest type that can hold them
+        lengths = [len(x) for x in suffixes] + [len(v) for v in values]
+        maxlen = max(lengths)
+        if maxlen < 2 ** 8:
+            code = 0
+        elif maxlen < 2 ** 16:
+            code = 1
+        else:
+            code = 2
+
+        dbfile.write(_fc_blockheader.pack(len(keys), code))
+        dbfile.write_array(prefixes)
+        dbfile.write_array(array(_fc_typecodes[code], lengths))
+        dbfile.write(emptybytes.join(suffixes))
+        dbfile.write(emptybytes.join(values))
+
+        self.keys = []
+        self.values = []
+
+    def close(self):
+        dbfile = self.dbfile
+        if self.keys:
+            self._write_block()
+
+        expos = dbfile.tell()
+        # Write the block index and extra information
+        dbfile.write_pickle((self.count, self.firstkeys, self.positions,
+                             expos - self.startoffset, self.extras))
+        # Write length of pickle
+        dbfile.write_int(dbfile.tell() - expos)
+
+        endpos = dbfile.tell()
+        dbfile.close()
+        return endpos
+
+
+class FrontCodedReader(object):
+    """Reader for the front-coded sorted tables created by
+    :class:`FrontCodedWriter`.
+    """
+
+    def __init__(self, dbfile, length=None, magic=b("FCT1"), startoffset=0):
+        """
+        :param dbfile: a :class:`~whoosh.filedb.structfile.StructFile` object
+            to read from.
+        :param length: the length of the file data. This is necessary since the
+            block index is written at the end of the file.
+        :param magic: the format tag bytes to look for at the start of the
+            file. If the file's format tag does not match these bytes, the
+            object raises a :class:`FileFormatError` exception.
+        :param startoffset: the starting point of the file data.
+        """
+
+        self.dbfile = dbfile
+        self.startoffset = startoffset
+        self.is_closed = False
+
+        if length is None:
+            dbfile.seek(0, os.SEEK_END)
+            length = dbfile.tell() - startoffset
+
+        # Check format tag
+        filemagic = dbfile.get(startoffset, 4)
+        if filemagic != magic:
+            raise FileFormatError("Unknown file header %r" % filemagic)
+
+        exptr = startoffset + length - _INT_SIZE
+        # Get the length of the index from the end of the file
+        exlen = dbfile.get_int(exptr)
+        # Read the block index and extras
+        index = loads(dbfile.get(exptr - exlen, exlen))
+        self.count, self.firstkeys, positions, endofdata, self.extras = index
+        # Add a sentinel position so the end of every block is known
+        self.positions = positions + [endofdata]
+
+        # Cache the most recently decoded block, since lookups and iteration
+        # tend to hit the same block repeatedly
+        self._cached = (-1, None, None)
+
+    @classmethod
+    def open(cls, storage, name):
+        """Convenience method to open a front-coded file given a
+        :class:`whoosh.filedb.filestore.Storage` object and a name.
+        """
+
+        length = storage.file_length(name)
+        dbfile = storage.open_file(name)
+        return cls(dbfile, length)
+
+    def file(self):
+        return self.dbfile
+
+    def close(self):
+        if self.is_closed:
+            raise Exception("Tried to close %r twice" % self)
+        self.dbfile.close()
+        self.is_closed = True
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return self.keys()
+
+    def __contains__(self, key):
+        return self._locate(key)[2]
+
+    def __getitem__(self, key):
+        blocknum, i, found = self._locate(key)
+        if not found:
+            raise KeyError(key)
+        return self._block(blocknum)[1][i]
+
+    def get(self, key, default=None):
+        blocknum, i, found = self._locate(key)
+        if not found:
+            return default
+        return self._block(blocknum)[1][i]
+
+    def _block(self, blocknum):
+        # Returns a tuple of (keys, values) lists for the given block number
+        cnum, ckeys, cvalues = self._cached
+        if cnum == blocknum:
+            return ckeys, cvalues
+
+        dbfile = self.dbfile
+        pos = self.startoffset + self.positions[blocknum]
+        end = self.startoffset + self.positions[blocknum + 1]
+        hsize = _fc_blockheader.size
+        count, code = _fc_blockheader.unpack(dbfile.get(pos, hsize))
+        pos += hsize
+        prefixes = dbfile.get_array(pos, "B", count)
+        pos += count
+        typecode = _fc_typecodes[code]
+        lengths = dbfile.get_array(pos, typecode, count * 2)
+        pos += count * 2 * lengths.itemsize
+        data = dbfile.get(pos, end - pos)
+
+        keys = []
+        values = []
+        key = emptybytes
+        i = 0
+        for n in xrange(count):
+            j = i + lengths[n]
+            key = key[:prefixes[n]] + data[i:j]
+            keys.append(key)
+            i = j
+        for n in xrange(count, count * 2):
+            j = i + lengths[n]
+            values.append(data[i:j])
+            i = j
+
+        self._cached = (blocknum, keys, values)
+        return keys, values
+
+    def _locate(self, key):
+        # Returns a tuple of (blocknum, index, found) for the closest key equal
+        # to or greater than the given key, where "index" is the position of
+        # the key inside the block. If the key is past the end of the table,
+        # blocknum is the number of blocks.
+
+        if not isinstance(key, bytes_type):
+            raise TypeError("Key %r should be bytes" % key)
+
+        firstkeys = self.firstkeys
+        blocknum = bisect_right(firstkeys, key) - 1
+        if blocknum < 0:
+            return 0, 0, False
+
+        keys = self._block(blocknum)[0]
+        i = bisect_left(keys, key)
+        if i == len(keys):
+            # The key is greater than everything in this block, so the closest
+            # key is the first key in the next block
+            return blocknum + 1, 0, False
+        return blocknum, i, keys[i] == key
+
+    def closest_key(self, key):
+        """Returns the closest key equal to or greater than the given key. If
+        there is no key in the file equal to or greater than the given key,
+        returns None.
+        """
+
+        blocknum, i, _ = self._locate(key)
+        if blocknum >= len(self.firstkeys):
+            return None
+        return self._block(blocknum)[0][i]
+
+    def _items(self, blocknum=0, i=0):
+        _block = self._block
+        for bn in xrange(blocknum, len(self.firstkeys)):
+            keys, values = _block(bn)
+            for n in xrange(i, len(keys)):
+                yield keys[n], values[n]
+            i = 0
+
+    def keys(self):
+        for key, _ in self._items():
+            yield key
+
+    def values(self):
+        for _, value in self._items():
+            yield value
+
+    def items(self):
+        return self._items()
+
+    def keys_from(self, key):
+        """Yields an ordered series of keys equal to or greater than the given
+        key.
+        """
+
+        for k, _ in self.items_from(key):
+            yield k
+
+    def items_from(self, key):
+        """Yields an ordered series of ``(key, value)`` tuples for keys equal
+        to or greater than the given key.
+        """
 
+        blocknum, i, _ = self._locate(key)
+        return self._items(blocknum, i)
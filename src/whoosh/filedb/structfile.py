@@ -321,6 +321,18 @@ class StructFile(object):
         self.seek(position)
         return self.read(length)
 
+    def view(self, position, length):
+        """Returns an object supporting the buffer interface containing the
+        given range of bytes, for decoders that can work from a buffer without
+        needing a ``bytes`` object.
+
+        On a file backed by a memory buffer (such as a memory-mapped compound
+        file) this is a ``memoryview`` slice of the buffer and doesn't copy
+        any data. Otherwise this is the same as :meth:`StructFile.get`.
+        """
+
+        return self.get(position, length)
+
     def get_byte(self, position):
         return unpack_byte(self.get(position, 1))[0]
 
@@ -354,22 +366,43 @@ class BufferFile(StructFile):
     def __init__(self, buf, name=None, onclose=None):
         self._buf = buf
         self._name = name
-        self.file = BytesIO(buf)
+        self._file = None
         self.onclose = onclose
 
         self.is_real = False
         self.is_closed = False
 
+    @property
+    def file(self):
+        # Creating a BytesIO copies the buffer, so only do it if something
+        # actually uses the stream interface (the get_* methods read the
+        # buffer directly)
+        if self._file is None:
+            self._file = BytesIO(self._buf)
+        return self._file
+
+    def close(self):
+        if self.is_closed:
+            raise Exception("This file is already closed")
+        if self.onclose:
+            self.onclose(self)
+        if self._file is not None:
+            self._file.close()
+        self.is_closed = True
+
     def subset(self, position, length, name=None):
         name = name or self._name
-        return BufferFile(self.get(position, length), name=name)
+        return BufferFile(self.view(position, length), name=name)
 
     def get(self, position, length):
         return bytes_type(self._buf[position:position + length])
 
+    def view(self, position, length):
+        return self._buf[position:position + length]
+
     def get_array(self, position, typecode, length):
         a = array(typecode)
-        array_frombytes(a, self.get(position, length * _SIZEMAP[typecode]))
+        array_frombytes(a, self.view(position, length * _SIZEMAP[typecode]))
         if IS_LITTLE:
             a.byteswap()
         return a
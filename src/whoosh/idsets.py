@@ -680,8 +680,9 @@ class MultiIdSet(DocIdSet):
         self.offsets = offsets
 
     def _document_set(self, n):
-        offsets = self.offsets
-        return max(bisect_left(offsets, n), len(self.offsets) - 1)
+        # The offsets are in increasing order, so the set containing n is the
+        # last one with an offset less than or equal to n
+        return max(bisect_right(self.offsets, n) - 1, 0)
 
     def _set_and_docnum(self, n):
         setnum = self._document_set(n)
@@ -691,6 +692,11 @@ class MultiIdSet(DocIdSet):
     def __len__(self):
         return sum(len(idset) for idset in self.idsets)
 
+    def __nonzero__(self):
+        return any(idset for idset in self.idsets)
+
+    __bool__ = __nonzero__
+
     def __iter__(self):
         for idset, offset in izip(self.idsets, self.offsets):
             for docnum in idset:
@@ -700,4 +706,37 @@ class MultiIdSet(DocIdSet):
         idset, n = self._set_and_docnum(item)
         return n in idset
 
+    def first(self):
+        return self.after(-1)
+
+    def last(self):
+        for setnum in xrange(len(self.idsets) - 1, -1, -1):
+            idset = self.idsets[setnum]
+            if idset:
+                return idset.last() + self.offsets[setnum]
+        return None
+
+    def before(self, i):
+        setnum = self._document_set(i)
+        while setnum >= 0:
+            offset = self.offsets[setnum]
+            n = self.idsets[setnum].before(i - offset)
+            if n is not None:
+                return n + offset
+            # Look for the last ID in the previous set
+            i = offset
+            setnum -= 1
+        return None
+
+    def after(self, i):
+        idsets = self.idsets
+        setnum = self._document_set(i) if i >= 0 else 0
+        while setnum < len(idsets):
+            offset = self.offsets[setnum]
+            n = idsets[setnum].after(max(i - offset, -1))
+            if n is not None:
+                return n + offset
+            setnum += 1
+        return None
+
 
@@ -337,13 +337,17 @@ class Index(object):
         finally:
             r.close()
 
-    def reader(self, reuse=None):
+    def reader(self, reuse=None, blockcache=None):
         """Returns an IndexReader object for this index.
 
         :param reuse: an existing reader. Some implementations may recycle
             resources from this existing reader to create the new reader. Note
             that any resources in the "recycled" reader that are not used by
             the new reader will be CLOSED, so you CANNOT use it afterward.
+        :param blockcache: a cache object (such as a
+            :class:`whoosh.util.cache.LRUCache`) to share decoded posting
+            blocks with other readers, or ``True`` to use the process-wide
+            cache. See :meth:`whoosh.reading.IndexReader.set_block_cache`.
         :rtype: :class:`whoosh.reading.IndexReader`
         """
 
@@ -369,13 +373,34 @@ class Index(object):
 
 # Codec-based index implementation
 
+def _same_deletions(oldsegment, segment):
+    # Returns True if a reader opened on oldsegment would see the same deleted
+    # documents as one opened on segment (another copy of the same segment)
+    if oldsegment is segment:
+        return True
+    if oldsegment.deleted_count() != segment.deleted_count():
+        return False
+    return set(oldsegment.deleted_docs()) == set(segment.deleted_docs())
+
+
+# IDs of segments whose files are being written without the index's write lock
+# (for example by a background merge), and which aren't in the TOC yet, so
+# clean_files() must not delete them
+_unpublished_segments = set()
+
+
 def clean_files(storage, indexname, gen, segments):
     # Attempts to remove unused index files (called when a new generation
     # is created). If existing Index and/or reader objects have the files
     # open, they may not be deleted immediately (i.e. on Windows) but will
     # probably be deleted eventually by a later call to clean_files.
 
+    from whoosh.codec.base import Segment
+
     current_segment_names = set(s.segment_id() for s in segments)
+    # Deletion files of current segments, which are kept even though earlier
+    # generations of them aren't
+    current_delfiles = set(s.deletions_filename() for s in segments)
     tocpattern = TOC._pattern(indexname)
     segpattern = TOC._segment_pattern(indexname)
 
@@ -390,8 +415,13 @@ def clean_files(storage, indexname, gen, segments):
                 todelete.add(filename)
         elif segm:
             name = segm.group(1)
+            if name in _unpublished_segments:
+                continue
             if name not in current_segment_names:
                 todelete.add(filename)
+            elif (filename.endswith(Segment.DELETIONS_EXT)
+                  and filename not in current_delfiles):
+                todelete.add(filename)
 
     for filename in todelete:
         try:
@@ -492,7 +522,8 @@ class FileIndex(Index):
         return self._read_toc().version
 
     @classmethod
-    def _reader(cls, storage, schema, segments, generation, reuse=None):
+    def _reader(cls, storage, schema, segments, generation, reuse=None,
+                blockcache=None):
         # Returns a reader for the given segments, possibly reusing already
         # opened readers
         from whoosh.reading import SegmentReader, MultiReader, EmptyReader
@@ -506,22 +537,29 @@ class FileIndex(Index):
 
             if reuse:
                 # Put all atomic readers in a dictionary keyed by their
-                # generation, so we can re-use them if them if possible
+                # segment ID, so we can re-use them if them if possible
                 readers = [r for r, _ in reuse.leaf_readers()]
-                reusable = dict((r.generation(), r) for r in readers)
+                reusable = dict((r.segment().segment_id(), r) for r in readers
+                                if r.segment() is not None)
 
             # Make a function to open readers, which reuses reusable readers.
             # It removes any readers it reuses from the "reusable" dictionary,
             # so later we can close any readers left in the dictionary.
             def segreader(segment):
                 segid = segment.segment_id()
-                if segid in reusable:
+                if (segid in reusable
+                    and _same_deletions(reusable[segid].segment(), segment)):
                     r = reusable[segid]
                     del reusable[segid]
+                    if blockcache is not None:
+                        r.set_block_cache(blockcache)
+                    # The reader now represents the new generation
+                    r._gen = generation
                     return r
                 else:
                     return SegmentReader(storage, schema, segment,
-                                         generation=generation)
+                                         generation=generation,
+                                         blockcache=blockcache)
 
             if len(segments) == 1:
                 # This index has one segment, so return a SegmentReader object
@@ -538,14 +576,15 @@ class FileIndex(Index):
             for r in reusable.values():
                 r.close()
 
-    def reader(self, reuse=None):
+    def reader(self, reuse=None, blockcache=None):
         retries = 10
         while retries > 0:
             # Read the information from the TOC file
             try:
                 info = self._read_toc()
                 return self._reader(self.storage, info.schema, info.segments,
-                                    info.generation, reuse=reuse)
+                                    info.generation, reuse=reuse,
+                                    blockcache=blockcache)
             except IOError:
                 # Presume that we got a "file not found error" because a writer
                 # deleted one of the files just as we were trying to open it,
@@ -664,6 +703,11 @@ class TOC(object):
             segments = stream.read_pickle()
 
         stream.close()
+
+        # Let segments that keep their deletions in a separate file load them
+        for segment in segments:
+            segment.open_deletions(storage)
+
         return cls(schema, segments, gen, version=version, release=release)
 
     def write(self, storage, indexname):
@@ -700,6 +744,15 @@ class TOC(object):
             # Otherwise, re-raise the original exception
             raise
 
+        # Let segments that keep their deletions in a separate file write any
+        # changes before they're pickled
+        for segment in self.segments:
+            segment.save_deletions(storage, self.generation)
+            # Give the segment a deletion version before it's pickled, so all
+            # the copies read from this TOC share it (see
+            # Segment.deletion_version)
+            segment.deletion_version()
+
         stream.write_int(self.generation)
         stream.write_int(0)  # Unused
         stream.write_pickle(self.segments)
@@ -310,3 +310,229 @@ class ArrayUnionMatcher(CombinationMatcher):
 
     def score(self):
         return self._a[self._docnum - self._offset]
+
+
+class WandUnionMatcher(CombinationMatcher):
+    """Matches the union (OR) of a list of sub-matchers, using the "Block-Max
+    WAND" algorithm to skip documents that can't score high enough to make it
+    into the top N results.
+
+    Instead of a binary tree of :class:`~whoosh.matching.binary.UnionMatcher`
+    objects, this matcher keeps the sub-matchers in a list sorted by their
+    current document. When the collector reports a minimum score (through
+    :meth:`~whoosh.matching.Matcher.replace` or
+    :meth:`~whoosh.matching.Matcher.skip_to_quality`), the matcher adds up the
+    maximum qualities of the sub-matchers in document order until the total
+    exceeds the minimum, and skips every sub-matcher before that "pivot"
+    straight to the pivot document. Once the pivot document is found, the
+    block qualities of the sub-matchers on it are checked, and if they can't
+    beat the minimum either, the matcher jumps to the end of the shortest
+    current block.
+
+    If the sub-matchers don't support block quality optimizations, or no
+    minimum score has been set, this matcher acts like a plain union.
+
+    The scores of the sub-matchers on a document are always added up in the
+    order of the ``submatchers`` list, so a document gets exactly the same
+    score however the matcher reached it.
+    """
+
+    def __init__(self, submatchers, boost=1.0, minquality=0):
+        """
+        :param submatchers: a list of :class:`~whoosh.matching.Matcher`
+            objects.
+        :param boost: a factor to multiply the scores by.
+        :param minquality: the initial minimum score a document must exceed.
+        """
+
+        CombinationMatcher.__init__(self, submatchers, boost=boost)
+        self._usequality = all(m.supports_block_quality() for m in submatchers)
+        self._minquality = minquality
+        # Maps the id() of each sub-matcher to its position in the list, to
+        # keep the sub-matchers on the same document in a fixed order
+        self._positions = dict((id(m), i) for i, m in enumerate(submatchers))
+        # Active sub-matchers, sorted by their current ID (and then position)
+        # after _find_next()
+        self._active = [m for m in submatchers if m.is_active()]
+        self._id = None
+        self._find_next()
+
+    def __repr__(self):
+        return "%s(%r, boost=%s)" % (self.__class__.__name__,
+                                     self._submatchers, self._boost)
+
+    def _find_next(self):
+        # Moves the sub-matchers forward until they are on a document that
+        # might score higher than the minimum quality, and sets self._id to it
+
+        boost = self._boost
+        minquality = self._minquality
+        prune = minquality and self._usequality
+        positions = self._positions
+
+        def sortkey(m):
+            return m.id(), positions[id(m)]
+
+        while True:
+            active = [m for m in self._active if m.is_active()]
+            self._active = active
+            if not active:
+                self._id = None
+                return
+            active.sort(key=sortkey)
+
+            if not prune:
+                self._id = active[0].id()
+                return
+
+            # Find the pivot: the first sub-matcher where the sum of the max
+            # qualities of the sub-matchers up to and including it reaches the
+            # minimum quality. No document before the pivot's current document
+            # can score high enough. (Documents that tie the minimum are kept,
+            # so the collector decides ties.)
+            total = 0.0
+            pivot = None
+            for m in active:
+                total += m.max_quality() * boost
+                if total >= minquality:
+                    pivot = m
+                    break
+            if pivot is None:
+                # Even a document matching every sub-matcher can't make it
+                self._active = []
+                self._id = None
+                return
+            pivotid = pivot.id()
+
+            if active[0].id() < pivotid:
+                # Move the sub-matchers before the pivot up to the pivot doc
+                for m in active:
+                    if m.id() >= pivotid:
+                        break
+                    m.skip_to(pivotid)
+                continue
+
+            # Every sub-matcher that could match the pivot document is on it,
+            # so check the qualities of the blocks they're in
+            aligned = [m for m in active if m.id() == pivotid]
+            blockq = sum(m.block_quality() for m in aligned) * boost
+            if blockq >= minquality:
+                self._id = pivotid
+                return
+
+            # The pivot document can't make it, and neither can any document
+            # up to the end of the shortest current block, unless another
+            # sub-matcher starts matching before then
+            target = pivotid + 1
+            blockends = [_block_max_id(m) for m in aligned]
+            if None not in blockends:
+                target = max(target, min(blockends) + 1)
+            if len(aligned) < len(active):
+                target = min(target, active[len(aligned)].id())
+            for m in aligned:
+                m.skip_to(target)
+
+    def _current(self):
+        # Returns the sub-matchers on the current document, in the order of the
+        # submatchers list. After _find_next() the active list is sorted by ID
+        # and position, so they are at the start of the list
+        _id = self._id
+        current = []
+        for m in self._active:
+            if not m.is_active() or m.id() != _id:
+                break
+            current.append(m)
+        return current
+
+    def copy(self):
+        return self.__class__([m.copy() for m in self._submatchers],
+                              boost=self._boost, minquality=self._minquality)
+
+    def depth(self):
+        return 1 + max(m.depth() for m in self._submatchers)
+
+    def reset(self):
+        for m in self._submatchers:
+            m.reset()
+        self._active = [m for m in self._submatchers if m.is_active()]
+        self._find_next()
+
+    def replace(self, minquality=0):
+        if minquality > self._minquality:
+            self._minquality = minquality
+            self._find_next()
+
+        if not self.is_active():
+            return mcore.NullMatcher()
+        elif len(self._active) == 1 and self._boost == 1.0:
+            return self._active[0].replace(minquality)
+        return self
+
+    def is_active(self):
+        return self._id is not None
+
+    def id(self):
+        return self._id
+
+    def next(self):
+        if self._id is None:
+            raise mcore.ReadTooFar
+
+        r = False
+        for m in self._current():
+            r = m.next() or r
+        self._find_next()
+        return r
+
+    def skip_to(self, id):
+        if self._id is None:
+            raise mcore.ReadTooFar
+        if id <= self._id:
+            return
+
+        r = False
+        for m in self._active:
+            if m.is_active() and m.id() < id:
+                r = m.skip_to(id) or r
+        self._find_next()
+        return r
+
+    def skip_to_quality(self, minquality):
+        if self._id is None:
+            raise mcore.ReadTooFar
+
+        if minquality > self._minquality:
+            self._minquality = minquality
+            self._find_next()
+        return 0
+
+    def supports_block_quality(self):
+        return self._usequality
+
+    def max_quality(self):
+        return sum(m.max_quality() for m in self._active
+                   if m.is_active()) * self._boost
+
+    def block_quality(self):
+        return sum(m.block_quality() for m in self._active
+                   if m.is_active()) * self._boost
+
+    def spans(self):
+        spans = set()
+        for m in self._current():
+            spans.update(m.spans())
+        return sorted(spans)
+
+    def weight(self):
+        return sum(m.weight() for m in self._current()) * self._boost
+
+    def score(self):
+        return sum(m.score() for m in self._current()) * self._boost
+
+
+def _block_max_id(m):
+    # Returns the last ID in the matcher's current block, or None if the
+    # matcher doesn't expose its block boundaries
+    block_max_id = getattr(m, "block_max_id", None)
+    if block_max_id is not None:
+        return block_max_id()
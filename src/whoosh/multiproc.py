@@ -142,11 +142,13 @@ class SubWriterTask(Process):
 
         load = pickle.load
         with tempstorage.open_file(filename).raw_file() as f:
-            for _ in xrange(doc_count):
-                # Load the next pickled tuple from the file
-                code, args = load(f)
-                assert code == 0
-                writer.add_document(**args)
+            def docs():
+                for _ in xrange(doc_count):
+                    # Load the next pickled tuple from the file
+                    code, args = load(f)
+                    assert code == 0
+                    yield args
+            writer.add_documents(docs())
         # Remove the job file
         tempstorage.delete_file(filename)
 
@@ -167,7 +169,10 @@ class MpWriter(SegmentWriter):
         self.batchsize = batchsize
         # You can use keyword arguments or the "subargs" argument to pass
         # keyword arguments to the sub-writers
-        self.subargs = subargs if subargs else kwargs
+        self.subargs = dict(subargs if subargs else kwargs)
+        # Each sub-writer must produce exactly one segment, so they can't
+        # flush segments automatically
+        self.subargs.pop("flushmb", None)
         # If multisegment is True, don't merge the segments created by the
         # sub-writers, just add them directly to the TOC
         self.multisegment = multisegment
@@ -233,6 +238,12 @@ class MpWriter(SegmentWriter):
             self._enqueue()
         self._added_sub = True
 
+    def add_documents(self, docs):
+        # Don't inherit SegmentWriter.add_documents(), which would index the
+        # documents in this process instead of farming them out
+        for fields in docs:
+            self.add_document(**fields)
+
     def _read_and_renumber_run(self, path, offset):
         # Note that SortingPool._read_run() automatically deletes the run file
         # when it's finished
@@ -312,7 +323,7 @@ class MpWriter(SegmentWriter):
         # If information was added to this writer the conventional (e.g.
         # through add_reader or merging segments), add it as an extra source
         if self._added:
-            sources.append(self.pool.iter_postings())
+            sources.append(self.iter_postings())
 
         pdrs = []
         for runname, fieldnames, segment in results:
@@ -348,7 +359,8 @@ class SerialMpWriter(MpWriter):
 
         self.procs = procs or cpu_count()
         self.batchsize = batchsize
-        self.subargs = subargs if subargs else kwargs
+        self.subargs = dict(subargs if subargs else kwargs)
+        self.subargs.pop("flushmb", None)
         self.tasks = [SegmentWriter(ix, _lk=False, **self.subargs)
                       for _ in xrange(self.procs)]
         self.pointer = 0
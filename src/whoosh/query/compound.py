@@ -290,6 +290,7 @@ class Or(CompoundQuery):
     DEFAULT_MATCHER = 1  # Use a binary tree of UnionMatchers
     SPLIT_MATCHER = 2  # Use a different strategy for short and long queries
     ARRAY_MATCHER = 3  # Use a matcher that pre-loads docnums and scores
+    WAND_MATCHER = 4  # Use an n-ary matcher that skips using block qualities
     matcher_type = AUTO_MATCHER
 
     def __init__(self, subqueries, boost=1.0, minmatch=0, scale=None):
@@ -347,6 +348,10 @@ class Or(CompoundQuery):
                 # If the parent matcher needs the current match, or there's just
                 # two sub-matchers, use the standard binary tree of Unions
                 matcher_type = self.DEFAULT_MATCHER
+                if weighting is not None and not self.scale and len(subs) > 2:
+                    # For scored searches with more than two sub-matchers, use
+                    # an n-ary union that can skip using block qualities
+                    matcher_type = self.WAND_MATCHER
             else:
                 # For small indexes, or too many clauses, just preload all
                 # matches
@@ -362,6 +367,10 @@ class Or(CompoundQuery):
         elif matcher_type == self.ARRAY_MATCHER:
             # Implementation that pre-loads docnums and scores into an array
             cls = PreloadedOr
+        elif matcher_type == self.WAND_MATCHER:
+            # Implementation that skips documents that can't make the top N
+            # using the sub-matchers' max and block qualities
+            cls = WandOr
         else:
             raise ValueError("Unknown matcher_type %r" % self.matcher_type)
 
@@ -386,6 +395,14 @@ class DefaultOr(Or):
         return m
 
 
+class WandOr(Or):
+    JOINT = " wOR "
+
+    def _matcher(self, subs, searcher, context):
+        subms = [q.matcher(searcher, context) for q in subs]
+        return matching.WandUnionMatcher(subms, boost=self.boost)
+
+
 class SplitOr(Or):
     JOINT = " sOr "
     SPLIT_DOC_LIMIT = 8000
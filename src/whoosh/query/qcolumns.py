@@ -25,6 +25,15 @@
 # those of the authors and should not be interpreted as representing official
 # policies, either expressed or implied, of Matt Chaput.
 
+from bisect import bisect_left
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from whoosh.compat import xrange
+from whoosh.idsets import BitSet
 from whoosh.matching import ConstantScoreMatcher, NullMatcher, ReadTooFar
 from whoosh.query import Query
 
@@ -34,7 +43,9 @@ class ColumnQuery(Query):
     terms in the inverted index.
 
     This may be useful in special circumstances, but note that this is MUCH
-    SLOWER than searching an indexed field.
+    SLOWER than searching an indexed field. The column is read and tested in
+    chunks of documents, which is much faster than testing one document at a
+    time but still has to look at every document in the segment.
     """
 
     def __init__(self, fieldname, condition):
@@ -53,8 +64,11 @@ class ColumnQuery(Query):
     def is_leaf(self):
         return True
 
-    def matcher(self, searcher, context=None):
-        fieldname = self.fieldname
+    def estimate_size(self, ixreader):
+        # Without looking at the column, any document could match
+        return ixreader.doc_count_all()
+
+    def _condition(self, fieldobj):
         condition = self.condition
         if callable(condition):
             comp = condition
@@ -63,49 +77,268 @@ class ColumnQuery(Query):
                 # Made this a function instead of a lambda so I could put
                 # debug prints here if necessary ;)
                 return v == condition
+        return comp
+
+    def _column_reader(self, reader):
+        return reader.column_reader(self.fieldname)
 
+    def matcher(self, searcher, context=None):
+        fieldname = self.fieldname
         reader = searcher.reader()
         if not reader.has_column(fieldname):
             return NullMatcher()
 
-        creader = reader.column_reader(fieldname)
+        comp = self._condition(searcher.schema[fieldname])
+        creader = self._column_reader(reader)
         return ColumnMatcher(creader, comp)
 
+    def docs(self, searcher):
+        """Returns a :class:`whoosh.idsets.BitSet` of the documents in the
+        searcher's reader that match this query.
+        """
+
+        reader = searcher.reader()
+        bits = BitSet(size=reader.doc_count_all())
+        m = self.matcher(searcher)
+        if m.is_active():
+            add = bits.add
+            for docnum in m.all_ids():
+                add(docnum)
+        return bits
+
+
+class ColumnRange(ColumnQuery):
+    """Matches documents whose column value for a field falls within a range
+    of values, for example a price or timestamp range.
+
+    Unlike a :class:`ColumnQuery` with a callable condition, this query
+    compares the bounds directly against the raw (sortable) column values,
+    so chunks of a numeric column can be tested without translating each
+    value, using NumPy if it is installed.
+
+    >>> ColumnRange("price", 10, 100)
+
+    Note that this still looks at the column value for every document in the
+    segment; a :class:`whoosh.query.NumericRange` on an indexed field is
+    usually faster for selective ranges.
+    """
+
+    def __init__(self, fieldname, start, end, startexcl=False, endexcl=False):
+        """
+        :param fieldname: the name of the field to look in. If the field does
+            not have a column, this query will not match anything.
+        :param start: the lower bound of the range, or None for an open range.
+        :param end: the upper bound of the range, or None for an open range.
+        :param startexcl: if True, the lower bound is not inclusive.
+        :param endexcl: if True, the upper bound is not inclusive.
+        """
+
+        self.fieldname = fieldname
+        self.start = start
+        self.end = end
+        self.startexcl = startexcl
+        self.endexcl = endexcl
+
+    def __repr__(self):
+        return '%s(%r, %r, %r, %s, %s)' % (self.__class__.__name__,
+                                           self.fieldname, self.start,
+                                           self.end, self.startexcl,
+                                           self.endexcl)
+
+    def __eq__(self, other):
+        return (other and self.__class__ is other.__class__
+                and self.fieldname == other.fieldname
+                and self.start == other.start and self.end == other.end
+                and self.startexcl == other.startexcl
+                and self.endexcl == other.endexcl)
+
+    def __hash__(self):
+        return (hash(self.fieldname) ^ hash(self.start) ^ hash(self.end)
+                ^ hash(self.startexcl) ^ hash(self.endexcl))
+
+    def _condition(self, fieldobj):
+        start = end = None
+        if self.start is not None:
+            start = fieldobj.to_column_value(self.start)
+        if self.end is not None:
+            end = fieldobj.to_column_value(self.end)
+        return RangeCondition(start, end, self.startexcl, self.endexcl)
+
+    def _column_reader(self, reader):
+        return reader.column_reader(self.fieldname, translate=False)
+
+
+class RangeCondition(object):
+    """A column condition that tests whether values are within a range. In
+    addition to being callable on a single value, it can test a whole chunk of
+    values at once (see :meth:`RangeCondition.matching`).
+    """
+
+    def __init__(self, start, end, startexcl=False, endexcl=False):
+        self.start = start
+        self.end = end
+        self.startexcl = startexcl
+        self.endexcl = endexcl
+
+    def __call__(self, v):
+        start = self.start
+        end = self.end
+        if start is not None:
+            if v < start or (self.startexcl and v == start):
+                return False
+        if end is not None:
+            if v > end or (self.endexcl and v == end):
+                return False
+        return True
+
+    def zone_test(self, minvalue, maxvalue):
+        """Returns True if every value between ``minvalue`` and ``maxvalue``
+        is within the range, False if none of them are, or None if some of
+        them might be.
+        """
+
+        start = self.start
+        end = self.end
+        if start is not None:
+            if maxvalue < start or (self.startexcl and maxvalue == start):
+                return False
+        if end is not None:
+            if minvalue > end or (self.endexcl and minvalue == end):
+                return False
+        if self(minvalue) and self(maxvalue):
+            return True
+        return None
+
+    def matching(self, values, base=0):
+        """Returns a list of the positions (plus ``base``) of the values in the
+        given sequence that are within the range.
+        """
+
+        start = self.start
+        end = self.end
+        if numpy is not None and hasattr(values, "typecode") and len(values):
+            a = numpy.frombuffer(values, dtype=values.typecode)
+            mask = None
+            if start is not None:
+                mask = (a > start) if self.startexcl else (a >= start)
+            if end is not None:
+                emask = (a < end) if self.endexcl else (a <= end)
+                mask = emask if mask is None else mask & emask
+            if mask is None:
+                return list(xrange(base, base + len(values)))
+            return (numpy.flatnonzero(mask) + base).tolist()
+
+        if start is None or end is None or self.startexcl or self.endexcl:
+            inrange = self
+            return [base + i for i, v in enumerate(values) if inrange(v)]
+        return [base + i for i, v in enumerate(values) if start <= v <= end]
+
 
 class ColumnMatcher(ConstantScoreMatcher):
-    def __init__(self, creader, condition):
+    """Matches the documents whose column values satisfy a condition. The
+    condition is tested on chunks of documents at a time using the column
+    reader's ``read_range()`` method. If the condition has a ``matching()``
+    method (see :class:`RangeCondition`) it's used to test a whole chunk at
+    once, otherwise the condition is called on each value.
+
+    If the condition has a ``zone_test()`` method and the column has a zone
+    map (see :meth:`whoosh.columns.ColumnReader.zone`), zones that can't
+    contain a match are skipped without reading their values, and zones where
+    every document must match are added without reading them.
+    """
+
+    def __init__(self, creader, condition, chunksize=4096, score=1.0):
         self.creader = creader
         self.condition = condition
-        self._i = 0
-        self._find_next()
+        self.chunksize = chunksize
+        self._score = score
+        self._doccount = len(creader)
+        self.reset()
 
-    def _find_next(self):
+    def _test_values(self, start, end):
         condition = self.condition
+        values = self.creader.read_range(start, end)
+        if hasattr(condition, "matching"):
+            return condition.matching(values, start)
+        return [start + i for i, v in enumerate(values) if condition(v)]
+
+    def _evaluate(self, start, end):
+        # Returns a list of the matching document numbers between start and
+        # end
         creader = self.creader
+        zonesize = creader.zone_size()
+        zone_test = getattr(self.condition, "zone_test", None)
+        if not zonesize or zone_test is None:
+            return self._test_values(start, end)
+
+        ids = []
+        pos = start
+        while pos < end:
+            zonenum = pos // zonesize
+            zoneend = min(end, (zonenum + 1) * zonesize)
+            result = zone_test(*creader.zone(zonenum))
+            if result is None:
+                ids.extend(self._test_values(pos, zoneend))
+            elif result:
+                ids.extend(xrange(pos, zoneend))
+            pos = zoneend
+        return ids
 
-        while self._i < len(creader) and not condition(creader[self._i]):
-            self._i += 1
+    def _find_next(self):
+        # Reads chunks until the current chunk has a match left in it or the
+        # column runs out
+        chunksize = self.chunksize
+        doccount = self._doccount
+        while self._pos >= len(self._ids) and self._chunkend < doccount:
+            start = self._chunkend
+            self._chunkend = min(start + chunksize, doccount)
+            self._ids = self._evaluate(start, self._chunkend)
+            self._pos = 0
 
     def is_active(self):
-        return self._i < len(self.creader)
+        return self._pos < len(self._ids)
 
     def next(self):
         if not self.is_active():
             raise ReadTooFar
-        self._i += 1
+        self._pos += 1
+        self._find_next()
+
+    def skip_to(self, id):
+        if not self.is_active():
+            raise ReadTooFar
+        if id <= self.id():
+            return
+
+        if id >= self._chunkend:
+            # Don't bother evaluating the rest of this chunk, start the next
+            # chunk at the target
+            self._chunkend = id
+            self._ids = []
+            self._pos = 0
+        else:
+            self._pos = bisect_left(self._ids, id, self._pos)
         self._find_next()
 
     def reset(self):
-        self._i = 0
+        self._chunkend = 0
+        self._ids = []
+        self._pos = 0
         self._find_next()
 
     def id(self):
-        return self._i
+        return self._ids[self._pos]
+
+    def copy(self):
+        return self.__class__(self.creader, self.condition, self.chunksize,
+                              self._score)
 
     def all_ids(self):
-        condition = self.condition
-        for docnum, v in enumerate(self.creader):
-            if condition(v):
+        chunksize = self.chunksize
+        doccount = self._doccount
+        for start in xrange(0, doccount, chunksize):
+            for docnum in self._evaluate(start, min(start + chunksize,
+                                                    doccount)):
                 yield docnum
 
     def supports(self, astype):
@@ -113,5 +346,7 @@ class ColumnMatcher(ConstantScoreMatcher):
 
     def skip_to_quality(self, minquality):
         if self._score <= minquality:
-            self._i = len(self.creader)
+            self._ids = []
+            self._pos = 0
+            self._chunkend = self._doccount
             return True
@@ -27,7 +27,7 @@
 
 from __future__ import division
 
-from whoosh.compat import b, u
+from whoosh.compat import b, u, xrange
 from whoosh.query import qcore, terms, compound, wrappers
 from whoosh.util.times import datetime_to_long
 
@@ -224,10 +224,22 @@ class NumericRange(RangeMixin, qcore.Query):
 
     >>> # Match numbers from 10 to 5925 in the "number" field.
     >>> nr = NumericRange("number", 10, 5925)
+
+    If the field is sortable, its column records the minimum and maximum
+    value of each run of documents (a "zone map"). With ``usecolumn=True``,
+    when these show that the range only partially covers a small part of a
+    segment (for example, a time window over documents added in time order),
+    ``docs()`` finds the matching documents using the column instead of the
+    index terms. This is only correct if each document's column value is the
+    value it was indexed with, which isn't true for fields with multiple
+    values per document (the column only holds the first one) or custom
+    ``_stored_`` values, so it's off by default.
     """
 
+    usecolumn = False
+
     def __init__(self, fieldname, start, end, startexcl=False, endexcl=False,
-                 boost=1.0, constantscore=True):
+                 boost=1.0, constantscore=True, usecolumn=False):
         """
         :param fieldname: The name of the field to search.
         :param start: Match terms equal to or greater than this number. This
@@ -245,6 +257,9 @@ class NumericRange(RangeMixin, qcore.Query):
             actually scoring the matched terms. This gives a nice speed boost
             and won't affect the results in most cases since numeric ranges
             will almost always be used as a filter.
+        :param usecolumn: if True, ``docs()`` may use the zone map of the
+            field's column instead of the index terms. Only use this for
+            fields with a single value per document.
         """
 
         self.fieldname = fieldname
@@ -254,6 +269,20 @@ class NumericRange(RangeMixin, qcore.Query):
         self.endexcl = endexcl
         self.boost = boost
         self.constantscore = constantscore
+        self.usecolumn = usecolumn
+
+    def __repr__(self):
+        r = RangeMixin.__repr__(self)
+        if self.usecolumn:
+            r = r[:-1] + ", usecolumn=True)"
+        return r
+
+    def __eq__(self, other):
+        return (RangeMixin.__eq__(self, other)
+                and self.usecolumn == other.usecolumn)
+
+    def __hash__(self):
+        return RangeMixin.__hash__(self) ^ hash(self.usecolumn)
 
     def simplify(self, ixreader):
         return self._compile_query(ixreader).simplify(ixreader)
@@ -265,9 +294,75 @@ class NumericRange(RangeMixin, qcore.Query):
         return self._compile_query(ixreader).estimate_min_size(ixreader)
 
     def docs(self, searcher):
-        q = self._compile_query(searcher.reader())
+        reader = searcher.reader()
+        if self.usecolumn and reader.is_atomic():
+            docnums = self._zone_docs(reader)
+            if docnums is not None:
+                return docnums
+
+        q = self._compile_query(reader)
         return q.docs(searcher)
 
+    def _zone_docs(self, ixreader):
+        # If the field's column has a zone map showing that only a small part
+        # of the segment is partially covered by the range (for example, a
+        # time window over documents added in time order), returns a list of
+        # the matching documents found using the column. Otherwise returns
+        # None to indicate the index terms should be used instead
+        from whoosh.fields import NUMERIC
+        from whoosh.query.qcolumns import ColumnMatcher, RangeCondition
+        from whoosh.util.numeric import to_sortable, typecode_max
+
+        fieldname = self.fieldname
+        field = ixreader.schema[fieldname]
+        if (not isinstance(field, NUMERIC)
+                or not ixreader.has_column(fieldname)):
+            return None
+        creader = ixreader.column_reader(fieldname, translate=False)
+        zonesize = creader.zone_size()
+        if not zonesize:
+            return None
+
+        def sortable(x):
+            x = field.prepare_number(x)
+            return to_sortable(field.numtype, field.bits, field.signed, x)
+
+        start = end = None
+        try:
+            if self.start is not None:
+                start = sortable(self.start)
+            if self.end is not None:
+                end = sortable(self.end)
+        except ValueError:
+            return None
+        condition = RangeCondition(start, end, self.startexcl, self.endexcl)
+
+        # Documents without a value have the column's default value. If the
+        # range is open-ended and the default is the largest possible number
+        # (the field's default default), end the range just before it,
+        # otherwise we can't tell documents without a value apart from real
+        # values in the range
+        default = field.column_type.default_value()
+        maxvalue = typecode_max[field.sortable_typecode]
+        if condition(default):
+            if end is not None or default != maxvalue:
+                return None
+            condition = RangeCondition(start, default, self.startexcl, True)
+
+        doccount = len(creader)
+        partial = 0
+        for zonenum in xrange((doccount + zonesize - 1) // zonesize):
+            if condition.zone_test(*creader.zone(zonenum)) is None:
+                partial += zonesize
+        if partial * 2 > doccount:
+            return None
+
+        docnums = ColumnMatcher(creader, condition).all_ids()
+        if ixreader.has_deletions():
+            is_deleted = ixreader.is_deleted
+            return [docnum for docnum in docnums if not is_deleted(docnum)]
+        return list(docnums)
+
     def _compile_query(self, ixreader):
         from whoosh.fields import NUMERIC
         from whoosh.util.numeric import tiered_ranges
@@ -327,7 +422,7 @@ class DateRange(NumericRange):
     """
 
     def __init__(self, fieldname, start, end, startexcl=False, endexcl=False,
-                 boost=1.0, constantscore=True):
+                 boost=1.0, constantscore=True, usecolumn=False):
         self.startdate = start
         self.enddate = end
         if start:
@@ -337,7 +432,8 @@ class DateRange(NumericRange):
         super(DateRange, self).__init__(fieldname, start, end,
                                         startexcl=startexcl, endexcl=endexcl,
                                         boost=boost,
-                                        constantscore=constantscore)
+                                        constantscore=constantscore,
+                                        usecolumn=usecolumn)
 
     def __repr__(self):
         return '%s(%r, %r, %r, %s, %s, boost=%s)' % (self.__class__.__name__,
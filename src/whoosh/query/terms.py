@@ -356,7 +356,31 @@ class Wildcard(PatternQuery):
         else:
             return PatternQuery.matcher(self, searcher, context)
 
-    # _btexts() implemented in PatternQuery
+    def _btexts(self, ixreader):
+        field = ixreader.schema[self.fieldname]
+        text = self.text
+        # The glob automaton doesn't support the full fnmatch character range
+        # syntax, and when a star is followed by more of the pattern there is
+        # no "next valid string" for the DFA to leap to (any number of
+        # low characters could come before the rest of the pattern), so fall
+        # back to scanning the terms with a regular expression
+        if ("[" in text or "*" in text.rstrip("*")
+                or field.self_parsing()):
+            return PatternQuery._btexts(self, ixreader)
+
+        from whoosh.automata.glob import glob_automaton
+        from whoosh.codec.base import Automata
+
+        # Intersect the pattern's DFA with each segment's term dictionary,
+        # using the DFA to jump over runs of terms that can't match
+        dfa = glob_automaton(text).to_dfa()
+        to_bytes = field.to_bytes
+        btexts = set()
+        for r, _ in ixreader.leaf_readers():
+            cur = r.cursor(self.fieldname)
+            for word in Automata.find_matches(dfa, cur):
+                btexts.add(to_bytes(word))
+        return sorted(btexts)
 
 
 class Regex(PatternQuery):
@@ -333,11 +333,13 @@ class IndexReader(object):
         raise NotImplementedError
 
     @abstractmethod
-    def stored_fields(self, docnum):
+    def stored_fields(self, docnum, fieldnames=None):
         """Returns the stored fields for the given document number.
 
-        :param numerickeys: use field numbers as the dictionary keys instead of
-            field names.
+        :param fieldnames: an optional list of field names. If this is not
+            None, the returned dictionary only contains these fields (the ones
+            the document has values for). Depending on the codec, this can be
+            much faster than loading all the stored fields.
         """
 
         raise NotImplementedError
@@ -446,6 +448,28 @@ class IndexReader(object):
 
         raise NotImplementedError
 
+    def docs_for_terms(self, fieldname, texts):
+        """Returns a set of the undeleted document numbers containing any of
+        the given terms in the given field. This is faster than getting the
+        postings of each term separately, for example to find the documents
+        to replace with a batch of updates.
+
+        :param fieldname: the name of the field to look up the terms in.
+        :param texts: an iterable of term texts (or term bytes).
+        """
+
+        if fieldname not in self.schema:
+            return set()
+        field = self.schema[fieldname]
+        docs = set()
+        for tbytes in sorted(set(field.to_bytes(t) for t in texts)):
+            try:
+                m = self.postings(fieldname, tbytes)
+            except TermNotFound:
+                continue
+            docs.update(m.all_ids())
+        return docs
+
     @abstractmethod
     def has_vector(self, docnum, fieldname):
         """Returns True if the given document has a term vector for the given
@@ -570,6 +594,16 @@ class IndexReader(object):
     def supports_caches(self):
         return False
 
+    def set_block_cache(self, cache):
+        """Shares decoded posting blocks with other readers through the given
+        cache object (such as a :class:`whoosh.util.cache.LRUCache`). Pass
+        ``True`` to use the process-wide cache returned by
+        :func:`whoosh.codec.base.shared_block_cache`, or None to stop caching
+        blocks. Readers that don't support caching blocks ignore this.
+        """
+
+        pass
+
     def has_column(self, fieldname):
         return False
 
@@ -594,13 +628,16 @@ class IndexReader(object):
 # Segment-based reader
 
 class SegmentReader(IndexReader):
-    def __init__(self, storage, schema, segment, generation=None, codec=None):
+    def __init__(self, storage, schema, segment, generation=None, codec=None,
+                 blockcache=None):
         self.schema = schema
         self.is_closed = False
 
         self._segment = segment
         self._segid = self._segment.segment_id()
         self._gen = generation
+        # Keep the storage the segment is in, so reopen() can open it again
+        self._mainstorage = storage
 
         # self.files is a storage object from which to load the segment files.
         # This is different from the general storage (which will be used for
@@ -619,13 +656,34 @@ class SegmentReader(IndexReader):
         self._codec = codec if codec else segment.codec()
         self._terms = self._codec.terms_reader(self._storage, segment)
         self._perdoc = self._codec.per_document_reader(self._storage, segment)
+        # Bloom filters of the terms in unique fields, loaded the first time
+        # they're needed
+        self._blooms = None
+        if blockcache is not None:
+            self.set_block_cache(blockcache)
 
     def codec(self):
         return self._codec
 
+    def set_block_cache(self, cache):
+        if cache is True:
+            from whoosh.codec.base import shared_block_cache
+            cache = shared_block_cache()
+        elif cache is False:
+            cache = None
+        self._terms.set_block_cache(cache, self._segid)
+
     def segment(self):
         return self._segment
 
+    def reopen(self):
+        """Returns a new reader for the same segment, with its own open files,
+        so it can still be used after this reader is closed.
+        """
+
+        return self.__class__(self._mainstorage, self.schema, self._segment,
+                              generation=self._gen, codec=self._codec)
+
     def storage(self):
         return self._storage
 
@@ -663,8 +721,21 @@ class SegmentReader(IndexReader):
         if fieldname not in self.schema:
             return False
         text = self._text_to_bytes(fieldname, text)
+        if not self._may_contain(fieldname, text):
+            return False
         return (fieldname, text) in self._terms
 
+    def _may_contain(self, fieldname, tbytes):
+        # Returns False if the segment's Bloom filter for the field shows the
+        # term can't be in this segment, so looking for it in the term
+        # dictionary can be skipped
+        blooms = self._blooms
+        if blooms is None:
+            blooms = self._blooms = self._codec.bloom_filters(self._storage,
+                                                              self._segment)
+        bloom = blooms.get(fieldname)
+        return bloom is None or tbytes in bloom
+
     def close(self):
         if self.is_closed:
             raise ReaderClosed("Reader already closed")
@@ -678,12 +749,15 @@ class SegmentReader(IndexReader):
 
         self.is_closed = True
 
-    def stored_fields(self, docnum):
+    def stored_fields(self, docnum, fieldnames=None):
         if self.is_closed:
             raise ReaderClosed
         assert docnum >= 0
         schema = self.schema
-        sfs = self._perdoc.stored_fields(docnum)
+        if fieldnames is None:
+            sfs = self._perdoc.stored_fields(docnum)
+        else:
+            sfs = self._perdoc.stored_fields(docnum, fieldnames=fieldnames)
         # Double-check with schema to filter out removed fields
         return dict(item for item in iteritems(sfs) if item[0] in schema)
 
@@ -760,6 +834,8 @@ class SegmentReader(IndexReader):
     def term_info(self, fieldname, text):
         self._test_field(fieldname)
         text = self._text_to_bytes(fieldname, text)
+        if not self._may_contain(fieldname, text):
+            raise TermNotFound("%s:%r" % (fieldname, text))
         try:
             return self._terms.term_info(fieldname, text)
         except KeyError:
@@ -814,6 +890,8 @@ class SegmentReader(IndexReader):
         if fieldname not in self.schema:
             raise TermNotFound("No  field %r" % fieldname)
         text = self._text_to_bytes(fieldname, text)
+        if not self._may_contain(fieldname, text):
+            raise TermNotFound("%s:%r" % (fieldname, text))
         format_ = self.schema[fieldname].format
         matcher = self._terms.matcher(fieldname, text, format_, scorer=scorer)
         deleted = frozenset(self._perdoc.deleted_docs())
@@ -821,6 +899,29 @@ class SegmentReader(IndexReader):
             matcher = FilterMatcher(matcher, deleted, exclude=True)
         return matcher
 
+    def docs_for_terms(self, fieldname, texts):
+        if self.is_closed:
+            raise ReaderClosed
+        if fieldname not in self.schema:
+            return set()
+        field = self.schema[fieldname]
+        terms = self._terms
+        docs = set()
+        # Look the terms up in sorted order, so the reads from the term
+        # dictionary move forward through the file, and only check for deleted
+        # documents once at the end, instead of filtering each term's postings
+        for tbytes in sorted(set(field.to_bytes(t) for t in texts)):
+            if not self._may_contain(fieldname, tbytes):
+                continue
+            try:
+                m = terms.matcher(fieldname, tbytes, field.format)
+            except (KeyError, TermNotFound):
+                continue
+            docs.update(m.all_ids())
+        if docs and self._perdoc.has_deletions():
+            docs.difference_update(self._perdoc.deleted_docs())
+        return docs
+
     def vector(self, docnum, fieldname, format_=None):
         if self.is_closed:
             raise ReaderClosed
@@ -929,7 +1030,7 @@ class EmptyReader(IndexReader):
     def is_deleted(self, docnum):
         return False
 
-    def stored_fields(self, docnum):
+    def stored_fields(self, docnum, fieldnames=None):
         raise KeyError("No document number %s" % docnum)
 
     def all_stored_fields(self):
@@ -1007,6 +1108,14 @@ class MultiReader(IndexReader):
     def cursor(self, fieldname):
         return MultiCursor([r.cursor(fieldname) for r in self.readers])
 
+    def terms_within(self, fieldname, text, maxdist, prefix=0):
+        # Use each sub-reader's (DFA-based) implementation instead of the
+        # base class's scan over the merged word list
+        words = set()
+        for r in self.readers:
+            words.update(r.terms_within(fieldname, text, maxdist, prefix))
+        return words
+
     def is_atomic(self):
         return False
 
@@ -1018,6 +1127,10 @@ class MultiReader(IndexReader):
         self.doc_offsets.append(self.base)
         self.base += reader.doc_count_all()
 
+    def set_block_cache(self, cache):
+        for r in self.readers:
+            r.set_block_cache(cache)
+
     def close(self):
         for d in self.readers:
             d.close()
@@ -1143,6 +1256,14 @@ class MultiReader(IndexReader):
 
         return MultiMatcher(postreaders, docoffsets)
 
+    def docs_for_terms(self, fieldname, texts):
+        texts = list(texts)
+        docs = set()
+        for r, offset in self.leaf_readers():
+            docs.update(offset + docnum for docnum
+                        in r.docs_for_terms(fieldname, texts))
+        return docs
+
     def first_id(self, fieldname, text):
         for i, r in enumerate(self.readers):
             try:
@@ -1166,9 +1287,10 @@ class MultiReader(IndexReader):
         segmentnum, segmentdoc = self._segment_and_docnum(docnum)
         return self.readers[segmentnum].is_deleted(segmentdoc)
 
-    def stored_fields(self, docnum):
+    def stored_fields(self, docnum, fieldnames=None):
         segmentnum, segmentdoc = self._segment_and_docnum(docnum)
-        return self.readers[segmentnum].stored_fields(segmentdoc)
+        return self.readers[segmentnum].stored_fields(segmentdoc,
+                                                      fieldnames=fieldnames)
 
     # Columns
 
@@ -32,13 +32,17 @@
 from __future__ import division
 import copy
 import weakref
+from array import array
 from math import ceil
+from threading import Lock
 
 from whoosh import classify, highlight, query, scoring
 from whoosh.compat import iteritems, itervalues, iterkeys, xrange
-from whoosh.idsets import DocIdSet, BitSet
+from whoosh.idsets import DocIdSet, BitSet, MultiIdSet, SortedIntSet
 from whoosh.reading import TermNotFound
-from whoosh.util.cache import lru_cache
+from whoosh.util.cache import LRUCache, lru_cache
+from whoosh.util import now
+from whoosh.util.numeric import bytes_for_bits
 
 
 class NoTermsException(Exception):
@@ -96,6 +100,226 @@ class SearchContext(object):
         return ctx
 
 
+# Filter caches
+
+# Maximum total size (in bytes) of the document sets in the process-wide filter
+# cache
+SHARED_FILTER_CACHE_SIZE = 64 * 1024 * 1024
+# Maximum total size (in bytes) of the document sets in the filter cache a
+# searcher creates for itself
+FILTER_CACHE_SIZE = 8 * 1024 * 1024
+
+_filter_cache = None
+_filter_cache_lock = Lock()
+
+
+def _idset_size(idset):
+    # Returns the approximate size in bytes of a cached filter set
+    if isinstance(idset, SortedIntSet):
+        return idset.size()
+    return idset.byte_count()
+
+
+def filter_cache(maxsize=FILTER_CACHE_SIZE):
+    """Returns a new :class:`whoosh.util.cache.LRUCache` for the per-segment
+    document sets of filter queries, which holds up to ``maxsize`` bytes of
+    sets. See the ``filtercache`` argument of :class:`Searcher`.
+    """
+
+    return LRUCache(maxsize, sizefn=_idset_size)
+
+
+def shared_filter_cache():
+    """Returns the process-wide filter cache, which is used by searchers
+    created with ``filtercache=True``. The cache holds up to
+    ``SHARED_FILTER_CACHE_SIZE`` bytes of document sets.
+    """
+
+    global _filter_cache
+
+    with _filter_cache_lock:
+        if _filter_cache is None:
+            _filter_cache = filter_cache(SHARED_FILTER_CACHE_SIZE)
+        return _filter_cache
+
+
+# Result caches
+
+# Maximum total size (in bytes) of the entries in the process-wide result cache
+SHARED_RESULT_CACHE_SIZE = 32 * 1024 * 1024
+# Maximum total size (in bytes) of the entries in a result cache created with
+# the result_cache() function's defaults
+RESULT_CACHE_SIZE = 4 * 1024 * 1024
+
+# Keyword arguments to Searcher.search() whose results can be cached. Searches
+# using other arguments (such as terms=True or collapse) attach extra
+# information to the results, so they always run
+_CACHEABLE_ARGS = frozenset(("limit", "sortedby", "reverse", "groupedby",
+                             "optimize", "filter", "mask", "maptype",
+                             "scored", "after"))
+
+_result_cache = None
+_result_cache_lock = Lock()
+
+
+class CachedResults(object):
+    """The compact form of a :class:`Results` object kept in a result cache
+    (see :func:`result_cache`). The document numbers and scores of the top N
+    documents are stored in arrays, and the set of matching documents (if the
+    search computed it) in a sorted array.
+    """
+
+    __slots__ = ("docnums", "scores", "docset", "total", "offset",
+                 "facetmaps", "filtered_count", "size")
+
+    def __init__(self, results):
+        top_n = results.top_n
+        self.docnums = array("I", [docnum for _, docnum in top_n])
+        scores = [score for score, _ in top_n]
+        if all(type(score) is float for score in scores):
+            self.scores = array("d", scores)
+        else:
+            # Sort keys or missing scores
+            self.scores = tuple(scores)
+
+        docset = results.docset
+        if docset is not None:
+            self.docset = array("I", sorted(docset))
+        else:
+            self.docset = None
+
+        if results.has_exact_length():
+            self.total = len(results)
+        else:
+            self.total = None
+        self.offset = results.offset
+
+        self.facetmaps = dict(results._facetmaps)
+        # The number of documents removed by the filter and mask, if the search
+        # had either
+        self.filtered_count = getattr(results, "filtered_count", None)
+
+        size = len(self.docnums) * 12
+        if docset is not None:
+            size += len(self.docset) * 4
+        for fm in itervalues(self.facetmaps):
+            for value in itervalues(fm.as_dict()):
+                size += len(value) * 4 if isinstance(value, list) else 8
+        self.size = size
+
+    def results(self, searcher, q, kwargs):
+        """Returns a new :class:`Results` object for the given searcher,
+        query, and search keyword arguments based on this cached entry.
+        """
+
+        top_n = list(zip(self.scores, self.docnums))
+        docset = set(self.docset) if self.docset is not None else None
+        r = Results(searcher, q, top_n, docset=docset,
+                    facetmaps=dict(self.facetmaps))
+        r._total = self.total
+        r.offset = self.offset
+        if self.filtered_count is not None:
+            r.filtered_count = self.filtered_count
+            r.allowed = kwargs.get("filter")
+            r.restricted = kwargs.get("mask")
+        # If something needs the collector, or the number or set of matching
+        # documents the entry doesn't have, the results re-run the search
+        r._search_kwargs = kwargs
+        return r
+
+
+def result_cache(maxsize=RESULT_CACHE_SIZE):
+    """Returns a new :class:`whoosh.util.cache.LRUCache` for the results of
+    searches, which holds up to about ``maxsize`` bytes of
+    :class:`CachedResults` entries. See the ``resultcache`` argument of
+    :class:`Searcher`.
+
+    Use the cache's ``cache_info()`` method to get its hit and miss counts.
+    """
+
+    return LRUCache(maxsize, sizefn=lambda entry: entry.size)
+
+
+def shared_result_cache():
+    """Returns the process-wide result cache, which is used by searchers
+    created with ``resultcache=True``. The cache holds up to about
+    ``SHARED_RESULT_CACHE_SIZE`` bytes of entries.
+    """
+
+    global _result_cache
+
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = result_cache(SHARED_RESULT_CACHE_SIZE)
+        return _result_cache
+
+
+def _freeze(value):
+    # Converts lists and dictionaries in a search argument into tuples so the
+    # argument can be part of a cache key
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    elif isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in iteritems(value)))
+    return value
+
+
+def _segment_state(segment):
+    # Identifies a version of a segment: its documents never change, but
+    # documents can be deleted and undeleted, so the key includes the
+    # segment's deletion version (which is cheap to get and small, unlike the
+    # set of deleted documents)
+    return (segment.segment_id(), segment.deletion_version())
+
+
+# Concurrent searching functions
+
+def _collect_leaf(collector):
+    # Collects the matches in the segment the collector was set up for, and
+    # returns what it collected
+    try:
+        collector.collect_matches()
+    finally:
+        collector.finish()
+    return collector.state()
+
+
+# Readers opened by worker processes, keyed by storage and index name, so each
+# search in a worker only has to open the segments that changed
+_process_readers = {}
+
+
+def _search_leaf_in_process(storage, indexname, generation, leafnum, q,
+                            collector, context):
+    # Searches one segment of an index in a worker process. The worker opens
+    # the whole index generation, since scoring needs the statistics of the
+    # whole index
+    from whoosh.index import FileIndex, TOC
+
+    key = (repr(storage), indexname)
+    reader = _process_readers.get(key)
+    if reader is None or reader.generation() != generation:
+        toc = TOC.read(storage, indexname, gen=generation)
+        reader = FileIndex._reader(storage, toc.schema, toc.segments,
+                                   generation, reuse=reader)
+        _process_readers[key] = reader
+
+    searcher = Searcher(reader, weighting=context.weighting or scoring.BM25F,
+                        closereader=False)
+    subsearcher, offset = searcher.leaf_searchers()[leafnum]
+    collector.prepare(searcher, q, context)
+    collector.set_subsearcher(subsearcher, offset)
+    return _collect_leaf(collector)
+
+
+def _is_process_pool(executor):
+    try:
+        from concurrent.futures import ProcessPoolExecutor
+    except ImportError:
+        return False
+    return isinstance(executor, ProcessPoolExecutor)
+
+
 # Searcher class
 
 class Searcher(object):
@@ -104,7 +328,8 @@ class Searcher(object):
     """
 
     def __init__(self, reader, weighting=scoring.BM25F, closereader=True,
-                 fromindex=None, parent=None):
+                 fromindex=None, parent=None, blockcache=None, executor=None,
+                 filtercache=None, resultcache=None):
         """
         :param reader: An :class:`~whoosh.reading.IndexReader` object for
             the index to search.
@@ -115,12 +340,38 @@ class Searcher(object):
         :param fromindex: An optional reference to the index of the underlying
             reader. This is required for :meth:`Searcher.up_to_date` and
             :meth:`Searcher.refresh` to work.
+        :param blockcache: a cache object (such as a
+            :class:`whoosh.util.cache.LRUCache`) to share decoded posting
+            blocks with other searchers, or ``True`` to use the process-wide
+            cache. See :meth:`whoosh.reading.IndexReader.set_block_cache`.
+        :param executor: an executor object such as a
+            ``concurrent.futures.ThreadPoolExecutor``, to search the segments
+            of a multi-segment index concurrently. See
+            :meth:`Searcher.search_with_collector`.
+        :param filtercache: a cache object (see :func:`filter_cache`) to hold
+            the sets of documents matching the ``filter`` and ``mask`` queries
+            of searches, or ``True`` to use the process-wide cache returned by
+            :func:`shared_filter_cache`. The sets are cached per segment, so
+            when the index changes only the sets of new segments, or segments
+            whose deletions changed, are computed again. By default the
+            searcher creates its own cache, which :meth:`Searcher.refresh`
+            passes on to the new searcher.
+        :param resultcache: a cache object (see :func:`result_cache`) to hold
+            the results of calls to :meth:`Searcher.search` and
+            :meth:`Searcher.search_page`, or ``True`` to use the process-wide
+            cache returned by :func:`shared_result_cache`. Repeating a search
+            on the same version of the index then returns the cached results
+            without running the query. By default results are not cached.
         """
 
         self.ixreader = reader
         self.is_closed = False
         self._closereader = closereader
         self._ix = fromindex
+        self._blockcache = blockcache
+        self._executor = executor
+        if blockcache is not None and not parent:
+            reader.set_block_cache(blockcache)
         self._doccount = self.ixreader.doc_count_all()
         # Cache for PostingCategorizer objects (supports fields without columns)
         self._field_caches = {}
@@ -130,11 +381,19 @@ class Searcher(object):
             self.schema = parent.schema
             self._idf_cache = parent._idf_cache
             self._filter_cache = parent._filter_cache
+            self._result_cache = parent._result_cache
         else:
             self.parent = None
             self.schema = self.ixreader.schema
             self._idf_cache = {}
-            self._filter_cache = {}
+            if filtercache is True:
+                filtercache = shared_filter_cache()
+            elif filtercache is None:
+                filtercache = filter_cache()
+            self._filter_cache = filtercache
+            if resultcache is True:
+                resultcache = shared_result_cache()
+            self._result_cache = resultcache
 
         if type(weighting) is type:
             self.weighting = weighting()
@@ -250,7 +509,11 @@ class Searcher(object):
         self.is_closed = True
         newreader = self._ix.reader(reuse=self.ixreader)
         return self.__class__(newreader, fromindex=self._ix,
-                              weighting=self.weighting)
+                              weighting=self.weighting,
+                              blockcache=self._blockcache,
+                              executor=self._executor,
+                              filtercache=self._filter_cache,
+                              resultcache=self._result_cache)
 
     def close(self):
         if self._closereader:
@@ -444,7 +707,42 @@ class Searcher(object):
         return delset
 
     def _query_to_comb(self, fq):
-        return BitSet(self.docs_for_query(fq), size=self.doc_count_all())
+        # Combines the (cached) sets of matching documents in each segment
+        leaves = self.leaf_searchers()
+        idsets = [s._segment_filter(fq) for s, _ in leaves]
+        if len(idsets) == 1:
+            return idsets[0]
+        return MultiIdSet(idsets, [offset for _, offset in leaves])
+
+    def _segment_filter(self, fq):
+        # Returns a set of the documents in this atomic searcher matching the
+        # given filter query. The sets are cached by the segment ID and
+        # deletion version (see _segment_state)
+        cache = self._filter_cache
+        segment = self.reader().segment()
+        key = None
+        if segment is not None:
+            key = (_segment_state(segment), fq)
+            try:
+                idset = cache.get(key)
+            except TypeError:
+                # The query isn't hashable
+                key = None
+            else:
+                if idset is not None:
+                    return idset
+
+        doccount = self.doc_count_all()
+        docnums = array("I", fq.docs(self))
+        # Keep whichever of a sorted array and a bit set is smaller
+        if len(docnums) * docnums.itemsize < bytes_for_bits(doccount):
+            idset = SortedIntSet(docnums)
+        else:
+            idset = BitSet(docnums, size=doccount)
+
+        if key is not None:
+            cache.put(key, idset)
+        return idset
 
     def _filter_to_comb(self, obj):
         if obj is None:
@@ -639,6 +937,40 @@ class Searcher(object):
         results = self.search(query, limit=pagenum * pagelen, **kwargs)
         return ResultsPage(results, pagenum, pagelen)
 
+    def search_after(self, query, after=None, pagelen=10, **kwargs):
+        """Like :meth:`Searcher.search_page`, but returns the page of results
+        following a cursor instead of a page number. Use the
+        :meth:`ResultsPage.cursor` of a page to get the next page::
+
+            page = searcher.search_after(query, pagelen=100)
+            while page.pagelen:
+                for hit in page:
+                    print(hit["title"])
+                page = searcher.search_after(query, page.cursor(),
+                                             pagelen=100)
+
+        Unlike :meth:`Searcher.search_page`, which has to collect every hit up
+        to the end of the requested page, this method only keeps the
+        ``pagelen`` hits after the cursor, so getting a page deep in the
+        results costs about the same as getting the first page.
+
+        Any additional keyword arguments you supply are passed through to
+        :meth:`Searcher.search`, and should be the same for every page. The
+        results can be scored or sorted with ``sortedby`` (only sorted results
+        can use ``reverse``).
+
+        :param query: the :class:`whoosh.query.Query` object to match.
+        :param after: the cursor returned by the :meth:`ResultsPage.cursor`
+            method of the previous page, or None to get the first page. You can
+            also pass a ``(score, docnum)`` tuple for a scored search or a
+            ``(sortkey, docnum)`` tuple for a sorted search.
+        :param pagelen: the number of results per page.
+        :returns: :class:`ResultsPage`
+        """
+
+        results = self.search(query, limit=pagelen, after=after, **kwargs)
+        return ResultsPage(results, None, pagelen)
+
     def find(self, defaultfield, querystring, **kwargs):
         from whoosh.qparser import QueryParser
         qp = QueryParser(defaultfield, schema=self.ixreader.schema)
@@ -666,10 +998,77 @@ class Searcher(object):
             for docnum in method(self):
                 yield docnum
 
+    def scan(self, q, fields=None, columns=False, batch=1000, filter=None,
+             mask=None):
+        """Yields the documents matching the given query in batches, without
+        collecting the results first. Each batch is a list of up to ``batch``
+        ``(docnum, fields_dict)`` tuples, in document number order. This is
+        useful for exporting all the matches of a query, where a search with
+        ``limit=None`` would hold every match in memory::
+
+            for batch in searcher.scan(myquery, fields=["path", "title"]):
+                for docnum, fields in batch:
+                    export(fields)
+
+        The segments are searched one at a time, unscored, and the stored
+        fields of each segment are read in order.
+
+        :param q: a :class:`whoosh.query.Query` object to use to match
+            documents.
+        :param fields: an optional list of the names of the fields to load. By
+            default all stored fields (or all columns, see ``columns``) are
+            loaded.
+        :param columns: if True, get the values of the fields from their
+            columns (see :doc:`/facets`) instead of the stored fields.
+        :param batch: the maximum number of documents in each batch.
+        :param filter: a query, Results object, or set of docnums. Only
+            documents that are also in the filter object are yielded.
+        :param mask: a query, Results object, or set of docnums. Documents
+            that are in the mask object are not yielded.
+        """
+
+        if batch < 1:
+            raise ValueError("batch must be >= 1")
+        if columns and fields is None:
+            fields = [name for name, fieldobj in self.schema.items()
+                      if fieldobj.column_type]
+
+        allow = self._filter_to_comb(filter)
+        restrict = self._filter_to_comb(mask)
+
+        items = []
+        for s, offset in self.leaf_searchers():
+            if columns:
+                reader = s.reader()
+                creaders = [(name, reader.column_reader(name, translate=True))
+                            for name in fields]
+            else:
+                stored_fields = s.stored_fields
+
+            for docnum in q.docs(s):
+                global_docnum = offset + docnum
+                if ((allow is not None and global_docnum not in allow)
+                    or (restrict is not None and global_docnum in restrict)):
+                    continue
+
+                if columns:
+                    values = dict((name, creader[docnum])
+                                  for name, creader in creaders)
+                else:
+                    values = stored_fields(docnum, fieldnames=fields)
+                items.append((global_docnum, values))
+
+                if len(items) >= batch:
+                    yield items
+                    items = []
+
+        if items:
+            yield items
+
     def collector(self, limit=10, sortedby=None, reverse=False, groupedby=None,
                   collapse=None, collapse_limit=1, collapse_order=None,
                   optimize=True, filter=None, mask=None, terms=False,
-                  maptype=None, scored=True):
+                  maptype=None, scored=True, after=None):
         """Low-level method: returns a configured
         :class:`whoosh.collectors.Collector` object based on the given
         arguments. You can use this object with
@@ -703,11 +1102,20 @@ class Searcher(object):
         if limit is not None and limit < 1:
             raise ValueError("limit must be >= 1")
 
-        if not scored and not sortedby:
+        if after is not None and not sortedby:
+            # Searching after a cursor needs the scored order
+            if not limit:
+                raise ValueError("Searching after a cursor requires a limit")
+            if reverse:
+                raise ValueError("Searching after a cursor can't reverse "
+                                 "scored results")
+            c = collectors.TopCollector(limit, usequality=optimize,
+                                        after=after)
+        elif not scored and not sortedby:
             c = collectors.UnsortedCollector()
         elif sortedby:
             c = collectors.SortingCollector(sortedby, limit=limit,
-                                            reverse=reverse)
+                                            reverse=reverse, after=after)
         elif groupedby or reverse or not limit or limit >= self.doc_count():
             # A collector that gathers every matching document
             c = collectors.UnlimitedCollector(reverse=reverse)
@@ -776,8 +1184,34 @@ class Searcher(object):
             to control which documents are kept when collapsing. The default
             (``collapse_order=None``) uses the results order (e.g. the highest
             scoring documents in a scored search).
+        :param after: a cursor from :meth:`ResultsPage.cursor`, or a
+            ``(score, docnum)`` tuple for a scored search or a
+            ``(sortkey, docnum)`` tuple for a sorted search. The results only
+            contain the documents ranked after this position. See
+            :meth:`Searcher.search_after`.
         :rtype: :class:`Results`
-        """
+
+        If the searcher has a result cache (see the ``resultcache`` argument
+        of :class:`Searcher`), the results are looked up in the cache first.
+        Only searches whose ``filter`` and ``mask`` (if any) are queries, and
+        which don't use ``terms`` or ``collapse``, are cached. The query is
+        looked up as given, without normalizing it (which would cost about as
+        much as some searches), so equivalent queries written differently are
+        cached separately. Results from the cache don't have a ``collector``
+        until something asks for it, which runs the search again.
+        """
+
+        cache = self._result_cache
+        key = None
+        if cache is not None:
+            key = self._result_cache_key(q, kwargs)
+            if key is not None:
+                t = now()
+                entry = cache.get(key)
+                if entry is not None:
+                    r = entry.results(self, q, kwargs)
+                    r.runtime = now() - t
+                    return r
 
         # Call the collector() method to build a collector based on the
         # parameters passed to this method
@@ -785,7 +1219,42 @@ class Searcher(object):
         # Call the lower-level method to run the collector
         self.search_with_collector(q, c)
         # Return the results object from the collector
-        return c.results()
+        r = c.results()
+        if key is not None:
+            cache.put(key, CachedResults(r))
+        return r
+
+    def _result_cache_key(self, q, kwargs):
+        # Returns the key of the results of the given search in the result
+        # cache, or None if the results can't be cached
+        if not _CACHEABLE_ARGS.issuperset(kwargs):
+            return None
+        for name in ("filter", "mask"):
+            obj = kwargs.get(name)
+            if obj is not None and not isinstance(obj, query.Query):
+                return None
+
+        # The segment IDs and deleted documents identify this version of the
+        # index (unlike the generation number, which is only unique within one
+        # index)
+        state = []
+        for s, _ in self.leaf_searchers():
+            segment = s.reader().segment()
+            if segment is None:
+                return None
+            state.append(_segment_state(segment))
+
+        # Use the query as given, since normalizing it on every search would
+        # cost more than the lookup saves for cheap queries. Equivalent queries
+        # written differently just get separate entries
+        w = self.weighting
+        key = (q, _freeze(sorted(iteritems(kwargs))),
+               type(w), _freeze(w.__dict__), tuple(state))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
 
     def search_with_collector(self, q, collector, context=None):
         """Low-level method: runs a :class:`whoosh.query.Query` object on this
@@ -809,6 +1278,16 @@ class Searcher(object):
             documents.
         :param collector: a :class:`whoosh.collectors.Collector` object to feed
             the results into.
+
+        If the searcher was created with an ``executor`` and the index has
+        more than one segment, the segments are searched concurrently, as long
+        as the collector supports it (see
+        :meth:`whoosh.collectors.Collector.can_merge`). With a
+        thread pool, the matchers are created on this thread and the workers
+        collect the matches. With a ``concurrent.futures.ProcessPoolExecutor``,
+        each worker process opens the segments of the searcher's index
+        generation itself (reusing them between searches), so the searcher
+        must have been opened from an on-disk index.
         """
 
         # Get the search context object from the searcher
@@ -816,7 +1295,47 @@ class Searcher(object):
         # Allow collector to set up based on the top-level information
         collector.prepare(self, q, context)
 
-        collector.run()
+        if (self._executor is not None and len(self.leaf_searchers()) > 1
+                and collector.can_merge()):
+            self._run_concurrently(q, collector, context)
+        else:
+            collector.run()
+
+    def _run_concurrently(self, q, collector, context):
+        executor = self._executor
+        futures = []
+        try:
+            if _is_process_pool(executor):
+                if self._ix is None or not hasattr(self._ix, "storage"):
+                    raise Exception("Searching in worker processes requires "
+                                    "a searcher opened from an index")
+                storage = self._ix.storage
+                indexname = self._ix.indexname
+                generation = self.ixreader.generation()
+                for leafnum in xrange(len(self.leaf_searchers())):
+                    futures.append(executor.submit(
+                        _search_leaf_in_process, storage, indexname,
+                        generation, leafnum, q, collector.copy(), context
+                    ))
+            else:
+                # Create all the matchers on this thread before starting the
+                # workers, since creating a matcher may read statistics from
+                # the other segments
+                copies = []
+                for subsearcher, offset in self.leaf_searchers():
+                    c = collector.copy()
+                    c.prepare(self, q, context)
+                    c.set_subsearcher(subsearcher, offset)
+                    copies.append(c)
+                for c in copies:
+                    futures.append(executor.submit(_collect_leaf, c))
+
+            for future in futures:
+                collector.merge_state(future.result())
+        finally:
+            for future in futures:
+                future.cancel()
+            collector.finish()
 
     def correct_query(self, q, qstring, correctors=None, terms=None, maxdist=2,
                       prefix=0, aliases=None):
@@ -960,9 +1479,14 @@ class Results(object):
         self._facetmaps = facetmaps or {}
         self.runtime = runtime
         self.highlighter = highlighter or highlight.Highlighter()
-        self.collector = None
+        self._collector = None
         self._total = None
         self._char_cache = {}
+        # The number of matching documents ranked before the first document
+        # in top_n (when searching after a cursor)
+        self.offset = 0
+        # The search arguments of results from a result cache
+        self._search_kwargs = None
 
     def __repr__(self):
         return "<Top %s Results for %r runtime=%s>" % (len(self.top_n),
@@ -984,7 +1508,7 @@ class Results(object):
         """
 
         if self._total is None:
-            self._total = self.collector.count()
+            self._total = self._get_collector().count()
         return self._total
 
     def __getitem__(self, n):
@@ -1029,13 +1553,17 @@ class Results(object):
 
         return ((docnum, score) for score, docnum in self.top_n)
 
-    def fields(self, n):
+    def fields(self, n, fieldnames=None):
         """Returns the stored fields for the document at the ``n`` th position
         in the results. Use :meth:`Results.docnum` if you want the raw
         document number instead of the stored fields.
+
+        :param fieldnames: an optional list of the names of the fields to
+            load. By default all stored fields are returned.
         """
 
-        return self.searcher.stored_fields(self.top_n[n][1])
+        return self.searcher.stored_fields(self.top_n[n][1],
+                                           fieldnames=fieldnames)
 
     def facet_names(self):
         """Returns the available facet names, for use with the ``groups()``
@@ -1099,8 +1627,8 @@ class Results(object):
         of matching documents.
         """
 
-        if self.collector:
-            return self.collector.computes_count()
+        if self._collector:
+            return self._collector.computes_count()
         else:
             return self._total is not None
 
@@ -1146,9 +1674,25 @@ class Results(object):
         """
 
         if self.docset is None:
-            self.docset = set(self.collector.all_ids())
+            self.docset = set(self._get_collector().all_ids())
         return self.docset
 
+    def _get_collector(self):
+        # Results from a result cache don't have a collector, so re-run the
+        # search the first time one is needed
+        if self._collector is None and self._search_kwargs is not None:
+            c = self.searcher.collector(**self._search_kwargs)
+            self.searcher.search_with_collector(self.q, c)
+            self._collector = c
+        return self._collector
+
+    def _set_collector(self, collector):
+        self._collector = collector
+
+    # Results taken from a result cache don't keep their collector, so
+    # reading this attribute on them runs the search again to get one
+    collector = property(_get_collector, _set_collector)
+
     def copy(self):
         """Returns a deep copy of this results object.
         """
@@ -1502,9 +2046,19 @@ class Hit(object):
     def __iter__(self):
         return iterkeys(self.fields())
 
+    def _stored(self, fieldname):
+        # If all the stored fields haven't been loaded, only load the one we
+        # need (the per-document reader caches recently read documents, so
+        # getting several fields one at a time is still cheap)
+        if self._fields is not None:
+            return self._fields
+        return self.searcher.stored_fields(self.docnum,
+                                           fieldnames=(fieldname,))
+
     def __getitem__(self, fieldname):
-        if fieldname in self.fields():
-            return self._fields[fieldname]
+        sfs = self._stored(fieldname)
+        if fieldname in sfs:
+            return sfs[fieldname]
 
         reader = self.reader
         if reader.has_column(fieldname):
@@ -1536,7 +2090,7 @@ class Hit(object):
         return itervalues(self.fields())
 
     def get(self, key, default=None):
-        return self.fields().get(key, default)
+        return self._stored(key).get(key, default)
 
     def __setitem__(self, key, value):
         raise NotImplementedError("You cannot modify a search result")
@@ -1579,6 +2133,11 @@ class ResultsPage(object):
 
     The ``total`` attribute contains the total number of hits in the results.
 
+    A page returned by :meth:`Searcher.search_after` has ``offset`` set to the
+    number of hits before the cursor, and ``pagenum`` set to the page that
+    offset falls on. Use the page's :meth:`ResultsPage.cursor` method to get
+    the cursor for the next page.
+
     >>> mysearcher = myindex.searcher()
     >>> pagenum = 2
     >>> page = mysearcher.find_page(pagenum, myquery)
@@ -1599,27 +2158,37 @@ class ResultsPage(object):
     def __init__(self, results, pagenum, pagelen=10):
         """
         :param results: a :class:`~whoosh.searching.Results` object.
-        :param pagenum: which page of the results to use, numbered from ``1``.
+        :param pagenum: which page of the results to use, numbered from ``1``,
+            or None if the results only contain the hits on this page (as
+            when searching after a cursor).
         :param pagelen: the number of hits per page.
         """
 
         self.results = results
         self.total = len(results)
+        self.pagecount = int(ceil(self.total / pagelen))
 
-        if pagenum < 1:
-            raise ValueError("pagenum must be >= 1")
+        if pagenum is None:
+            offset = results.offset
+            self.pagenum = offset // pagelen + 1
+            pagelen = min(pagelen, results.scored_length())
+            # Position of the page's first hit in the results
+            self._start = 0
+        else:
+            if pagenum < 1:
+                raise ValueError("pagenum must be >= 1")
 
-        self.pagecount = int(ceil(self.total / pagelen))
-        self.pagenum = min(self.pagecount, pagenum)
+            self.pagenum = min(self.pagecount, pagenum)
 
-        offset = (self.pagenum - 1) * pagelen
-        if (offset + pagelen) > self.total:
-            pagelen = self.total - offset
+            offset = (self.pagenum - 1) * pagelen
+            if (offset + pagelen) > self.total:
+                pagelen = self.total - offset
+            self._start = offset
         self.offset = offset
         self.pagelen = pagelen
 
     def __getitem__(self, n):
-        offset = self.offset
+        offset = self._start
         if isinstance(n, slice):
             start, stop, step = n.indices(self.pagelen)
             return self.results.__getitem__(slice(start + offset,
@@ -1628,7 +2197,7 @@ class ResultsPage(object):
             return self.results.__getitem__(n + offset)
 
     def __iter__(self):
-        return iter(self.results[self.offset:self.offset + self.pagelen])
+        return iter(self.results[self._start:self._start + self.pagelen])
 
     def __len__(self):
         return self.total
@@ -1639,16 +2208,27 @@ class ResultsPage(object):
     def score(self, n):
         """Returns the score of the hit at the nth position on this page.
         """
-        return self.results.score(n + self.offset)
+        return self.results.score(n + self._start)
 
     def docnum(self, n):
         """Returns the document number of the hit at the nth position on this
         page.
         """
-        return self.results.docnum(n + self.offset)
+        return self.results.docnum(n + self._start)
 
     def is_last_page(self):
         """Returns True if this object represents the last page of results.
         """
 
-        return self.pagecount == 0 or self.pagenum == self.pagecount
+        return self.pagecount == 0 or self.offset + self.pagelen >= self.total
+
+    def cursor(self):
+        """Returns an opaque object representing the position of the last hit
+        on this page, which you can pass as the ``after`` argument of
+        :meth:`Searcher.search_after` to get the next page. Returns None if
+        the page is empty.
+        """
+
+        if self.pagelen < 1:
+            return None
+        return tuple(self.results.top_n[self._start + self.pagelen - 1])
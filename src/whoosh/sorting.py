@@ -126,6 +126,18 @@ class Categorizer(object):
 
         raise NotImplementedError(self.__class__)
 
+    def key_range(self, segment_docnum):
+        """Returns a ``(enddoc, minkey, maxkey)`` tuple, where ``minkey`` and
+        ``maxkey`` bound the keys of every document from ``segment_docnum`` up
+        to (but not including) ``enddoc``, or None if the categorizer can't
+        tell. Collectors can use this to skip runs of documents whose keys
+        can't make it into the results.
+
+        The default implementation returns None.
+        """
+
+        return None
+
     def keys_for(self, matcher, segment_docnum):
         """Yields a series of keys for the current match.
 
@@ -238,6 +250,19 @@ class ColumnCategorizer(Categorizer):
     def key_for(self, matcher, segment_docnum):
         return self._creader.sort_key(segment_docnum)
 
+    def key_range(self, segment_docnum):
+        creader = self._creader
+        zonesize = creader.zone_size()
+        if not zonesize:
+            return None
+
+        zonenum = segment_docnum // zonesize
+        minkey, maxkey = creader.zone(zonenum)
+        if self._reverse:
+            # The reader negates the keys of a reversed numeric column
+            minkey, maxkey = 0 - maxkey, 0 - minkey
+        return (zonenum + 1) * zonesize, minkey, maxkey
+
     def key_to_name(self, key):
         return self._fieldobj.from_column_value(key)
 
@@ -256,6 +281,9 @@ class ReversedColumnCategorizer(ColumnCategorizer):
         global_creader = reader.column_reader(fieldname, translate=False)
         self._values = sorted(set(global_creader))
 
+    def key_range(self, segment_docnum):
+        return None
+
     def key_for(self, matcher, segment_docnum):
         value = self._creader[segment_docnum]
         order = self._values.index(value)
@@ -979,6 +1007,14 @@ class FacetMap(object):
 
         raise NotImplementedError
 
+    def merge(self, other):
+        """Adds the groups of another facet map of the same type to this one.
+        This is used to combine the groups found in different segments when
+        searching segments concurrently.
+        """
+
+        raise NotImplementedError
+
     def as_dict(self):
         """Returns a dictionary object mapping group names to
         implementation-specific values. For example, the value might be a list
@@ -1006,6 +1042,10 @@ class OrderedList(FacetMap):
     def add(self, groupname, docid, sortkey):
         self.dict[groupname].append((sortkey, docid))
 
+    def merge(self, other):
+        for key, items in iteritems(other.dict):
+            self.dict[key].extend(items)
+
     def as_dict(self):
         d = {}
         for key, items in iteritems(self.dict):
@@ -1032,6 +1072,10 @@ class UnorderedList(FacetMap):
     def add(self, groupname, docid, sortkey):
         self.dict[groupname].append(docid)
 
+    def merge(self, other):
+        for key, docids in iteritems(other.dict):
+            self.dict[key].extend(docids)
+
     def as_dict(self):
         return dict(self.dict)
 
@@ -1052,6 +1096,10 @@ class Count(FacetMap):
     def add(self, groupname, docid, sortkey):
         self.dict[groupname] += 1
 
+    def merge(self, other):
+        for key, count in iteritems(other.dict):
+            self.dict[key] += count
+
     def as_dict(self):
         return dict(self.dict)
 
@@ -1076,6 +1124,10 @@ class Best(FacetMap):
             self.bestids[groupname] = docid
             self.bestkeys[groupname] = sortkey
 
+    def merge(self, other):
+        for groupname, docid in iteritems(other.bestids):
+            self.add(groupname, docid, other.bestkeys[groupname])
+
     def as_dict(self):
         return self.bestids
 
@@ -28,6 +28,7 @@
 from __future__ import with_statement
 import functools, random
 from array import array
+from collections import OrderedDict
 from heapq import nsmallest
 from operator import itemgetter
 from threading import Lock
@@ -373,3 +374,120 @@ def clockface_lru_cache(maxsize=100):
         return wrapper
     return decorating_function
 
+
+
+def _move_to_end(odict, key):
+    # OrderedDict.move_to_end() is only available on Python 3
+    try:
+        odict.move_to_end(key)
+    except AttributeError:
+        odict[key] = odict.pop(key)
+
+
+class LRUCache(object):
+    """A thread-safe, size-bounded mapping that discards the least recently
+    used values when it fills up. Unlike the decorators in this module, the
+    cache is an object holding values computed elsewhere, so it can be shared,
+    for example between all the readers in a process.
+
+    By default each value counts as 1 toward ``maxsize``. Pass a ``sizefn``
+    function to measure the values some other way, for example in bytes.
+
+    >>> cache = LRUCache(maxsize=1000)
+    >>> cache.put("a", 1)
+    >>> cache.get("a")
+    1
+    >>> cache.cache_info()
+    (1, 0, 1000, 1)
+    """
+
+    def __init__(self, maxsize=1000, sizefn=None):
+        """
+        :param maxsize: the maximum total size of the values in the cache.
+        :param sizefn: a function which takes a value and returns its size. If
+            this is None, every value has a size of 1.
+        """
+
+        self.maxsize = maxsize
+        self.sizefn = sizefn
+        self.hits = 0
+        self.misses = 0
+
+        # Maps keys to (value, size) tuples, from least to most recently used
+        self._data = OrderedDict()
+        self._size = 0
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def size(self):
+        """Returns the total size of the values in the cache.
+        """
+
+        return self._size
+
+    def get(self, key, default=None):
+        """Returns the cached value for the given key, or ``default`` if the
+        key is not in the cache.
+        """
+
+        with self._lock:
+            data = self._data
+            try:
+                value = data[key][0]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            _move_to_end(data, key)
+            return value
+
+    def put(self, key, value):
+        """Adds a value to the cache, discarding the least recently used values
+        if the cache is full.
+        """
+
+        size = self.sizefn(value) if self.sizefn else 1
+        if size > self.maxsize:
+            # Don't throw away everything else for a value that won't fit
+            return
+
+        with self._lock:
+            data = self._data
+            if key in data:
+                self._size -= data.pop(key)[1]
+            data[key] = (value, size)
+            self._size += size
+
+            # Delete the least recently used values until the values fit
+            while self._size > self.maxsize:
+                self._size -= data.popitem(last=False)[1][1]
+
+    def discard(self, key):
+        """Removes the given key from the cache, if it's there.
+        """
+
+        with self._lock:
+            if key in self._data:
+                self._size -= self._data.pop(key)[1]
+
+    def clear(self):
+        """Removes all values from the cache and resets the statistics.
+        """
+
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+            self.hits = self.misses = 0
+
+    def cache_info(self):
+        """Returns a tuple of ``(hits, misses, maxsize, currsize)``, like the
+        caching decorators in this module.
+        """
+
+        return self.hits, self.misses, self.maxsize, self._size
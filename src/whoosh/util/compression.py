@@ -0,0 +1,167 @@
+# Copyright 2007 Matt Chaput. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright notice,
+#       this list of conditions and the following disclaimer.
+#
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY MATT CHAPUT ``AS IS'' AND ANY EXPRESS OR
+# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO
+# EVENT SHALL MATT CHAPUT OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation are
+# those of the authors and should not be interpreted as representing official
+# policies, either expressed or implied, of Matt Chaput.
+
+"""
+This module contains a helper for compressing data on a pool of threads while
+still writing it out in order.
+"""
+
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+
+def _compress_batch(tasks):
+    return [compress(data, level) for compress, data, level in tasks]
+
+
+class ParallelCompressor(object):
+    """Compresses byte strings on a pool of threads, and passes the results to
+    callbacks on the calling thread in the same order the strings were
+    submitted. Since zlib releases the GIL while it compresses, this lets a
+    writer use other cores for compression while it keeps analyzing
+    documents, and because the callbacks do the writing, the file comes out
+    exactly as if everything had been compressed inline.
+
+    >>> pc = ParallelCompressor(4)
+    >>> pc.compress(zlib.compress, data, 3, dbfile.write)
+    >>> pc.call(dbfile.write, b"footer")
+    >>> pc.close()
+
+    Strings are sent to the pool in batches, since compressing a few hundred
+    bytes takes less time than handing them to another thread.
+    """
+
+    def __init__(self, threads, batchsize=64 * 1024, window=None):
+        """
+        :param threads: the number of threads to compress with.
+        :param batchsize: the number of bytes of uncompressed data to send to
+            a thread at a time.
+        :param window: the maximum number of batches waiting to be written.
+            When there are more, :meth:`compress` waits for the oldest ones.
+            The default is twice the number of threads.
+        """
+
+        self._pool = ThreadPool(threads)
+        self._batchsize = batchsize
+        self._window = window or threads * 2
+
+        # Compression tasks in the batch being filled
+        self._tasks = []
+        self._size = 0
+        # Callbacks for the batch being filled, as (callback, args, index)
+        # tuples, where index is the position of the callback's result in the
+        # batch, or None for a callback added with call()
+        self._callbacks = []
+        # Submitted batches, as (callbacks, asyncresult) tuples
+        self._queue = deque()
+
+    def compress(self, compress, data, level, callback, *args):
+        """Compresses ``data`` using ``compress(data, level)`` on the pool,
+        and later calls ``callback(*args + (compressed,))`` on this thread.
+        """
+
+        if self._pool is None:
+            callback(*(args + (compress(data, level),)))
+            return
+
+        self._callbacks.append((callback, args, len(self._tasks)))
+        self._tasks.append((compress, data, level))
+        self._size += len(data)
+        if self._size >= self._batchsize:
+            self._submit()
+            if len(self._queue) > self._window:
+                self._drain(self._window)
+
+    def call(self, callback, *args):
+        """Calls ``callback(*args)`` after the callbacks of all the data
+        submitted so far. If nothing is waiting, it's called right away.
+        """
+
+        if self._queue or self._callbacks:
+            self._callbacks.append((callback, args, None))
+        else:
+            callback(*args)
+
+    def flush(self):
+        """Waits for all the data submitted so far to be compressed, and calls
+        all waiting callbacks.
+        """
+
+        self._submit()
+        self._drain(0)
+
+    def close(self):
+        """Flushes the compressor and shuts down its threads.
+        """
+
+        if self._pool is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def terminate(self):
+        """Shuts down the compressor's threads without waiting for them, and
+        throws away any data that was submitted but not written yet. After
+        this, the compressor compresses data on the calling thread and calls
+        callbacks right away.
+        """
+
+        self._tasks = []
+        self._size = 0
+        self._callbacks = []
+        self._queue.clear()
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def _submit(self):
+        if not self._callbacks:
+            return
+        if self._tasks:
+            result = self._pool.apply_async(_compress_batch, (self._tasks,))
+        else:
+            result = None
+        self._queue.append((self._callbacks, result))
+        self._tasks = []
+        self._size = 0
+        self._callbacks = []
+
+    def _drain(self, keep):
+        queue = self._queue
+        while len(queue) > keep:
+            callbacks, result = queue.popleft()
+            outputs = result.get() if result is not None else ()
+            for callback, args, index in callbacks:
+                if index is None:
+                    callback(*args)
+                else:
+                    callback(*(args + (outputs[index],)))
@@ -26,18 +26,21 @@
 # policies, either expressed or implied, of Matt Chaput.
 
 from __future__ import with_statement
-import threading, time
-from bisect import bisect_right
+import math, sys, threading, time
+from array import array
+from bisect import bisect_left, bisect_right
 from contextlib import contextmanager
+from itertools import islice
 
 from whoosh import columns
-from whoosh.compat import abstractmethod, bytes_type
-from whoosh.externalsort import SortingPool
+from whoosh.compat import abstractmethod, bytes_type, izip
+from whoosh.externalsort import SortingPool, imerge
 from whoosh.fields import UnknownFieldError
 from whoosh.index import LockError
 from whoosh.system import emptybytes
 from whoosh.util import fib, random_name
 from whoosh.util.filelock import try_for
+from whoosh.util.numlists import GrowableArray
 from whoosh.util.text import utf8encode
 
 
@@ -126,11 +129,350 @@ def CLEAR(writer, segments):
     return []
 
 
+class TieredMergePolicy(object):
+    """A merge policy that groups segments into tiers of roughly equal size
+    (measured in bytes of live documents) and merges segments of similar size
+    whenever a tier holds more than ``segments_per_tier`` segments. Segments
+    with a large proportion of deleted documents are rewritten on their own to
+    reclaim the space.
+
+    You can pass an instance of this class as the ``mergetype`` of a writer, in
+    which case the best merge is done by the writer while it commits, or use it
+    with a :class:`MergeScheduler` to do the merges in the background.
+    """
+
+    def __init__(self, segments_per_tier=10, max_merged_mb=5 * 1024,
+                 deletes_pct=20.0, floor_mb=2.0):
+        """
+        :param segments_per_tier: the number of segments of similar size
+            allowed before they are merged. This is also the maximum number of
+            segments merged at once.
+        :param max_merged_mb: the maximum size (in megabytes) of a segment
+            created by merging. Segments larger than half this size are not
+            merged with others.
+        :param deletes_pct: segments where this percentage or more of the
+            documents are deleted are rewritten to reclaim the space.
+        :param floor_mb: segments smaller than this size (in megabytes) are
+            treated as if they were this size, so lots of tiny segments are
+            merged together.
+        """
+
+        if segments_per_tier < 2:
+            raise ValueError("segments_per_tier must be at least 2")
+        self.segments_per_tier = segments_per_tier
+        self.max_merged_mb = max_merged_mb
+        self.deletes_pct = deletes_pct
+        self.floor_mb = floor_mb
+
+    def __call__(self, writer, segments):
+        merges = self.find_merges(writer.storage, segments)
+        if not merges:
+            return segments
+
+        from whoosh.reading import SegmentReader
+
+        merging = set(seg.segment_id() for seg in merges[0])
+        for seg in merges[0]:
+            reader = SegmentReader(writer.storage, writer.schema, seg)
+            writer.add_reader(reader)
+            reader.close()
+        return [seg for seg in segments if seg.segment_id() not in merging]
+
+    @staticmethod
+    def _deleted_pct(segment):
+        total = segment.doc_count_all()
+        if not total:
+            return 0.0
+        return segment.deleted_count() * 100.0 / total
+
+    def segment_sizes(self, storage, segments):
+        """Returns a dictionary mapping segment IDs to the number of bytes the
+        segment's undeleted documents take up in the given storage.
+        """
+
+        sizes = dict((seg.segment_id(), 0) for seg in segments)
+        for name in storage.list():
+            segid = name.split(".", 1)[0]
+            if segid in sizes:
+                sizes[segid] += storage.file_length(name)
+
+        for seg in segments:
+            total = seg.doc_count_all()
+            if total:
+                segid = seg.segment_id()
+                sizes[segid] = sizes[segid] * seg.doc_count() // total
+        return sizes
+
+    def find_merges(self, storage, segments):
+        """Returns a list of the merges that should be done, where each merge
+        is a list of segments to merge into a single new segment. The merges
+        are listed in order of preference.
+        """
+
+        pertier = self.segments_per_tier
+        maxbytes = int(self.max_merged_mb * 1024 * 1024)
+        floorbytes = int(self.floor_mb * 1024 * 1024)
+        sizes = self.segment_sizes(storage, segments)
+
+        def size(seg):
+            return max(sizes[seg.segment_id()], floorbytes)
+
+        # Segments too big to merge with others are left out of the tiers
+        eligible = [seg for seg in segments
+                    if sizes[seg.segment_id()] <= maxbytes // 2]
+        eligible.sort(key=size, reverse=True)
+
+        merges = []
+        while len(eligible) > 1:
+            # Work out how many segments the index should have, given the total
+            # size, if each tier held segments_per_tier segments
+            remaining = sum(size(seg) for seg in eligible)
+            levelsize = size(eligible[-1])
+            allowed = 0
+            while True:
+                count = remaining / float(levelsize)
+                if count < pertier:
+                    allowed += int(math.ceil(count))
+                    break
+                allowed += pertier
+                remaining -= pertier * levelsize
+                levelsize *= pertier
+            if len(eligible) <= allowed:
+                break
+
+            # Find the run of similarly sized segments that is cheapest to
+            # merge: favor merges with low skew (the largest segment is a small
+            # part of the total) and, less strongly, small merges
+            best = None
+            bestscore = None
+            for start in range(len(eligible) - 1):
+                window = []
+                total = 0
+                for seg in eligible[start:start + pertier]:
+                    if total + sizes[seg.segment_id()] > maxbytes:
+                        continue
+                    window.append(seg)
+                    total += sizes[seg.segment_id()]
+                if len(window) < 2:
+                    continue
+                floored = sum(size(seg) for seg in window)
+                score = (size(window[0]) / float(floored)) * floored ** 0.05
+                if bestscore is None or score < bestscore:
+                    best = window
+                    bestscore = score
+            if best is None:
+                break
+            merges.append(best)
+            eligible = [seg for seg in eligible if seg not in best]
+
+        # Rewrite segments with lots of deletions by themselves
+        merging = set(seg.segment_id() for merge in merges for seg in merge)
+        for seg in segments:
+            if (seg.segment_id() not in merging
+                and seg.deleted_count()
+                and self._deleted_pct(seg) >= self.deletes_pct):
+                merges.append([seg])
+        return merges
+
+
+class MergeScheduler(object):
+    """Does the merges chosen by a merge policy in a background thread, so
+    committing a writer doesn't have to wait for them. Each merge is written
+    without holding the index's write lock, and the index's write lock is only
+    held at the end to publish the merged segment in a new generation of the
+    index. Documents deleted from the source segments while the merge was
+    running are deleted from the merged segment when it's published.
+
+    Pass the scheduler as the ``mergetype`` of a writer to start merging after
+    the writer commits::
+
+        scheduler = MergeScheduler(myindex, TieredMergePolicy())
+        with myindex.writer(mergetype=scheduler) as w:
+            ...
+        # Wait for the background merges to finish
+        scheduler.wait()
+
+    This only protects the files of an unfinished merge from being cleaned up
+    by writers in the same process, so only one process should run a
+    scheduler on an index at a time.
+    """
+
+    def __init__(self, ix, policy=None, codec=None, delay=0.1):
+        """
+        :param ix: the :class:`whoosh.index.Index` to merge.
+        :param policy: a :class:`TieredMergePolicy` (or any object with a
+            ``find_merges(storage, segments)`` method) choosing which segments
+            to merge. The default is a ``TieredMergePolicy`` with its default
+            settings.
+        :param codec: the codec to write merged segments with. The default is
+            the default codec.
+        :param delay: how often (in seconds) to retry acquiring the index's
+            write lock.
+        """
+
+        self.ix = ix
+        self.policy = policy or TieredMergePolicy()
+        self.codec = codec
+        self.delay = delay
+        self.error = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._again = False
+
+    def __call__(self, writer, segments):
+        # Used as a writer's merge policy: don't merge anything in the writer,
+        # just start merging in the background once the commit is finished
+        self.schedule()
+        return segments
+
+    def schedule(self):
+        """Starts merging in the background, if the scheduler isn't already
+        merging. If it is, the scheduler checks for merges again when it's
+        done.
+        """
+
+        with self._lock:
+            if self._thread is not None:
+                self._again = True
+                return
+            self._again = False
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def is_running(self):
+        return self._thread is not None
+
+    def wait(self):
+        """Blocks until the background merges are finished. If a merge raised
+        an exception, this method raises it.
+        """
+
+        thread = self._thread
+        while thread is not None:
+            thread.join()
+            thread = self._thread
+        if self.error is not None:
+            e = self.error
+            self.error = None
+            raise e
+
+    def _run(self):
+        while True:
+            try:
+                while self._merge_once():
+                    pass
+            except Exception:
+                # Keep the first error until wait() reports it
+                if self.error is None:
+                    self.error = sys.exc_info()[1]
+            with self._lock:
+                if not self._again:
+                    self._thread = None
+                    return
+                self._again = False
+
+    def _acquire(self, lock):
+        while not lock.acquire():
+            time.sleep(self.delay)
+
+    def _merge_group(self, writer, schema, group):
+        # Writes the documents of the given segments into the writer's new
+        # segment
+        from whoosh.reading import SegmentReader
+
+        for seg in group:
+            reader = SegmentReader(writer.storage, schema, seg)
+            writer.add_reader(reader)
+            reader.close()
+        return writer._finalize_segment()
+
+    def _merge_once(self):
+        # Does the first merge chosen by the policy and returns True, or
+        # returns False if there was nothing to merge
+        from whoosh.index import TOC, clean_files, _unpublished_segments
+
+        ix = self.ix
+        storage = ix.storage
+        lock = ix.lock("WRITELOCK")
+
+        # Hold the write lock while choosing the merge, which also makes sure
+        # the commit that scheduled the merge is finished
+        self._acquire(lock)
+        try:
+            toc = ix._read_toc()
+            merges = self.policy.find_merges(storage, toc.segments)
+            if not merges:
+                return False
+            group = merges[0]
+            # Remember which documents were already deleted, to work out which
+            # deletions happened during the merge
+            olddeleted = [sorted(seg.deleted_docs()) for seg in group]
+            # Give the writer its own temporary storage, so finishing it
+            # doesn't destroy the temporary files of a writer running at the
+            # same time
+            tempname = "%s_%s.tmp" % (ix.indexname, random_name())
+            writer = SegmentWriter(ix, _lk=False, codec=self.codec,
+                                   _tempname=tempname)
+            segid = writer.newsegment.segment_id()
+            _unpublished_segments.add(segid)
+        finally:
+            lock.release()
+
+        try:
+            merged = self._merge_group(writer, toc.schema, group)
+
+            self._acquire(lock)
+            try:
+                toc = ix._read_toc()
+                current = dict((seg.segment_id(), seg) for seg in toc.segments)
+                if any(seg.segment_id() not in current for seg in group):
+                    # Another writer merged away one of the source segments;
+                    # give up on this merge and let clean_files() remove it
+                    return True
+
+                # Carry over documents deleted since the merge started
+                base = 0
+                for seg, deleted in zip(group, olddeleted):
+                    curseg = current[seg.segment_id()]
+                    if curseg.deleted_count() != len(deleted):
+                        for docnum in curseg.deleted_docs():
+                            i = bisect_left(deleted, docnum)
+                            if i < len(deleted) and deleted[i] == docnum:
+                                continue
+                            merged.delete_document(base + docnum - i)
+                    base += seg.doc_count_all() - len(deleted)
+
+                groupids = set(seg.segment_id() for seg in group)
+                segments = [seg for seg in toc.segments
+                            if seg.segment_id() not in groupids]
+                if merged.doc_count_all():
+                    segments.append(merged)
+                generation = toc.generation + 1
+                TOC(toc.schema, segments, generation).write(storage,
+                                                            ix.indexname)
+                _unpublished_segments.discard(segid)
+                clean_files(storage, ix.indexname, generation, segments)
+            finally:
+                lock.release()
+        finally:
+            _unpublished_segments.discard(segid)
+            # Close the segment files and remove the writer's temporary
+            # storage, whether or not the merge succeeded
+            writer._close_segment()
+            writer._finish()
+        return True
+
+
 # Customized sorting pool for postings
 
 class PostingPool(SortingPool):
     # Subclass whoosh.externalsort.SortingPool to use knowledge of
-    # postings to set run size in bytes instead of items
+    # postings to set run size in bytes instead of items. Instead of a list of
+    # posting tuples to sort, the pool buffers the postings of each term in
+    # arrays, so adding a posting doesn't allocate a tuple and saving a run
+    # only has to sort the terms. This relies on postings being added in
+    # document number order, which is how the writer adds them.
 
     namechars = "abcdefghijklmnopqrstuvwxyz0123456789"
 
@@ -140,7 +482,14 @@ class PostingPool(SortingPool):
         self.segment = segment
         self.limit = limitmb * 1024 * 1024
         self.currentsize = 0
+        # Estimated size of all the postings added, including those already
+        # saved to runs
+        self.addedsize = 0
         self.fieldnames = set()
+        # Maps field names to dictionaries mapping term bytes to
+        # [docnums, weights, values] lists, where values is None until the
+        # term gets a posting with a value
+        self._buffer = {}
 
     def _new_run(self):
         path = "%s.run" % random_name()
@@ -155,31 +504,102 @@ class PostingPool(SortingPool):
 
     def add(self, item):
         # item = (fieldname, tbytes, docnum, weight, vbytes)
-        assert isinstance(item[1], bytes_type), "tbytes=%r" % item[1]
-        if item[4] is not None:
-            assert isinstance(item[4], bytes_type), "vbytes=%r" % item[4]
-        self.fieldnames.add(item[0])
-        size = (28 + 4 * 5  # tuple = 28 + 4 * length
-                + 21 + len(item[0])  # fieldname = str = 21 + length
-                + 26 + len(item[1]) * 2  # text = unicode = 26 + 2 * length
-                + 18  # docnum = long = 18
-                + 16  # weight = float = 16
-                + 21 + len(item[4] or ''))  # valuestring
+        fieldname, tbytes, docnum, weight, vbytes = item
+        assert isinstance(tbytes, bytes_type), "tbytes=%r" % tbytes
+
+        terms = self._buffer.get(fieldname)
+        if terms is None:
+            terms = self._buffer[fieldname] = {}
+            self.fieldnames.add(fieldname)
+
+        size = 12  # docnum + weight
+        entry = terms.get(tbytes)
+        if entry is None:
+            entry = terms[tbytes] = [GrowableArray(), array("f"), None]
+            size += 160 + len(tbytes)  # key + arrays
+        docnums, weights, values = entry
+        docnums.append(docnum)
+        weights.append(weight)
+        if vbytes is not None:
+            assert isinstance(vbytes, bytes_type), "vbytes=%r" % vbytes
+            if values is None:
+                values = entry[2] = [None] * (len(weights) - 1)
+            values.append(vbytes)
+            size += 41 + len(vbytes)
+        elif values is not None:
+            values.append(None)
+            size += 8
+
         self.currentsize += size
+        self.addedsize += size
         if self.currentsize > self.limit:
             self.save()
-        self.current.append(item)
+
+    def _buffered_items(self):
+        # Yields the buffered postings as sorted posting tuples
+        buf = self._buffer
+        for fieldname in sorted(buf):
+            terms = buf[fieldname]
+            for tbytes in sorted(terms):
+                docnums, weights, values = terms[tbytes]
+                if values is None:
+                    for docnum, weight in izip(docnums, weights):
+                        yield (fieldname, tbytes, docnum, weight, None)
+                else:
+                    for docnum, weight, vbytes in izip(docnums, weights,
+                                                       values):
+                        yield (fieldname, tbytes, docnum, weight, vbytes)
 
     def iter_postings(self):
         # This is just an alias for items() to be consistent with the
         # iter_postings()/add_postings() interface of a lot of other classes
         return self.items()
 
+    def items(self, maxfiles=128):
+        if not self.runs:
+            # Nothing was written to disk, so just return the buffered
+            # postings
+            return self._buffered_items()
+        return SortingPool.items(self, maxfiles=maxfiles)
+
     def save(self):
-        SortingPool.save(self)
+        if self._buffer:
+            path, f = self._new_run()
+            self._write_run(f, self._buffered_items())
+            self._add_run(path)
+            self._buffer = {}
         self.currentsize = 0
 
 
+def sorted_postings(reader, fieldnames, rawsource=None):
+    """Yields the postings of the given fields in the reader as
+    ``(fieldname, text, docnum, weight, valuestring)`` tuples sorted by field
+    name, then term, then document number, which is the order a
+    :class:`whoosh.codec.base.FieldWriter` needs them in. Unlike
+    ``reader.iter_postings()``, the order doesn't depend on how the reader's
+    codec numbers the fields.
+
+    :param rawsource: an optional function returned by
+        :meth:`whoosh.codec.base.FieldWriter.raw_source`. If it returns a
+        :class:`whoosh.codec.base.RawPostings` object for a term, the function
+        yields a single ``(fieldname, text, firstdocnum, None, rawpostings)``
+        tuple for the term instead of decoding its postings.
+    """
+
+    for fieldname in sorted(fieldnames):
+        for btext in reader.lexicon(fieldname):
+            if rawsource is not None:
+                raw = rawsource(fieldname, btext)
+                if raw is not None:
+                    yield (fieldname, btext, raw.min_id(), None, raw)
+                    continue
+
+            m = reader.postings(fieldname, btext)
+            while m.is_active():
+                yield (fieldname, btext, m.id(), m.weight(), m.value())
+                m.next()
+
+
 # Writer base class
 
 class IndexWriter(object):
@@ -401,6 +821,31 @@ class IndexWriter(object):
 
         raise NotImplementedError
 
+    def add_documents(self, docs):
+        """Adds each dictionary in the given iterable as a document, as if you
+        called :meth:`IndexWriter.add_document` with the dictionary as keyword
+        arguments::
+
+            def docs():
+                for path in paths:
+                    with open(path) as f:
+                        yield {"path": path, "content": f.read()}
+
+            with myindex.writer() as w:
+                w.add_documents(docs())
+
+        The iterable is consumed as the documents are added, so you can pass a
+        generator to index a large number of documents without keeping them
+        all in memory. Writers can add a batch of documents faster than
+        calling ``add_document`` for each one, for example by only checking
+        the fields of each distinct set of keys against the schema once. Each
+        field value is still analyzed on its own, just as it would be by
+        ``add_document``.
+        """
+
+        for fields in docs:
+            self.add_document(**fields)
+
     @abstractmethod
     def add_reader(self, reader):
         raise NotImplementedError
@@ -489,6 +934,58 @@ class IndexWriter(object):
         # Add the given fields
         self.add_document(**fields)
 
+    def update_documents(self, docs, batchsize=1000):
+        """Adds each dictionary in the given iterable as a document, replacing
+        any documents with the same values in "unique" fields, as if you
+        called :meth:`IndexWriter.update_document` for each dictionary::
+
+            with myindex.writer() as w:
+                w.update_documents({"path": path, "content": text}
+                                   for path, text in changed_files)
+
+        Instead of searching for the unique values of each document
+        separately, this method reads the documents in batches, looks up the
+        unique values of the whole batch at once in each segment (see
+        :meth:`whoosh.reading.IndexReader.docs_for_terms`), deletes the
+        matching documents, and then adds the batch.
+
+        As with ``update_document``, documents added by this writer aren't
+        replaced, so if two documents in the iterable have the same unique
+        value, both are added.
+
+        :param docs: an iterable of dictionaries mapping field names to
+            values.
+        :param batchsize: the number of documents to read from the iterable
+            and update at once.
+        """
+
+        uniques = [name for name, field in self.schema.items()
+                   if field.unique]
+        docs = iter(docs)
+        while True:
+            batch = list(islice(docs, batchsize))
+            if not batch:
+                break
+
+            # Collect the unique values of all the documents in the batch
+            keys = {}
+            for fields in batch:
+                for name in uniques:
+                    if name in fields:
+                        keys.setdefault(name, []).append(fields[name])
+
+            # Delete the set of documents matching any of the unique terms
+            if keys:
+                delset = set()
+                with self.searcher() as s:
+                    reader = s.reader()
+                    for name in sorted(keys):
+                        delset.update(reader.docs_for_terms(name, keys[name]))
+                for docnum in sorted(delset):
+                    self.delete_document(docnum)
+
+            self.add_documents(batch)
+
     def commit(self):
         """Finishes writing and unlocks the index.
         """
@@ -505,7 +1002,8 @@ class IndexWriter(object):
 
 class SegmentWriter(IndexWriter):
     def __init__(self, ix, poolclass=None, timeout=0.0, delay=0.1, _lk=True,
-                 limitmb=128, docbase=0, codec=None, compound=True, **kwargs):
+                 limitmb=128, docbase=0, codec=None, compound=True,
+                 flushmb=None, _tempname=None, **kwargs):
         # Lock the index
         self.writelock = None
         if _lk:
@@ -526,22 +1024,29 @@ class SegmentWriter(IndexWriter):
         self.generation = info.generation + 1
         self.schema = info.schema
         self.segments = info.segments
-        self.docnum = self.docbase = docbase
+        self.docbase = docbase
         self._setup_doc_offsets()
 
         # Internals
-        self._tempstorage = self.storage.temp_storage("%s.tmp" % self.indexname)
-        newsegment = codec.new_segment(self.storage, self.indexname)
-        self.newsegment = newsegment
-        self.compound = compound and newsegment.should_assemble()
+        # Writers on the same index share a temporary storage by default (a
+        # multiprocessing writer's sub-writers use it to pass job files)
+        tempname = _tempname or "%s.tmp" % self.indexname
+        self._tempstorage = self.storage.temp_storage(tempname)
         self.is_closed = False
-        self._added = False
-        self.pool = PostingPool(self._tempstorage, self.newsegment,
-                                limitmb=limitmb)
-
-        # Set up writers
-        self.perdocwriter = codec.per_document_writer(self.storage, newsegment)
-        self.fieldwriter = codec.field_writer(self.storage, newsegment)
+        self._limitmb = limitmb
+        self._compound = compound
+        # Segments written by flush() that aren't committed yet (they're also
+        # in self.segments)
+        self._flushed = []
+        # Incremented whenever the documents visible to nrt_reader() change
+        self._nrtversion = 0
+        # If flushmb is given, automatically flush() a new segment whenever
+        # the postings added to the current segment reach roughly that size,
+        # instead of building one huge segment (and lots of pool runs to
+        # merge) for a big batch of documents
+        self._flushsize = flushmb * 1024 * 1024 if flushmb else None
+        self._grouping = 0
+        self._start_segment()
 
         self.merge = True
         self.optimize = False
@@ -550,6 +1055,26 @@ class SegmentWriter(IndexWriter):
     def __repr__(self):
         return "<%s %r>" % (self.__class__.__name__, self.newsegment)
 
+    def _start_segment(self):
+        # Sets up a new segment for the documents added to this writer
+        codec = self.codec
+        newsegment = codec.new_segment(self.storage, self.indexname)
+        self.newsegment = newsegment
+        self.compound = self._compound and newsegment.should_assemble()
+        self.docnum = self.docbase
+        self._added = False
+        self.pool = PostingPool(self._tempstorage, self.newsegment,
+                                limitmb=self._limitmb)
+        # Sorted streams of postings from readers added with add_reader(),
+        # which are merged with the pool's postings when the segment is
+        # flushed, and the readers to close after that
+        self._mergesources = []
+        self._mergereaders = []
+
+        # Set up writers
+        self.perdocwriter = codec.per_document_writer(self.storage, newsegment)
+        self.fieldwriter = codec.field_writer(self.storage, newsegment)
+
     def _check_state(self):
         if self.is_closed:
             raise IndexingError("This writer is closed")
@@ -619,6 +1144,7 @@ class SegmentWriter(IndexWriter):
             raise IndexingError("No document ID %r in this index" % docnum)
         segment, segdocnum = self._segment_and_docnum(docnum)
         segment.delete_document(segdocnum, delete=delete)
+        self._nrtversion += 1
 
     def deleted_count(self):
         """
@@ -638,8 +1164,76 @@ class SegmentWriter(IndexWriter):
         return FileIndex._reader(self.storage, self.schema, self.segments,
                                  self.generation, reuse=reuse)
 
+    def flush(self):
+        """Writes the documents added to this writer so far into a new segment
+        and starts a new segment for any documents added after this.
+
+        The flushed segment can be searched using :meth:`nrt_reader` (and
+        documents in it can be deleted using this writer), but it isn't part
+        of the index until the writer commits. Flushing doesn't write a new
+        TOC, so it's cheaper than committing.
+
+        Returns the flushed segment, or None if no documents were added since
+        the last flush.
+        """
+
+        self._check_state()
+        if not self._added:
+            return None
+
+        segment = self._finalize_segment()
+        self.segments.append(segment)
+        self._flushed.append(segment)
+        self._setup_doc_offsets()
+        self._nrtversion += 1
+
+        self._start_segment()
+        return segment
+
+    def nrt_reader(self, reuse=None):
+        """Returns a reader for the committed segments of the index plus the
+        documents added to this writer so far, without committing. Documents
+        deleted using this writer are excluded, even though the deletions
+        aren't committed yet.
+
+        This flushes any documents added since the last flush into a new
+        segment (see :meth:`flush`).
+
+        :param reuse: a reader previously returned by this method. Readers of
+            segments that haven't changed are reused instead of being opened
+            again, and the rest are closed.
+        """
+
+        from whoosh.index import FileIndex
+
+        self.flush()
+        return FileIndex._reader(self.storage, self.schema, self.segments,
+                                 self._nrtversion, reuse=reuse)
+
+    def nrt_searcher(self, **kwargs):
+        """Returns a :class:`whoosh.searching.Searcher` for the reader
+        returned by :meth:`nrt_reader`. Calling the searcher's ``refresh()``
+        method returns a searcher showing the documents added and deleted
+        using this writer since then, reusing unchanged segment readers::
+
+            with ix.writer() as w:
+                s = w.nrt_searcher()
+                w.add_document(title=u"New document")
+                s = s.refresh()
+        """
+
+        from whoosh.searching import Searcher
+
+        return Searcher(self.nrt_reader(), fromindex=_NrtSource(self),
+                        **kwargs)
+
     def iter_postings(self):
-        return self.pool.iter_postings()
+        if not self._mergesources:
+            return self.pool.iter_postings()
+        # The postings of each added reader are already sorted, so do a k-way
+        # merge of them with the pool's sorted postings
+        sources = [self.pool.iter_postings()] + self._mergesources
+        return imerge(sources)
 
     def add_postings_to_pool(self, reader, startdoc, docmap):
         items = self._process_posts(reader.iter_postings(), startdoc, docmap)
@@ -647,6 +1241,22 @@ class SegmentWriter(IndexWriter):
         for item in items:
             add_post(item)
 
+    def add_postings_to_merge(self, reader, fieldnames, startdoc, docmap):
+        # Instead of sorting the reader's postings in the pool (which spills
+        # them to run files in temp storage and reads them back), stream them
+        # in order from the reader when the segment is flushed. The reader
+        # must stay open until then, so use our own copy of it
+        reader = reader.reopen()
+        self._mergereaders.append(reader)
+        # If the reader has no deletions, the document numbers are just
+        # shifted, so the field writer may be able to copy the encoded posting
+        # lists
+        rawsource = None
+        if docmap is None:
+            rawsource = self.fieldwriter.raw_source(reader)
+        items = sorted_postings(reader, fieldnames, rawsource)
+        self._mergesources.append(self._process_posts(items, startdoc, docmap))
+
     def write_postings(self, lengths, items, startdoc, docmap):
         items = self._process_posts(items, startdoc, docmap)
         self.fieldwriter.add_postings(self.schema, lengths, items)
@@ -707,7 +1317,10 @@ class SegmentWriter(IndexWriter):
         fieldnames = set(self.schema.names()) | ndxnames
 
         docmap = self.write_per_doc(fieldnames, reader)
-        self.add_postings_to_pool(reader, basedoc, docmap)
+        if hasattr(reader, "reopen"):
+            self.add_postings_to_merge(reader, ndxnames, basedoc, docmap)
+        else:
+            self.add_postings_to_pool(reader, basedoc, docmap)
         self._added = True
 
     def _check_fields(self, schema, fieldnames):
@@ -717,30 +1330,61 @@ class SegmentWriter(IndexWriter):
                 raise UnknownFieldError("No field named %r in %s"
                                         % (name, schema))
 
+    def _doc_plan(self, fields):
+        # Returns a list of (fieldname, field, boost_keyword, stored_keyword,
+        # spelling_fieldname) tuples for the fields in the given document
+        # dictionary, after checking they're all in the schema
+        schema = self.schema
+        fieldnames = sorted([name for name in fields.keys()
+                             if not name.startswith("_")])
+        self._check_fields(schema, fieldnames)
+
+        plan = []
+        for fieldname in fieldnames:
+            field = schema[fieldname]
+            spellname = None
+            if field.separate_spelling():
+                spellname = field.spelling_fieldname(fieldname)
+            plan.append((fieldname, field, "_%s_boost" % fieldname,
+                         "_stored_%s" % fieldname, spellname))
+        return plan
+
     def add_document(self, **fields):
         self._check_state()
+        self._add_document(fields, self._doc_plan(fields))
+
+    def add_documents(self, docs):
+        self._check_state()
+        # The documents in a batch usually have the same keys, so only check
+        # and look up the fields once for each set of keys
+        plans = {}
+        for fields in docs:
+            key = tuple(fields)
+            plan = plans.get(key)
+            if plan is None:
+                plan = plans[key] = self._doc_plan(fields)
+            self._add_document(fields, plan)
+
+    def _add_document(self, fields, plan):
         perdocwriter = self.perdocwriter
-        schema = self.schema
         docnum = self.docnum
         add_post = self.pool.add
 
         docboost = self._doc_boost(fields)
-        fieldnames = sorted([name for name in fields.keys()
-                             if not name.startswith("_")])
-        self._check_fields(schema, fieldnames)
-
         perdocwriter.start_doc(docnum)
-        for fieldname in fieldnames:
+        for fieldname, field, boostkw, storedkw, spellname in plan:
             value = fields.get(fieldname)
             if value is None:
                 continue
-            field = schema[fieldname]
 
             length = 0
             if field.indexed:
                 # TODO: Method for adding progressive field values, ie
                 # setting start_pos/start_char?
-                fieldboost = self._field_boost(fields, fieldname, docboost)
+                if boostkw in fields:
+                    fieldboost = float(fields[boostkw])
+                else:
+                    fieldboost = docboost
                 # Ask the field to return a list of (text, weight, vbytes)
                 # tuples
                 items = field.index(value)
@@ -753,12 +1397,11 @@ class SegmentWriter(IndexWriter):
                         length += freq
                     add_post((fieldname, tbytes, docnum, weight, vbytes))
 
-            if field.separate_spelling():
-                spellfield = field.spelling_fieldname(fieldname)
+            if spellname:
                 for word in field.spellable_words(value):
                     word = utf8encode(word)[0]
                     # item = (fieldname, tbytes, docnum, weight, vbytes)
-                    add_post((spellfield, word, 0, 1, vbytes))
+                    add_post((spellname, word, 0, 1, vbytes))
 
             vformat = field.vector
             if vformat:
@@ -771,7 +1414,7 @@ class SegmentWriter(IndexWriter):
                 perdocwriter.add_vector_items(fieldname, field, vitems)
 
             # Allow a custom value for stored field/column
-            customval = fields.get("_stored_%s" % fieldname, value)
+            customval = fields.get(storedkw, value)
 
             # Add the stored value and length for this field to the per-
             # document writer
@@ -786,9 +1429,28 @@ class SegmentWriter(IndexWriter):
         perdocwriter.finish_doc()
         self._added = True
         self.docnum += 1
+        self._check_flush()
+
+    def start_group(self):
+        self._grouping += 1
+
+    def end_group(self):
+        if not self._grouping:
+            raise Exception("Unbalanced end_group")
+        self._grouping -= 1
+        self._check_flush()
+
+    def _check_flush(self):
+        # Flushes the current segment if it's over the RAM budget given by the
+        # flushmb argument. Documents in a group must stay in the same segment,
+        # so this waits until the end of the group
+        if (self._flushsize and not self._grouping
+            and self.pool.addedsize >= self._flushsize):
+            self.flush()
 
     def doc_count(self):
-        return self.docnum - self.docbase
+        flushed = sum(segment.doc_count_all() for segment in self._flushed)
+        return flushed + self.docnum - self.docbase
 
     def get_segment(self):
         newsegment = self.newsegment
@@ -832,18 +1494,30 @@ class SegmentWriter(IndexWriter):
             pdr = self.per_document_reader()
         else:
             pdr = None
-        postings = self.pool.iter_postings()
+        postings = self.iter_postings()
         self.fieldwriter.add_postings(self.schema, pdr, postings)
         self.fieldwriter.close()
         if pdr:
             pdr.close()
 
-    def _close_segment(self):
+    def _close_segment(self, cancel=False):
+        # If cancel is True, the segment is being thrown away, so the writers
+        # don't need to finish writing it
         if not self.perdocwriter.is_closed:
-            self.perdocwriter.close()
+            if cancel:
+                self.perdocwriter.cancel()
+            else:
+                self.perdocwriter.close()
         if not self.fieldwriter.is_closed:
-            self.fieldwriter.close()
+            if cancel:
+                self.fieldwriter.cancel()
+            else:
+                self.fieldwriter.close()
         self.pool.cleanup()
+        for reader in self._mergereaders:
+            reader.close()
+        self._mergesources = []
+        self._mergereaders = []
 
     def _assemble_segment(self):
         if self.compound:
@@ -936,8 +1610,30 @@ class SegmentWriter(IndexWriter):
 
     def cancel(self):
         self._check_state()
-        self._close_segment()
-        self._finish()
+        try:
+            self._close_segment(cancel=True)
+        finally:
+            # Delete the files of segments written by flush(), since they'll
+            # never be part of the index
+            for segment in self._flushed:
+                for name in segment.list_files(self.storage):
+                    self.storage.delete_file(name)
+            self._finish()
+
+
+class _NrtSource(object):
+    # Stands in for the index in a searcher returned by
+    # SegmentWriter.nrt_searcher(), so refreshing the searcher gets a new
+    # near-real-time reader from the writer
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def latest_generation(self):
+        return self.writer._nrtversion
+
+    def reader(self, reuse=None):
+        return self.writer.nrt_reader(reuse=reuse)
 
 
 # Writer wrappers
@@ -1023,6 +1719,12 @@ class AsyncWriter(threading.Thread, IndexWriter):
     def update_document(self, *args, **kwargs):
         self._record("update_document", args, kwargs)
 
+    def update_documents(self, docs, **kwargs):
+        if not self.writer:
+            # The documents will be added later, so keep them
+            docs = list(docs)
+        self._record("update_documents", (docs,), kwargs)
+
     def add_field(self, *args, **kwargs):
         self._record("add_field", args, kwargs)
 
@@ -1250,10 +1952,31 @@ class BufferedWriter(IndexWriter):
             if self.bufferedcount >= self.limit:
                 self.commit()
 
+    def add_documents(self, docs):
+        docs = iter(docs)
+        while True:
+            with self.lock:
+                # Take as many documents as will fit in the buffer before the
+                # next commit, and add them with a single in-memory writer
+                batch = list(islice(docs, max(self.limit - self.bufferedcount,
+                                              1)))
+                if not batch:
+                    return
+                with self.codec.writer(self.writer.schema) as w:
+                    w.add_documents(batch)
+
+                self.bufferedcount += len(batch)
+                if self.bufferedcount >= self.limit:
+                    self.commit()
+
     def update_document(self, **fields):
         with self.lock:
             IndexWriter.update_document(self, **fields)
 
+    def update_documents(self, docs, batchsize=1000):
+        with self.lock:
+            IndexWriter.update_documents(self, docs, batchsize=batchsize)
+
     def delete_document(self, docnum, delete=True):
         with self.lock:
             base = self.index.doc_count_all()
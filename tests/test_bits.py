@@ -1,5 +1,6 @@
+from whoosh.compat import xrange
 from whoosh.filedb.filestore import RamStorage
-from whoosh.idsets import BitSet, OnDiskBitSet, SortedIntSet
+from whoosh.idsets import BitSet, MultiIdSet, OnDiskBitSet, SortedIntSet
 
 
 def test_bit_basics(c=BitSet):
@@ -183,3 +184,25 @@ def test_ondisk():
     f.seek(0)
     b = BitSet.from_disk(f, size)
     assert list(b) == list(bs)
+
+
+def test_multi_idset():
+    a = BitSet([1, 5, 9], size=10)
+    b = SortedIntSet()
+    c = SortedIntSet([0, 3])
+    m = MultiIdSet([a, b, c], [0, 10, 20])
+
+    assert list(m) == [1, 5, 9, 20, 23]
+    assert len(m) == 5
+    assert m
+    assert [n for n in xrange(30) if n in m] == [1, 5, 9, 20, 23]
+    assert m.first() == 1
+    assert m.last() == 23
+    assert m.after(5) == 9
+    assert m.after(9) == 20
+    assert m.after(15) == 20
+    assert m.after(23) is None
+    assert m.before(20) == 9
+    assert m.before(23) == 20
+    assert m.before(1) is None
+    assert not MultiIdSet([SortedIntSet(), BitSet(size=5)], [0, 5])
@@ -1,4 +1,5 @@
 from __future__ import with_statement
+import fnmatch
 import random
 from array import array
 
@@ -619,3 +620,514 @@ def test_memory_multiwrite():
     assert [sf["line"] for sf in reader.all_stored_fields()] == domain
     assert (" ".join(reader.field_terms("line"))
             == "alfa bravo charlie delta echo foxtrot india juliet")
+
+
+def test_w4_blocks():
+    from whoosh.codec.whoosh4 import W4Codec
+
+    field = fields.TEXT()
+    st = RamStorage()
+    codec = W4Codec(blocklimit=4)
+    seg = codec.new_segment(st, "test")
+
+    domain = [(0, 2.0, b("test1"), 2), (1, 5.0, b("t"), 5),
+              (2, 3.0, b("test33"), 3), (3, 4.0, b("test4"), 4),
+              (700, 1.0, b("t5"), 1), (70000, 1.0, b("test6"), 1),
+              (70001, 1.0, b("test7"), 1)]
+    fw = codec.field_writer(st, seg)
+    fw.start_field("text", field)
+    fw.start_term(b("alfa"))
+    for docnum, weight, value, length in domain:
+        fw.add(docnum, weight, value, length)
+    fw.finish_term()
+    fw.start_term(b("bravo"))
+    for docnum in xrange(0, 1000, 3):
+        fw.add(docnum, 1.0, b(""), 1)
+    fw.finish_term()
+    fw.finish_field()
+    fw.close()
+
+    tr = codec.terms_reader(st, seg)
+    ti = tr.term_info("text", b("alfa"))
+    assert ti.weight() == 17.0
+    assert ti.doc_frequency() == 7
+    assert ti.max_weight() == 5.0
+    assert ti.max_id() == 70001
+
+    ps = []
+    m = tr.matcher("text", b("alfa"), field.format)
+    while m.is_active():
+        ps.append((m.id(), m.weight(), m.value()))
+        m.next()
+    assert ps == [(d, w, v) for d, w, v, _ in domain]
+
+    m = tr.matcher("text", b("bravo"), field.format)
+    assert list(m.all_ids()) == list(xrange(0, 1000, 3))
+    m = tr.matcher("text", b("bravo"), field.format)
+    m.skip_to(500)
+    assert m.id() == 501
+    assert m.weight() == 1.0
+
+
+def test_w4_skip_table():
+    from bisect import bisect_left
+    from whoosh.codec.whoosh4 import W4Codec
+
+    field = fields.TEXT()
+    st = RamStorage()
+    codec = W4Codec(blocklimit=8)
+    seg = codec.new_segment(st, "test")
+
+    terms = {b("alfa"): list(xrange(0, 5000, 7)),
+             b("bravo"): [3, 10, 12],
+             b("charlie"): [5, 9000, 9001, 20000, 20010, 20020, 20030, 20040,
+                            20050, 70000]}
+    fw = codec.field_writer(st, seg)
+    fw.start_field("text", field)
+    for term in sorted(terms):
+        fw.start_term(term)
+        for docnum in terms[term]:
+            fw.add(docnum, 1.0, b(""), 1)
+        fw.finish_term()
+    fw.finish_field()
+    fw.close()
+
+    tr = codec.terms_reader(st, seg)
+    for term, ids in terms.items():
+        assert list(tr.matcher("text", term, field.format).all_ids()) == ids
+
+        for target in (0, 6, 7, 8, 100, 2999, 4998, 9000, 9002, 20035, 69999,
+                       70000):
+            m = tr.matcher("text", term, field.format)
+            m.skip_to(target)
+            i = bisect_left(ids, target)
+            if i == len(ids):
+                assert not m.is_active()
+            else:
+                assert m.id() == ids[i]
+                # The matcher can keep going from the new position
+                assert list(m.all_ids()) == ids[i:]
+
+        # Multiple skips in the same matcher
+        m = tr.matcher("text", term, field.format)
+        for target in (50, 51, 700, 701, 4000):
+            if not m.is_active():
+                break
+            m.skip_to(target)
+            if m.is_active():
+                assert m.id() == ids[bisect_left(ids, target)]
+
+
+def test_w4_terms():
+    from whoosh.codec.whoosh3 import W3Codec
+    from whoosh.codec.whoosh4 import W4Codec, W4TermsReader
+    from whoosh.util.text import rcompile
+
+    schema = fields.Schema(a=fields.TEXT, b=fields.KEYWORD, n=fields.NUMERIC)
+    domain = [u("").join(random.choice(u("abcd")) for _ in xrange(4))
+              for _ in xrange(200)]
+    st = RamStorage()
+    ix = st.create_index(schema)
+    for i, codec in enumerate((W3Codec(), W4Codec(), W4Codec())):
+        with ix.writer(codec=codec) as w:
+            for j in xrange(30):
+                w.add_document(a=u(" ").join(random.sample(domain, 5)),
+                               b=u("x%d y%d") % (i, j), n=i * 100 + j)
+            w.merge = False
+
+    with ix.reader() as r:
+        assert len(r.leaf_readers()) == 3
+        sub = r.leaf_readers()[1][0]
+        assert isinstance(sub._terms, W4TermsReader)
+        words = sorted(set(r.lexicon("a")))
+        assert sorted(set(sub.lexicon("b"))) == [b("x1")] + sorted(
+            b("y%d" % j) for j in xrange(30))
+        btext = list(sub.lexicon("a"))[3]
+        assert sub.doc_frequency("a", btext) >= 1
+        assert sub.frequency("a", btext) >= 1
+        assert sub.frequency("a", b("zzzz")) == 0
+
+        cur = sub.cursor("a")
+        assert cur.text() == list(sub.lexicon("a"))[0].decode("ascii")
+        assert cur.find(u("dddda")) is None
+        assert not cur.is_valid()
+        assert cur.first() is not None
+        assert cur.term_info().doc_frequency() >= 1
+
+        with ix.searcher() as s:
+            assert len(s.search(query.NumericRange("n", 110, 205))) == 26
+
+        for pattern in (u("a?c?"), u("ab*"), u("?b?*"), u("?b*d"), u("b?"),
+                        u("*c"), u("[ab]b*")):
+            q = query.Wildcard("a", pattern)
+            exp = rcompile(fnmatch.translate(pattern))
+            target = [w for w in words if exp.match(w.decode("ascii"))]
+            assert list(q._btexts(r)) == target
+            assert list(q._btexts(sub)) == [w for w in target
+                                            if (("a", w) in sub)]
+
+        target = set(w.decode("ascii") for w in words
+                     if sum(x != y for x, y in zip(w, b("abcd"))) <= 1)
+        assert set(r.terms_within("a", u("abcd"), 1)) >= target
+
+
+def test_w4_stored_fields():
+    from whoosh.codec.whoosh4 import StoredFieldsColumn
+
+    st = RamStorage()
+    docs = {}
+    for docnum in xrange(0, 500, 3):
+        d = {"id": docnum, "title": u("doc %d") % docnum}
+        if docnum % 2:
+            d["body"] = u("x") * docnum
+        else:
+            d["tags"] = [docnum, (u("a"), b("b")), {"c": 1.5}]
+        docs[docnum] = d
+
+    col = StoredFieldsColumn(blocksize=8, blockbytes=1024, cachesize=2)
+    with st.create_file("test") as f:
+        cw = col.writer(f)
+        for docnum in sorted(docs):
+            cw.add(docnum, docs[docnum])
+        cw.finish(505)
+        length = f.tell()
+
+    f = st.open_file("test")
+    cr = col.reader(f, 0, length, 505)
+    for docnum in xrange(505):
+        assert cr[docnum] == docs.get(docnum)
+        assert cr.fields(docnum) == docs.get(docnum, {})
+        assert cr.fields(docnum, ["title", "nope"]) == (
+            {"title": docs[docnum]["title"]} if docnum in docs else {})
+    # Documents in the same block are only decompressed once
+    cr._cache.clear()
+    cr.fields(0, ["id"])
+    cr.fields(3, ["title"])
+    assert cr._cache.misses == 1
+    assert cr._cache.hits == 1
+    f.close()
+
+
+def test_w4_migrate():
+    from whoosh.codec.whoosh3 import W3Codec
+    from whoosh.codec.whoosh4 import W4Codec, migrate
+
+    schema = fields.Schema(id=fields.ID(stored=True),
+                           text=fields.TEXT(vector=True))
+    domain = u("alfa bravo charlie delta echo foxtrot golf hotel").split()
+    st = RamStorage()
+    ix = st.create_index(schema)
+    for i in xrange(3):
+        with ix.writer(codec=W3Codec()) as w:
+            for j in xrange(10):
+                text = " ".join(domain[(i + j) % 8:(i + j) % 8 + 3])
+                w.add_document(id=text_type(i * 10 + j), text=text)
+    with ix.writer(codec=W4Codec()) as w:
+        w.add_document(id=u("30"), text=u("alfa alfa golf"))
+        w.merge = False
+
+    with ix.searcher() as s:
+        before = [(hit["id"], hit.score) for hit
+                  in s.search(query.Term("text", "delta"), limit=None)]
+        vector = list(s.vector(30, "text").items_as("weight"))
+    assert vector == [("alfa", 2.0), ("golf", 1.0)]
+
+    migrate(ix)
+    segments = ix._segments()
+    assert all(isinstance(seg.codec(), W4Codec) for seg in segments)
+    assert len(segments) == 2
+
+    with ix.searcher() as s:
+        after = [(hit["id"], hit.score) for hit
+                 in s.search(query.Term("text", "delta"), limit=None)]
+        assert sorted(i for i, _ in after) == sorted(i for i, _ in before)
+        docnum = s.document_number(id="30")
+        assert list(s.vector(docnum, "text").items_as("weight")) == vector
+
+
+def test_w4_deletion_files():
+    from whoosh.codec.whoosh4 import W4Codec
+
+    schema = fields.Schema(id=fields.ID(stored=True))
+    st = RamStorage()
+    ix = st.create_index(schema)
+    with ix.writer(codec=W4Codec()) as w:
+        for i in xrange(100):
+            w.add_document(id=text_type(i))
+
+    with ix.writer() as w:
+        for i in xrange(0, 100, 3):
+            w.delete_by_term("id", text_type(i))
+
+    segment = ix._segments()[0]
+    assert segment.deletions_filename() == segment.make_filename(".2.del")
+    assert st.file_exists(segment.deletions_filename())
+    # The deletions aren't pickled into the TOC
+    assert segment.__getstate__()["_deleted"] is None
+    assert segment.deleted_count() == 34
+    assert sorted(segment.deleted_docs()) == list(xrange(0, 100, 3))
+
+    with ix.writer() as w:
+        w.delete_by_term("id", u("1"))
+        w.delete_document(0, delete=False)
+
+    segment = ix._segments()[0]
+    # The file from the previous generation was cleaned up
+    assert not st.file_exists(segment.make_filename(".2.del"))
+    assert segment.deletions_filename() == segment.make_filename(".3.del")
+    assert segment.deleted_count() == 34
+    assert segment.is_deleted(1)
+    assert not segment.is_deleted(0)
+
+    with ix.searcher() as s:
+        ids = set(hit["id"] for hit in s.search(query.Every(), limit=None))
+        target = set(text_type(i) for i in xrange(100) if i % 3 and i != 1)
+        target.add(u("0"))
+        assert ids == target
+        assert s.doc_count() == 66
+
+
+def test_deletion_version():
+    from whoosh.codec.whoosh3 import W3Codec
+    from whoosh.codec.whoosh4 import W4Codec
+
+    schema = fields.Schema(id=fields.ID(stored=True))
+    for codec in (W3Codec(), W4Codec()):
+        ix = RamStorage().create_index(schema)
+        with ix.writer(codec=codec) as w:
+            for i in xrange(10):
+                w.add_document(id=text_type(i))
+        assert ix._segments()[0].deletion_version() is None
+
+        with ix.writer() as w:
+            w.delete_document(4)
+        segment = ix._segments()[0]
+        version = segment.deletion_version()
+        assert version is not None
+        assert segment.deletion_version() == version
+        # Copies of the segment read from the same TOC have the same version
+        assert ix._segments()[0].deletion_version() == version
+
+        # Undeleting a document and deleting another one gives a new version
+        with ix.writer() as w:
+            w.delete_document(4, delete=False)
+            w.delete_document(6)
+        segment = ix._segments()[0]
+        assert segment.deleted_count() == 1
+        assert segment.deletion_version() not in (None, version)
+
+
+def test_w4_raw_merge():
+    from whoosh.codec.whoosh4 import W4Codec, W4FieldWriter
+
+    schema = fields.Schema(id=fields.ID(stored=True),
+                           text=fields.TEXT(phrase=True))
+    domain = u("alfa bravo charlie delta echo foxtrot golf hotel").split()
+    st = RamStorage()
+    ix = st.create_index(schema)
+    for i in xrange(3):
+        with ix.writer(codec=W4Codec(blocklimit=4)) as w:
+            for j in xrange(30):
+                n = i * 30 + j
+                words = [domain[(n * k) % 8] for k in xrange(1, n % 5 + 2)]
+                w.add_document(id=text_type(n), text=u(" ").join(words))
+            w.merge = False
+
+    def postings(s):
+        result = {}
+        for t in domain:
+            if ("text", t) not in s.reader():
+                continue
+            m = s.postings("text", t)
+            items = []
+            while m.is_active():
+                items.append((s.stored_fields(m.id())["id"], m.weight(),
+                              m.value_as("positions")))
+                m.next()
+            result[t] = sorted(items)
+        return result
+
+    with ix.searcher() as s:
+        before = postings(s)
+        bscores = [(hit["id"], hit.score) for hit
+                   in s.search(query.Term("text", u("alfa")), limit=None)]
+
+    copied = []
+    add_raw = W4FieldWriter.add_raw
+
+    def counting(self, docnum, rawpostings):
+        copied.append(docnum)
+        return add_raw(self, docnum, rawpostings)
+    W4FieldWriter.add_raw = counting
+    try:
+        with ix.writer(codec=W4Codec(blocklimit=4)) as w:
+            w.add_document(id=u("90"), text=u("alfa golf"))
+            w.optimize = True
+    finally:
+        W4FieldWriter.add_raw = add_raw
+
+    # The posting lists of the merged segments were copied, not re-encoded
+    assert copied
+    assert len(ix._segments()) == 1
+    with ix.searcher() as s:
+        after = postings(s)
+        before["alfa"].append((u("90"), 1.0, [0]))
+        before["golf"].append((u("90"), 1.0, [1]))
+        assert after == dict((t, sorted(v)) for t, v in before.items())
+
+        # Skipping uses the rebuilt skip table
+        m = s.postings("text", u("alfa"))
+        ids = list(s.postings("text", u("alfa")).all_ids())
+        m.skip_to(ids[len(ids) // 2])
+        assert m.id() == ids[len(ids) // 2]
+
+        ti = s.reader().term_info("text", u("alfa"))
+        assert ti.doc_frequency() == len(ids)
+        assert ti.min_id() == ids[0]
+        assert ti.max_id() == ids[-1]
+
+        ascores = dict((hit["id"], hit.score) for hit
+                       in s.search(query.Term("text", u("alfa")), limit=None))
+        assert len(ascores) == len(bscores) + 1
+
+
+def test_bloom_filters():
+    from whoosh.filedb.filetables import BloomFilter, bloom_hashes
+
+    keys = [b("key%d" % i) for i in xrange(1001)]
+    bf = BloomFilter.from_hashes((bloom_hashes(k) for k in keys), len(keys))
+    assert all(k in bf for k in keys)
+    bf = BloomFilter.from_bytes(bf.to_bytes(), bf.numhashes)
+    assert bf.numbits == len(bf.to_bytes()) * 8
+    assert all(k in bf for k in keys)
+    misses = sum(1 for i in xrange(1000) if b("other%d" % i) in bf)
+    assert misses < 50
+
+    schema = fields.Schema(id=fields.ID(stored=True, unique=True),
+                           text=fields.TEXT)
+    ix = RamStorage().create_index(schema)
+    for start in (0, 100):
+        with ix.writer() as w:
+            for i in xrange(start, start + 100):
+                w.add_document(id=u("%d") % i, text=u("alfa"))
+            w.merge = False
+
+    with ix.reader() as r:
+        for sr, _ in r.leaf_readers():
+            blooms = sr.codec().bloom_filters(sr.storage(), sr.segment())
+            assert list(blooms.keys()) == ["id"]
+
+        # The filter of the first segment rules out (nearly all) the IDs in
+        # the second segment without looking them up
+        sr = r.leaf_readers()[0][0]
+        passed = [i for i in xrange(100, 200)
+                  if sr._may_contain("id", b("%d" % i))]
+        assert len(passed) < 10
+        assert all(sr._may_contain("id", b("%d" % i)) for i in xrange(100))
+        assert sr._may_contain("text", b("bravo"))
+        assert ("id", u("150")) not in sr
+        assert ("id", u("50")) in sr
+
+    with ix.searcher() as s:
+        assert s.document_number(id=u("150")) is not None
+        assert s.document_number(id=u("250")) is None
+        docnum = s.document_number(id=u("42"))
+        assert s.stored_fields(docnum) == {"id": u("42")}
+
+
+def test_parallel_compression():
+    from whoosh.codec.whoosh3 import W3Codec
+    from whoosh.codec.whoosh4 import W4Codec
+
+    schema = fields.Schema(id=fields.ID(stored=True),
+                           text=fields.TEXT(stored=True),
+                           tag=fields.KEYWORD(vector=True))
+    words = u("alfa bravo charlie delta echo foxtrot golf hotel").split()
+
+    def build(codec):
+        st = RamStorage()
+        ix = st.create_index(schema)
+        w = ix.writer(codec=codec, compound=False)
+        for i in xrange(2000):
+            text = u(" ").join(words[j % len(words)]
+                               for j in xrange(i % 7, i % 7 + i % 13))
+            w.add_document(id=u("%d") % i, text=text,
+                           tag=words[i % len(words)])
+        w.commit()
+        segment = ix._segments()[0]
+        files = {}
+        for name in st.list():
+            if name.startswith(segment.make_filename("")):
+                ext = name[len(segment.make_filename("")):]
+                files[ext] = st.open_file(name).read()
+        return ix, files
+
+    for codec in (W3Codec, W4Codec):
+        sx, serial = build(codec())
+        px, parallel = build(codec(compressthreads=3))
+        assert sorted(parallel) == sorted(serial)
+        for ext in serial:
+            assert parallel[ext] == serial[ext], ext
+
+        with sx.searcher() as ss:
+            with px.searcher() as ps:
+                q = query.Term("text", u("charlie"))
+                assert ([hit["id"] for hit in ps.search(q, limit=None)] ==
+                        [hit["id"] for hit in ss.search(q, limit=None)])
+                assert ps.document(id=u("1234"))["id"] == u("1234")
+                assert ps.doc_frequency("tag", u("golf")) == 250
+
+
+def test_parallel_compression_cancel():
+    import threading
+    from whoosh.codec.whoosh3 import W3Codec
+
+    schema = fields.Schema(id=fields.ID(stored=True), text=fields.TEXT)
+    ix = RamStorage().create_index(schema)
+    threads = threading.active_count()
+
+    # Cancelling the writer shuts down the compression threads
+    w = ix.writer(codec=W3Codec(compressthreads=3))
+    for i in xrange(100):
+        w.add_document(id=u("%d") % i, text=u("alfa bravo charlie"))
+    assert threading.active_count() > threads
+    w.cancel()
+    assert threading.active_count() == threads
+
+    # So does an error while writing the postings
+    class BadPostings(Exception):
+        pass
+
+    def postings():
+        for i in xrange(1000):
+            yield ("text", b("alfa"), i, 1.0, b(""))
+        raise BadPostings
+
+    codec = W3Codec(compressthreads=3)
+    segment = codec.new_segment(ix.storage, "bad")
+    fw = codec.field_writer(ix.storage, segment)
+    with pytest.raises(BadPostings):
+        fw.add_postings(schema, None, postings())
+    assert threading.active_count() == threads
+
+
+def test_parallel_compressor_order():
+    import zlib
+    from whoosh.util.compression import ParallelCompressor
+
+    out = []
+    # Small batches and a small window, so the compressor has to wait for
+    # batches while data is still being submitted
+    pc = ParallelCompressor(4, batchsize=100, window=2)
+    for i in xrange(500):
+        pc.compress(zlib.compress, b("value%d" % i) * 10, 3, out.append)
+        if i % 50 == 0:
+            pc.call(out.append, i)
+    pc.close()
+
+    expected = []
+    for i in xrange(500):
+        expected.append(zlib.compress(b("value%d" % i) * 10, 3))
+        if i % 50 == 0:
+            expected.append(i)
+    assert out == expected
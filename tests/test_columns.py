@@ -246,6 +246,159 @@ def test_column_query():
             assert check(q) == [4, 5, 6]
 
 
+def test_read_range():
+    def rw(col, values, doccount):
+        st = RamStorage()
+        f = st.create_file("test")
+        cw = col.writer(f)
+        for i, v in enumerate(values):
+            cw.add(i, v)
+        cw.finish(doccount)
+        length = f.tell()
+        f.close()
+        return col.reader(st.open_file("test"), 0, length, doccount)
+
+    nums = [random.randint(0, 2 ** 31) for _ in xrange(100)]
+    for typecode in "iIqQ":
+        cr = rw(columns.NumericColumn(typecode, default=7), nums, 110)
+        target = nums + [7] * 10
+        assert list(cr.read_range(0, 110)) == target
+        assert list(cr.read_range(15, 40)) == target[15:40]
+        assert list(cr.read_range(95, 200)) == target[95:]
+        assert list(cr.read_range(105, 108)) == [7, 7, 7]
+        assert list(cr.read_range(50, 50)) == []
+
+    fnums = [random.random() for _ in xrange(20)]
+    cr = rw(columns.NumericColumn("d"), fnums, 20)
+    assert list(cr.read_range(5, 10)) == fnums[5:10]
+
+    pairs = [(i, i * 2) for i in xrange(10)]
+    cr = rw(columns.StructColumn("=IH", (0, 0)), pairs, 12)
+    assert cr.read_range(8, 12) == pairs[8:] + [(0, 0), (0, 0)]
+
+    cr = rw(columns.FixedBytesColumn(2), [b("ab"), b("cd"), b("ef")], 4)
+    assert cr.read_range(1, 4) == [b("cd"), b("ef"), b("\x00\x00")]
+
+    ecr = columns.EmptyColumnReader(5, 3)
+    assert ecr.read_range(1, 10) == [5, 5]
+
+    a = rw(columns.NumericColumn("I"), [1, 2, 3], 4)
+    b_ = rw(columns.NumericColumn("I"), [4, 5], 2)
+    mcr = columns.MultiColumnReader([a, ecr, b_])
+    assert list(mcr.read_range(0, 9)) == [1, 2, 3, 0, 5, 5, 5, 4, 5]
+    assert list(mcr.read_range(2, 8)) == list(mcr)[2:8]
+
+    tcr = columns.TranslatingColumnReader(a, lambda v: v * 10)
+    assert tcr.read_range(1, 3) == [20, 30]
+
+
+def test_column_range():
+    schema = fields.Schema(id=fields.STORED,
+                           price=fields.NUMERIC(sortable=True),
+                           n=fields.NUMERIC(sortable=True))
+    with TempIndex(schema) as ix:
+        with ix.writer() as w:
+            for i in xrange(10000):
+                w.add_document(id=i, price=i - 5000, n=i % 100)
+
+        with ix.searcher() as s:
+            q = query.ColumnRange("price", -10, 20)
+            assert list(q.docs(s)) == list(xrange(4990, 5021))
+            q = query.ColumnRange("price", -10, 20, startexcl=True,
+                                  endexcl=True)
+            assert list(q.docs(s)) == list(xrange(4991, 5020))
+            q = query.ColumnRange("price", None, -4993)
+            assert list(q.docs(s)) == list(xrange(0, 8))
+
+            q = query.ColumnRange("n", 98, None)
+            target = [i for i in xrange(10000) if i % 100 >= 98]
+            assert [hit["id"] for hit in s.search(q, limit=None)] == target
+
+            # Check skipping in a matcher spanning several chunks
+            m = q.matcher(s)
+            m.skip_to(4500)
+            assert m.id() == 4598
+            m.skip_to(9999)
+            assert m.id() == 9999
+            m.next()
+            assert not m.is_active()
+
+            q = query.And([query.ColumnRange("n", 10, 12),
+                           query.ColumnQuery("price", lambda v: v >= 4600)])
+            target = [i for i in xrange(9600, 10000) if 10 <= i % 100 <= 12]
+            assert sorted(s.docs_for_query(q)) == target
+
+
+def test_zone_maps():
+    st = RamStorage()
+    doccount = 1000
+    values = dict((i, i * 3) for i in xrange(0, 700) if i % 7)
+    values.update((i, 5000 + i) for i in xrange(800, 900))
+
+    col = columns.NumericColumn("i", default=-1, zonesize=100)
+    f = st.create_file("num")
+    cw = col.writer(f)
+    for docnum in sorted(values):
+        cw.add(docnum, values[docnum])
+    cw.finish(doccount)
+    length = f.tell()
+    f.close()
+
+    cr = col.reader(st.open_file("num"), 0, length, doccount)
+    target = [values.get(i, -1) for i in xrange(doccount)]
+    assert list(cr) == target
+    assert cr.zone_size() == 100
+    for zonenum in xrange(10):
+        zvalues = target[zonenum * 100:(zonenum + 1) * 100]
+        assert cr.zone(zonenum) == (min(zvalues), max(zvalues))
+
+    # A reader for a column without a zone map
+    assert columns.NumericColumn("i").reader(st.open_file("num"), 0, length,
+                                              doccount).zone_size() == 0
+
+    col = columns.StructColumn("!HB", (0, 0), zonesize=4)
+    f = st.create_file("struct")
+    cw = col.writer(f)
+    cw.add(1, (5, 1))
+    cw.add(2, (3, 9))
+    cw.add(4, (7, 7))
+    cw.finish(6)
+    length = f.tell()
+    f.close()
+
+    cr = col.reader(st.open_file("struct"), 0, length, 6)
+    assert list(cr) == [(0, 0), (5, 1), (3, 9), (0, 0), (7, 7), (0, 0)]
+    assert cr.zone(0) == ((0, 0), (5, 1))
+    assert cr.zone(1) == ((0, 0), (7, 7))
+
+
+def test_zone_skipping():
+    schema = fields.Schema(id=fields.STORED, n=fields.NUMERIC(sortable=True))
+    with TempIndex(schema) as ix:
+        with ix.writer() as w:
+            for i in xrange(5000):
+                w.add_document(id=i, n=i)
+
+        with ix.searcher() as s:
+            r = s.reader()
+            creader = r.column_reader("n", translate=False)
+            assert creader.zone_size() == 1024
+
+            q = query.ColumnRange("n", 2000, 3100)
+            m = q.matcher(s)
+            tested = []
+            test_values = m._test_values
+
+            def counting(start, end):
+                tested.append((start, end))
+                return test_values(start, end)
+            m._test_values = counting
+
+            assert list(m.all_ids()) == list(xrange(2000, 3101))
+            # Only the zones the range partially covers were read
+            assert tested == [(1024, 2048), (3072, 4096)]
+
+
 def test_ref_switch():
     import warnings
 
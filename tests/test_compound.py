@@ -52,6 +52,33 @@ def test_simple_compound_nomap():
     _test_simple_compound(st)
 
 
+def test_compound_views():
+    with TempStorage("compoundviews") as st:
+        with st.create_file("a") as af:
+            af.write(b("alfa bravo charlie"))
+        with st.create_file("b") as bf:
+            for x in (10, 20, 30):
+                bf.write_int(x)
+
+        f = st.create_file("f")
+        CompoundStorage.assemble(f, st, ["a", "b"])
+
+        for use_mmap in (True, False):
+            cs = CompoundStorage(st.open_file("f"), use_mmap=use_mmap)
+            af = cs.open_file("a")
+            assert bytes(af.view(5, 5)) == b("bravo")
+            assert af.get(11, 7) == b("charlie")
+            sub = af.subset(5, 13)
+            assert bytes(sub.view(6, 7)) == b("charlie")
+            af.close()
+
+            bf = cs.open_file("b")
+            assert list(bf.get_array(4, "i", 2)) == [20, 30]
+            assert bf.get_int(8) == 30
+            bf.close()
+            cs.close()
+
+
 #def test_unclosed_mmap():
 #    with TempStorage("unclosed") as st:
 #        assert st.supports_mmap
@@ -389,6 +389,41 @@ def test_random_union():
         assert list(um.all_ids()) == target
 
 
+def test_wand_union():
+    vals = list(range(200))
+
+    for _ in xrange(50):
+        matchers = []
+        scores = {}
+        for _ in xrange(randint(2, 8)):
+            ids = sorted(sample(vals, randint(2, 40)))
+            weights = [float(randint(1, 10)) for _ in ids]
+            for docid, w in zip(ids, weights):
+                scores[docid] = scores.get(docid, 0.0) + w
+            matchers.append(matching.ListMatcher(ids, weights))
+        target = sorted(scores.items())
+
+        # Without a minimum quality the matcher is a plain union
+        wm = matching.WandUnionMatcher([m.copy() for m in matchers])
+        result = []
+        while wm.is_active():
+            result.append((wm.id(), wm.score()))
+            wm.next()
+        assert result == target
+
+        # With a minimum quality, every document scoring higher than the
+        # minimum must still be found
+        minq = float(randint(1, 20))
+        wm = matching.WandUnionMatcher([m.copy() for m in matchers])
+        wm = wm.replace(minq)
+        found = set()
+        while wm.is_active():
+            assert wm.score() == scores[wm.id()]
+            found.add(wm.id())
+            wm.next()
+        assert set(d for d, s in target if s > minq) <= found
+
+
 def test_inverse():
     s = matching.ListMatcher([1, 5, 10, 11, 13])
     inv = matching.InverseMatcher(s, 15)
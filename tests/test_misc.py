@@ -1,7 +1,7 @@
 from __future__ import with_statement
 import os, threading, time
 
-from whoosh.compat import u
+from whoosh.compat import u, xrange
 from whoosh.util.filelock import try_for
 from whoosh.util.numeric import length_to_byte, byte_to_length
 from whoosh.util.testing import TempStorage
@@ -127,6 +127,50 @@ def test_double_barrel_lru():
     # assert test.cache_info() == (0, 0, 5, 0)
 
 
+def test_lru_cache_object():
+    from whoosh.util.cache import LRUCache
+
+    cache = LRUCache(5)
+    for n in xrange(5):
+        cache.put(n, n * 2)
+    assert cache.get(0) == 0
+    assert cache.get(10) is None
+    # Adding a sixth value throws out the least recently used one (1)
+    cache.put(5, 10)
+    assert len(cache) == 5
+    assert 1 not in cache
+    assert 0 in cache
+    assert cache.cache_info() == (1, 1, 5, 5)
+
+    cache.discard(0)
+    assert 0 not in cache
+    cache.clear()
+    assert cache.cache_info() == (0, 0, 5, 0)
+
+    # Sizes measured by a function
+    cache = LRUCache(10, sizefn=len)
+    cache.put("a", "xxxx")
+    cache.put("b", "xxxx")
+    cache.put("c", "xxxxxxxxxxxx")  # Too big to cache
+    assert "c" not in cache
+    assert cache.size() == 8
+    cache.get("a")
+    cache.put("d", "xxxx")
+    assert "b" not in cache
+    assert sorted(k for k in "abcd" if k in cache) == ["a", "d"]
+
+    # Only as many values as needed are thrown out
+    cache = LRUCache(100)
+    for n in xrange(100):
+        cache.put(n, n)
+    cache.get(0)
+    cache.put(100, 100)
+    assert len(cache) == 100
+    assert 0 in cache
+    assert 1 not in cache
+    assert 2 in cache
+
+
 def test_version_object():
     from whoosh.util.versions import SimpleVersion as sv
 
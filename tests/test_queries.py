@@ -598,3 +598,63 @@ def test_andnot_reverse():
 
     assert len(names_fw) == len(names_rv) == 1
     assert names_fw == names_rv
+
+
+def test_numeric_range_zones():
+    schema = fields.Schema(id=fields.STORED, n=fields.NUMERIC(sortable=True),
+                           m=fields.NUMERIC(sortable=True))
+    with TempIndex(schema) as ix:
+        with ix.writer() as w:
+            for i in range(20000):
+                if i < 100:
+                    w.add_document(id=i)
+                else:
+                    w.add_document(id=i, n=i - 10000, m=i % 10)
+
+        with ix.writer() as w:
+            w.delete_document(10010)
+
+        with ix.searcher() as s:
+            r = s.reader()
+            for start, end in [(-500, 600), (-500, None), (None, -8000),
+                               (100, 100), (50000, None)]:
+                q = NumericRange("n", start, end, usecolumn=True)
+                # The zone map covers this time-ordered field
+                assert q._zone_docs(r) is not None
+                target = list(NumericRange("n", start, end).docs(s))
+                assert sorted(q.docs(s)) == sorted(target)
+
+            q = NumericRange("n", -500, 600, startexcl=True, endexcl=True,
+                             usecolumn=True)
+            assert sorted(q.docs(s)) == [i + 10000 for i in range(-499, 600)
+                                         if i != 10]
+
+            # Every zone of this field overlaps the range, so it uses the
+            # terms instead
+            q = NumericRange("m", 2, 3, usecolumn=True)
+            assert q._zone_docs(r) is None
+
+
+def test_numeric_range_multivalued():
+    # The column of a multi-valued field only has the first value of each
+    # document, so by default the range uses the index terms
+    schema = fields.Schema(id=fields.STORED, n=fields.NUMERIC(sortable=True))
+    ix = RamStorage().create_index(schema)
+    with ix.writer() as w:
+        for i in range(5000):
+            w.add_document(id=i, n=[i, i + 100000])
+
+    q = NumericRange("n", 100000, 100010)
+    with ix.searcher() as s:
+        assert sorted(q.docs(s)) == list(range(11))
+        assert len(s.search(query.Every(), filter=q, limit=None)) == 11
+
+        # A query that uses the column is a different query (and filter
+        # cache entry)
+        cq = NumericRange("n", 100000, 100010, usecolumn=True)
+        assert cq != q
+        assert hash(cq) != hash(q)
+        assert "usecolumn=True" in repr(cq)
+        assert "usecolumn" not in repr(q)
+        s.search(query.Every(), filter=cq, limit=None)
+        assert len(s.search(query.Every(), filter=q, limit=None)) == 11
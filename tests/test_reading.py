@@ -498,3 +498,45 @@ def test_term_inspection_multi_reader():
             w.merge = False
 
         _check_inspection_results(ix)
+
+
+def test_block_cache():
+    from whoosh.codec.whoosh3 import W3Codec
+    from whoosh.codec.whoosh4 import W4Codec
+    from whoosh.util.cache import LRUCache
+
+    schema = fields.Schema(text=fields.TEXT(stored=True))
+    ix = RamStorage().create_index(schema)
+    for codec in (W3Codec(blocklimit=8), W4Codec(blocklimit=8)):
+        with ix.writer(codec=codec) as w:
+            w.merge = False
+            for i in xrange(50):
+                w.add_document(text=u("alfa bravo %s") % (u("charlie") * i))
+
+    def postings(r):
+        items = []
+        for fieldname, text in (("text", "alfa"), ("text", "bravo")):
+            m = r.postings(fieldname, text)
+            while m.is_active():
+                items.append((m.id(), m.weight(), m.value()))
+                m.next()
+        return items
+
+    with ix.reader() as r:
+        assert len(r.leaf_readers()) == 2
+        target = postings(r)
+
+    cache = LRUCache(100)
+    with ix.reader(blockcache=cache) as r:
+        assert postings(r) == target
+    # 2 segments * 2 terms * 7 blocks
+    assert cache.cache_info() == (0, 28, 100, 28)
+
+    # A new reader gets the blocks from the cache
+    with ix.searcher(blockcache=cache) as s:
+        assert postings(s.reader()) == target
+    assert cache.cache_info() == (28, 28, 100, 28)
+
+    # The process-wide cache
+    with ix.reader(blockcache=True) as r:
+        assert postings(r) == target
@@ -373,6 +373,93 @@ def test_resultspage():
         assert rp.is_last_page()
 
 
+def test_search_after():
+    schema = fields.Schema(id=fields.STORED, num=fields.NUMERIC(sortable=True),
+                           content=fields.TEXT(stored=True))
+    ix = RamStorage().create_index(schema)
+
+    domain = ("alfa", "bravo", "bravo", "charlie", "delta")
+    for chunk in (0, 1):
+        with ix.writer() as w:
+            for i, lst in enumerate(permutations(domain, 3)):
+                if i % 2 == chunk:
+                    w.add_document(id=i, num=i % 7,
+                                   content=u(" ").join(lst))
+            w.merge = False
+
+    def walk(s, q, pagelen, **kwargs):
+        hits = []
+        page = s.search_after(q, pagelen=pagelen, **kwargs)
+        while page.pagelen:
+            assert page.offset == len(hits)
+            assert page.pagenum == len(hits) // pagelen + 1
+            hits.extend(hit["id"] for hit in page)
+            if page.is_last_page():
+                assert len(hits) == page.total
+            page = s.search_after(q, page.cursor(), pagelen=pagelen,
+                                  **kwargs)
+        assert page.cursor() is None
+        return hits
+
+    with ix.searcher() as s:
+        q = query.Term("content", u("bravo"))
+        ids = [hit["id"] for hit in s.search(q, limit=None)]
+        assert len(ids) == 54
+        assert walk(s, q, 7) == ids
+
+        # Cursors from search_page work too
+        rp = s.search_page(q, 2, pagelen=10)
+        page = s.search_after(q, rp.cursor(), pagelen=10)
+        assert page.offset == 20
+        assert page.pagenum == 3
+        assert [hit["id"] for hit in page] == ids[20:30]
+
+        # A hand-made (score, docnum) cursor
+        r = s.search(q, limit=None)
+        page = s.search_after(q, (r.score(4), r.docnum(4)), pagelen=3)
+        assert [hit["id"] for hit in page] == ids[5:8]
+
+        # Sorted and filtered results
+        bravo = query.Term("content", u("bravo"))
+        for reverse in (False, True):
+            r = s.search(query.Every(), sortedby="num", reverse=reverse,
+                         filter=bravo, limit=None)
+            ids = [hit["id"] for hit in r]
+            assert walk(s, query.Every(), 5, sortedby="num",
+                        reverse=reverse, filter=bravo) == ids
+
+        with pytest.raises(ValueError):
+            s.search_after(q, (1.0, 5), reverse=True)
+
+
+def test_search_after_ties():
+    import random
+
+    # Short documents from a small vocabulary give many tied scores
+    random.seed(0)
+    domain = u("alfa bravo charlie delta echo foxtrot").split()
+    schema = fields.Schema(id=fields.STORED, text=fields.TEXT)
+    ix = RamStorage().create_index(schema)
+    with ix.writer() as w:
+        for i in xrange(6000):
+            words = [random.choice(domain)
+                     for _ in xrange(random.randint(1, 12))]
+            w.add_document(id=i, text=u(" ").join(words))
+
+    q = query.Or([query.Term("text", t) for t in domain[:4]])
+    with ix.searcher() as s:
+        full = [(hit.score, hit.docnum) for hit in s.search(q, limit=None)]
+        assert len(full) > 5000
+
+        # Paging all the way through gives exactly the full results
+        hits = []
+        page = s.search_after(q, pagelen=500)
+        while page.pagelen:
+            hits.extend((hit.score, hit.docnum) for hit in page)
+            page = s.search_after(q, page.cursor(), pagelen=500)
+        assert hits == full
+
+
 def test_highlight_setters():
     schema = fields.Schema(text=fields.TEXT)
     ix = RamStorage().create_index(schema)
@@ -673,3 +760,36 @@ def test_filter_by_result():
             assert all(x["title"] == "even" and x["content"] == "foo"
                        for x in result)
 
+
+
+def test_projected_fields():
+    from whoosh.codec.whoosh4 import W4Codec
+
+    schema = fields.Schema(id=fields.ID(stored=True),
+                           title=fields.TEXT(stored=True),
+                           body=fields.TEXT(stored=True))
+    ix = RamStorage().create_index(schema)
+    for codec in (W3Codec(), W4Codec()):
+        with ix.writer(codec=codec) as w:
+            for i in xrange(10):
+                w.add_document(id=text_type(i), title=u("title %d") % i,
+                               body=u("alfa bravo %d") % i)
+            w.merge = False
+
+    with ix.searcher() as s:
+        r = s.search(query.Term("body", "alfa"), limit=None)
+        assert len(r) == 20
+        for n in xrange(len(r)):
+            full = r.fields(n)
+            assert set(full) == set(["id", "title", "body"])
+            assert r.fields(n, fieldnames=["title"]) == {"title": full["title"]}
+            assert r.fields(n, fieldnames=["title", "nope"]) == {
+                "title": full["title"]}
+
+            hit = r[n]
+            assert hit["title"] == full["title"]
+            assert hit.get("id") == full["id"]
+            assert hit.get("nope", 5) == 5
+            # Getting single fields doesn't load the whole document
+            assert hit._fields is None
+            assert hit.fields() == full
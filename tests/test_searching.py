@@ -1819,6 +1819,441 @@ def test_function_weighting():
             assert not m.supports_block_quality()
 
 
+def test_wand_or():
+    import random
+
+    random.seed(0)
+    domain = [u"w%d" % i for i in xrange(40)]
+    probs = [1.0 / (i + 1) for i in xrange(40)]
+    schema = fields.Schema(id=fields.STORED, text=fields.TEXT)
+    with TempIndex(schema) as ix:
+        with ix.writer(codec=W3Codec(blocklimit=16)) as w:
+            for i in xrange(2000):
+                words = []
+                while len(words) < 8:
+                    r = random.random() * sum(probs)
+                    for word, p in zip(domain, probs):
+                        r -= p
+                        if r <= 0:
+                            words.append(word)
+                            break
+                w.add_document(id=i, text=u" ".join(words))
+
+        with ix.searcher() as s:
+            terms = [u"w0", u"w1", u"w3", u"w12", u"w30"]
+            subs = [query.Term("text", t) for t in terms]
+            q = query.Or(subs)
+            # Scored searches with more than two clauses use the WAND matcher
+            # instead of a tree of unions
+            m = q.matcher(s, s.context(needs_current=True))
+            assert isinstance(m, query.compound.matching.WandUnionMatcher)
+
+            def topn(q, **kwargs):
+                # Documents with the same score may be collected in any order,
+                # so only compare the scores
+                r = s.search(q, limit=20, **kwargs)
+                return [round(hit.score, 6) for hit in r]
+
+            target = topn(query.compound.DefaultOr(subs), optimize=False)
+            assert topn(query.compound.WandOr(subs)) == target
+            assert topn(query.compound.WandOr(subs), optimize=False) == target
+
+
+def test_wand_or_ties():
+    import random
+
+    # Short documents from a small vocabulary give many tied scores
+    random.seed(0)
+    domain = u("alfa bravo charlie delta echo foxtrot").split()
+    schema = fields.Schema(id=fields.STORED, text=fields.TEXT)
+    ix = RamStorage().create_index(schema)
+    with ix.writer(codec=W3Codec(blocklimit=32)) as w:
+        for i in xrange(6000):
+            words = [random.choice(domain)
+                     for _ in xrange(random.randint(1, 12))]
+            w.add_document(id=i, text=u(" ").join(words))
+
+    subs = [query.Term("text", t) for t in domain[:4]]
+    with ix.searcher() as s:
+        q = query.Or(subs)
+        m = q.matcher(s, s.context())
+        assert isinstance(m, query.compound.matching.WandUnionMatcher)
+
+        full = [(hit.score, hit.docnum) for hit in s.search(q, limit=None)]
+        assert len(full) > 5000
+        # The pruned top N is exactly the start of the exhaustive ranking
+        for limit in (10, 50, 200, 1000):
+            top = [(hit.score, hit.docnum) for hit in s.search(q, limit=limit)]
+            assert top == full[:limit]
+
+        # The scores match the binary tree of unions, apart from rounding
+        r = s.search(query.compound.DefaultOr(subs), limit=None)
+        assert (sorted((round(hit.score, 9), hit.docnum) for hit in r)
+                == sorted((round(score, 9), docnum) for score, docnum in full))
+
+
+def _concurrent_index(ix):
+    words = u("alfa bravo charlie delta echo foxtrot golf hotel").split()
+    for seg in xrange(4):
+        with ix.writer() as w:
+            for i in xrange(seg * 50, seg * 50 + 50):
+                text = u(" ").join(words[j % len(words)]
+                                   for j in xrange(i % 5, i % 5 + i % 7 + 1))
+                w.add_document(id=text_type(i), num=i % 13, text=text,
+                               tag=words[i % 3])
+            w.merge = False
+
+
+def _concurrent_searches(s):
+    from whoosh import sorting
+
+    alfa = query.Term("text", u("alfa"))
+    charlie = query.Or([query.Term("text", u("charlie")),
+                        query.Term("text", u("golf"))])
+    results = []
+
+    r = s.search(charlie, limit=5)
+    results.append(([hit["id"] for hit in r], r.scored_length(), len(r)))
+    r = s.search(charlie, limit=None, terms=True)
+    results.append(([(hit["id"], hit.score) for hit in r],
+                    sorted(r.docs()), sorted(r.matched_terms())))
+    r = s.search(alfa, sortedby="num", limit=7)
+    results.append([hit["id"] for hit in r])
+    r = s.search(alfa, groupedby="tag", limit=None)
+    results.append(r.groups("tag"))
+    facet = sorting.FieldFacet("tag", maptype=sorting.Count)
+    r = s.search(alfa, groupedby=facet)
+    results.append(r.groups("tag"))
+    r = s.search(alfa, filter=query.Term("tag", u("bravo")),
+                 mask=query.Term("num", 3), limit=None)
+    results.append((sorted(r.docs()), r.filtered_count))
+    r = s.search(alfa, scored=False, sortedby=None, limit=None)
+    results.append(sorted(r.docs()))
+    # Collapsing isn't done concurrently
+    r = s.search(alfa, collapse="tag", limit=10)
+    results.append([hit["id"] for hit in r])
+    return results
+
+
+def test_concurrent_search():
+    from concurrent.futures import ThreadPoolExecutor
+
+    schema = fields.Schema(id=fields.STORED, num=fields.NUMERIC(sortable=True),
+                           text=fields.TEXT, tag=fields.ID(sortable=True))
+    ix = RamStorage().create_index(schema)
+    _concurrent_index(ix)
+    assert len(ix._segments()) == 4
+
+    with ix.searcher() as s:
+        expected = _concurrent_searches(s)
+
+    executor = ThreadPoolExecutor(3)
+    try:
+        with ix.searcher(executor=executor) as s:
+            assert _concurrent_searches(s) == expected
+            s = s.refresh()
+            assert s._executor is executor
+    finally:
+        executor.shutdown()
+
+
+def test_concurrent_search_terms():
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Short documents from a small vocabulary give many tied scores, within
+    # and across segments
+    random.seed(0)
+    domain = u("alfa bravo charlie delta echo foxtrot").split()
+    schema = fields.Schema(id=fields.STORED, text=fields.TEXT)
+    ix = RamStorage().create_index(schema)
+    for seg in xrange(4):
+        with ix.writer() as w:
+            for i in xrange(seg * 500, seg * 500 + 500):
+                words = [random.choice(domain)
+                         for _ in xrange(random.randint(1, 12))]
+                w.add_document(id=i, text=u(" ").join(words))
+            w.merge = False
+
+    q = query.Or([query.Term("text", t) for t in domain[:4]])
+
+    def searches(s):
+        results = []
+        for limit in (10, 100, None):
+            r = s.search(q, limit=limit, terms=True)
+            docnums = set(hit.docnum for hit in r)
+            assert set(r.docterms) == docnums
+            assert all(set(docs) <= docnums for docs in r.termdocs.values())
+            results.append(([(hit.docnum, hit.score, hit.matched_terms())
+                             for hit in r], r.matched_terms(),
+                            dict((term, list(docs)) for term, docs
+                                 in r.termdocs.items())))
+        return results
+
+    with ix.searcher() as s:
+        expected = searches(s)
+
+    executor = ThreadPoolExecutor(3)
+    try:
+        with ix.searcher(executor=executor) as s:
+            assert searches(s) == expected
+    finally:
+        executor.shutdown()
+
+
+def test_concurrent_search_wrapping_collector():
+    from concurrent.futures import ThreadPoolExecutor
+    from whoosh import collectors
+
+    class CountingCollector(collectors.WrappingCollector):
+        def prepare(self, top_searcher, q, context):
+            collectors.WrappingCollector.prepare(self, top_searcher, q,
+                                                 context)
+            self.collected = 0
+
+        def collect(self, sub_docnum):
+            self.collected += 1
+            return self.child.collect(sub_docnum)
+
+    schema = fields.Schema(id=fields.STORED, num=fields.NUMERIC(sortable=True),
+                           text=fields.TEXT, tag=fields.ID(sortable=True))
+    ix = RamStorage().create_index(schema)
+    _concurrent_index(ix)
+    q = query.Term("text", u("alfa"))
+
+    executor = ThreadPoolExecutor(3)
+    try:
+        with ix.searcher(executor=executor) as s:
+            # The subclass doesn't know how to copy and merge its count, so
+            # the segments are searched one after another
+            c = CountingCollector(collectors.UnlimitedCollector())
+            assert not c.can_merge()
+            s.search_with_collector(q, c)
+            assert c.collected == len(c.results()) == len(list(q.docs(s)))
+
+            # The collectors in whoosh that wrap others can still be merged
+            tc = collectors.TermsCollector(collectors.UnlimitedCollector())
+            assert tc.can_merge()
+    finally:
+        executor.shutdown()
+
+
+def test_concurrent_search_processes():
+    from concurrent.futures import ProcessPoolExecutor
+    from whoosh.util.testing import TempIndex
+
+    schema = fields.Schema(id=fields.STORED, num=fields.NUMERIC(sortable=True),
+                           text=fields.TEXT, tag=fields.ID(sortable=True))
+    with TempIndex(schema) as ix:
+        _concurrent_index(ix)
+        with ix.searcher() as s:
+            expected = _concurrent_searches(s)
+
+        executor = ProcessPoolExecutor(2)
+        try:
+            with ix.searcher(executor=executor) as s:
+                assert _concurrent_searches(s) == expected
+        finally:
+            executor.shutdown()
 
 
+def test_filter_cache():
+    schema = fields.Schema(id=fields.ID(stored=True, unique=True),
+                           tag=fields.KEYWORD, text=fields.TEXT)
+    ix = RamStorage().create_index(schema)
+    for seg in xrange(3):
+        with ix.writer() as w:
+            for i in xrange(seg * 10, seg * 10 + 10):
+                tag = u("even") if i % 2 == 0 else u("odd")
+                w.add_document(id=text_type(i), tag=tag, text=u("alfa bravo"))
+            w.merge = False
 
+    even = query.Term("tag", u("even"))
+    alfa = query.Term("text", u("alfa"))
+    s = ix.searcher()
+    cache = s._filter_cache
+    r = s.search(alfa, filter=even, limit=None)
+    assert sorted(int(hit["id"]) for hit in r) == list(xrange(0, 30, 2))
+    assert len(cache) == 3
+    assert cache.misses == 3
+
+    # The same filter is taken from the cache, even as a mask
+    r = s.search(alfa, mask=even, limit=None)
+    assert len(r) == 15
+    assert cache.hits == 3
+
+    # Delete a document from one segment and add a new segment. Only the sets
+    # for those two segments are computed again
+    with ix.writer() as w:
+        w.delete_by_term("id", u("4"))
+        w.add_document(id=u("30"), tag=u("even"), text=u("alfa"))
+        w.merge = False
+    s = s.refresh()
+    assert s._filter_cache is cache
+    r = s.search(alfa, filter=even, limit=None)
+    assert len(r) == 15
+    assert "4" not in [hit["id"] for hit in r]
+    assert cache.hits == 5
+    assert cache.misses == 5
+    s.close()
+
+    # Undeleting a document and deleting another one leaves the number of
+    # deleted documents the same, but the cached set can't be reused
+    with ix.writer() as w:
+        w.delete_document(4, delete=False)
+        w.delete_by_term("id", u("6"))
+        w.merge = False
+    with ix.searcher(filtercache=cache) as s:
+        r = s.search(alfa, filter=even, limit=None)
+        ids = sorted(int(hit["id"]) for hit in r)
+        assert ids == [i for i in xrange(0, 31, 2) if i != 6]
+
+    # The keys identify the deletions by a version string instead of holding
+    # a copy of the deleted document numbers
+    for (segid, version), fq in cache._data:
+        assert version is None or isinstance(version, str)
+
+    # Searchers can share the process-wide cache
+    with ix.searcher(filtercache=True) as s1:
+        with ix.searcher(filtercache=True) as s2:
+            assert s1._filter_cache is s2._filter_cache
+            assert s1._filter_cache is searching.shared_filter_cache()
+
+
+def test_result_cache():
+    schema = fields.Schema(id=fields.ID(stored=True, unique=True),
+                           tag=fields.ID(sortable=True), text=fields.TEXT)
+    ix = RamStorage().create_index(schema)
+    for seg in xrange(2):
+        with ix.writer() as w:
+            for i in xrange(seg * 10, seg * 10 + 10):
+                tag = u("even") if i % 2 == 0 else u("odd")
+                w.add_document(id=text_type(i), tag=tag,
+                               text=u("alfa bravo") if i % 3 else u("alfa"))
+            w.merge = False
+
+    alfa = query.Term("text", u("alfa"))
+    bravo = query.Term("text", u("bravo"))
+    even = query.Term("tag", u("even"))
+
+    cache = searching.result_cache()
+    s = ix.searcher(resultcache=cache)
+    r1 = s.search(alfa, limit=5, filter=even, groupedby="tag")
+    assert cache.misses == 1
+    assert len(cache) == 1
+
+    # The same search comes from the cache
+    r2 = s.search(alfa, limit=5, filter=even, groupedby="tag")
+    assert cache.hits == 1
+    assert r2._collector is None
+    assert list(r2.items()) == list(r1.items())
+    assert r2.groups() == r1.groups()
+    assert len(r2) == len(r1) == 10
+    assert [hit["id"] for hit in r2] == [hit["id"] for hit in r1]
+    assert r2.filtered_count == r1.filtered_count == 10
+    assert r2.allowed == even
+    # Asking for the collector runs the search again
+    assert r2.collector is not None
+    assert r2.collector.filtered_count == 10
+
+    # Masked searches from the cache keep their filtered count too
+    odd = query.Term("tag", u("odd"))
+    m1 = s.search(alfa, mask=odd, limit=None)
+    m2 = s.search(alfa, mask=odd, limit=None)
+    assert cache.hits == 2
+    assert m2.filtered_count == m1.filtered_count == 10
+    assert m2.restricted == odd
+    assert [hit["id"] for hit in m2] == [hit["id"] for hit in m1]
+
+    # The query isn't normalized for the lookup, so an equivalent query
+    # written differently is a separate entry
+    s.search(query.Or([alfa]), limit=5, filter=even, groupedby="tag")
+    assert cache.misses == 3
+
+    # Searches with different arguments are separate entries
+    r3 = s.search(alfa, limit=5)
+    assert cache.misses == 4
+    r4 = s.search(alfa, limit=5)
+    assert cache.hits == 3
+    # The count wasn't exact, so the cached results re-run the search for it
+    assert len(r4) == len(r3) == 20
+    assert r4.docs() == r3.docs()
+
+    # Sorted pages come from the cache too
+    p1 = s.search_page(bravo, 2, pagelen=3, sortedby="tag")
+    p2 = s.search_page(bravo, 2, pagelen=3, sortedby="tag")
+    assert cache.hits == 4
+    assert [hit["id"] for hit in p2] == [hit["id"] for hit in p1]
+
+    # Searches with unhashable or extra arguments aren't cached
+    s.search(alfa, filter=set([1, 2]))
+    s.search(alfa, terms=True)
+    assert len(cache) == 5
+
+    # A refreshed searcher shares the cache, but doesn't see results for the
+    # previous version of the index
+    with ix.writer() as w:
+        w.delete_by_term("id", u("0"))
+    s = s.refresh()
+    assert s._result_cache is cache
+    r5 = s.search(alfa, limit=5, filter=even, groupedby="tag")
+    assert cache.hits == 4
+    assert len(r5) == 9
+    assert "0" not in [hit["id"] for hit in r5]
+    s.close()
+
+    # Searchers can share the process-wide cache
+    with ix.searcher(resultcache=True) as s1:
+        with ix.searcher(resultcache=True) as s2:
+            assert s1._result_cache is searching.shared_result_cache()
+            s1.search(bravo)
+            hits = s1._result_cache.hits
+            s2.search(bravo)
+            assert s2._result_cache.hits == hits + 1
+
+
+def test_scan():
+    schema = fields.Schema(id=fields.ID(stored=True, unique=True),
+                           num=fields.NUMERIC(stored=True, sortable=True),
+                           text=fields.TEXT)
+    ix = RamStorage().create_index(schema)
+    for seg in xrange(3):
+        with ix.writer() as w:
+            for i in xrange(seg * 20, seg * 20 + 20):
+                text = u("alfa bravo") if i % 3 else u("charlie")
+                w.add_document(id=text_type(i), num=i, text=text)
+            w.merge = False
+    with ix.writer() as w:
+        w.delete_by_term("id", u("1"))
+        w.merge = False
+
+    alfa = query.Term("text", u("alfa"))
+    with ix.searcher() as s:
+        expected = sorted(hit.docnum for hit in s.search(alfa, limit=None))
+        assert len(expected) == 39
+
+        batches = list(s.scan(alfa, batch=7))
+        assert [len(b) for b in batches] == [7] * 5 + [4]
+        items = [item for b in batches for item in b]
+        assert [docnum for docnum, _ in items] == expected
+        assert items[0][1] == s.stored_fields(items[0][0])
+        assert "1" not in [fs["id"] for _, fs in items]
+
+        # Only some fields, from the stored fields or the columns
+        items = [item for b in s.scan(alfa, fields=["num"]) for item in b]
+        assert items[0][1] == {"num": 2}
+        items = [item for b in s.scan(alfa, columns=True) for item in b]
+        assert items[0][1] == {"num": 2}
+        assert [fs["num"] for _, fs in items] == [i for i in xrange(60)
+                                                  if i % 3 and i != 1]
+
+        # Filter and mask
+        even = query.Or([query.Term("id", text_type(i))
+                         for i in xrange(0, 60, 2)])
+        items = [item for b in s.scan(alfa, filter=even, mask=set([4]))
+                 for item in b]
+        assert [int(fs["id"]) for _, fs in items] == [
+            i for i in xrange(2, 60, 2) if i % 3 and i != 4]
+
+        with pytest.raises(ValueError):
+            list(s.scan(alfa, batch=0))
@@ -1051,3 +1051,33 @@ def test_column_scoring():
             assert [hit["id"] for hit in r] == ["d", "c", "b", "a"]
 
 
+def test_sorted_zone_pruning():
+    schema = fields.Schema(id=fields.STORED, tag=fields.KEYWORD,
+                           ts=fields.NUMERIC(sortable=True))
+    with TempIndex(schema) as ix:
+        with ix.writer() as w:
+            for i in xrange(6000):
+                w.add_document(id=i, tag=u("a b") if i % 3 else u("b"),
+                               ts=i // 2)
+
+        with ix.searcher() as s:
+            for reverse in (False, True):
+                q = query.Term("tag", u("a"))
+                target = [i for i in xrange(6000) if i % 3]
+                target.sort(key=lambda i: i // 2, reverse=reverse)
+
+                r = s.search(q, sortedby="ts", reverse=reverse, limit=5)
+                assert [hit["ts"] for hit in r] == [i // 2 for i in target[:5]]
+                if not reverse:
+                    # The zones after the first can't contain a better key,
+                    # so they were skipped. (In reverse, every zone has better
+                    # keys than the ones before it.)
+                    assert r.collector.skipped_times
+                    assert not r.has_exact_length()
+                assert len(r) == len(target)
+                assert sorted(r.docs()) == sorted(target)
+
+                r = s.search(q, sortedby="ts", reverse=reverse, limit=None)
+                assert r.collector.skipped_times == 0
+                assert [hit["ts"] for hit in r][:5] == [i // 2
+                                                        for i in target[:5]]
@@ -3,10 +3,13 @@
 from __future__ import with_statement
 import random
 
+import pytest
+
 from whoosh.compat import b, xrange, iteritems
 from whoosh.filedb.filestore import RamStorage
 from whoosh.filedb.filetables import HashReader, HashWriter
 from whoosh.filedb.filetables import OrderedHashWriter, OrderedHashReader
+from whoosh.filedb.filetables import FrontCodedWriter, FrontCodedReader
 from whoosh.util.testing import TempStorage
 
 
@@ -175,6 +178,57 @@ def test_extras():
     hr.close()
 
 
+def test_front_coded():
+    words = set()
+    for _ in xrange(500):
+        words.add(b("").join(random.choice([b("al"), b("pha"), b("x"), b("yz")])
+                             for _ in xrange(random.randint(1, 8))))
+    keys = sorted(words)
+    # Include some values too long for a byte-sized lengths array
+    values = [b("v%d" % i) * random.choice([1, 1, 100]) for i in xrange(len(keys))]
+
+    def check(st):
+        fw = FrontCodedWriter(st.create_file("test.fct"), blocksize=7)
+        fw.extras["blah"] = "foo"
+        fw.add_all(zip(keys, values))
+        fw.close()
+
+        fr = FrontCodedReader.open(st, "test.fct")
+        assert fr.extras["blah"] == "foo"
+        assert len(fr) == len(keys)
+        assert list(fr.keys()) == keys
+        assert list(fr.items()) == list(zip(keys, values))
+        for i in random.sample(range(len(keys)), 50):
+            assert keys[i] in fr
+            assert fr[keys[i]] == values[i]
+            assert list(fr.keys_from(keys[i])) == keys[i:]
+            missing = keys[i] + b("\x00")
+            assert missing not in fr
+            assert fr.get(missing) is None
+            if i + 1 < len(keys):
+                assert fr.closest_key(missing) == keys[i + 1]
+        assert fr.closest_key(b("")) == keys[0]
+        assert fr.closest_key(keys[-1] + b("z")) is None
+        assert list(fr.items_from(b("zz"))) == []
+        with pytest.raises(KeyError):
+            fr[b("nope")]
+        fr.close()
+
+    check(RamStorage())
+    with TempStorage("frontcoded") as st:
+        check(st)
+
+
+def test_front_coded_order():
+    st = RamStorage()
+    fw = FrontCodedWriter(st.create_file("test"))
+    fw.add(b("bravo"), b("1"))
+    with pytest.raises(ValueError):
+        fw.add(b("alfa"), b("2"))
+    with pytest.raises(ValueError):
+        fw.add(b("bravo"), b("2"))
+
+
 def test_checksum_file():
     from whoosh.filedb.structfile import ChecksumFile
     from zlib import crc32
@@ -454,3 +454,389 @@ def test_delete_by_term_has_del():
         with ix.reader() as r:
             assert not r.has_deletions()
 
+
+
+def test_merge_bypasses_pool():
+    schema = fields.Schema(id=fields.ID(stored=True), text=fields.TEXT,
+                           tag=fields.KEYWORD)
+    domain = u"alfa bravo charlie delta echo foxtrot golf hotel".split()
+    with TempIndex(schema) as ix:
+        for i in xrange(3):
+            with ix.writer() as w:
+                for j in xrange(20):
+                    n = i * 20 + j
+                    w.add_document(id=text_type(n),
+                                   text=u" ".join(domain[n % 8:n % 8 + 3]),
+                                   tag=domain[n % 5])
+                w.merge = False
+
+        with ix.writer() as w:
+            w.delete_by_term("id", u"5")
+            w.delete_by_term("id", u"42")
+            w.merge = False
+
+        with ix.searcher() as s:
+            target = dict((t, sorted(s.stored_fields(d)["id"] for d
+                                     in s.postings("text", t).all_ids()))
+                          for t in domain)
+
+        w = ix.writer()
+        added = []
+        pool_add = w.pool.add
+
+        def counting(item):
+            added.append(item)
+            return pool_add(item)
+        w.pool.add = counting
+        w.add_document(id=u"60", text=u"alfa golf", tag=u"india")
+        w.commit(optimize=True)
+
+        # Only the new document's postings went through the pool
+        assert set(item[2] for item in added) == set([0])
+
+        assert len(ix._segments()) == 1
+        with ix.searcher() as s:
+            assert s.doc_count_all() == 59
+            target["alfa"].append(u"60")
+            target["golf"].append(u"60")
+            for t in domain:
+                ids = [s.stored_fields(d)["id"] for d
+                       in s.postings("text", t).all_ids()]
+                assert sorted(ids) == sorted(target[t])
+            r = s.search(query.Term("tag", u"india"))
+            assert [hit["id"] for hit in r] == [u"60"]
+
+
+def test_tiered_merge_policy():
+    schema = fields.Schema(id=fields.ID(stored=True))
+    ix = RamStorage().create_index(schema)
+    policy = writing.TieredMergePolicy(segments_per_tier=2, floor_mb=0.01)
+
+    for i in xrange(3):
+        with ix.writer() as w:
+            w.add_document(id=text_type(i))
+            w.merge = False
+    assert policy.find_merges(ix.storage, ix._segments()) == []
+
+    with ix.writer() as w:
+        w.add_document(id=u"3")
+        w.merge = False
+    segments = ix._segments()
+    merges = policy.find_merges(ix.storage, segments)
+    assert len(merges) == 1
+    assert len(merges[0]) == 2
+
+    # A segment with enough deletions is rewritten by itself
+    with ix.writer() as w:
+        for i in xrange(4):
+            w.add_document(id=text_type(10 + i))
+        w.merge = False
+    with ix.writer() as w:
+        w.delete_by_term("id", u"10")
+        w.delete_by_term("id", u"11")
+        w.merge = False
+    segments = ix._segments()
+    merges = policy.find_merges(ix.storage, segments)
+    assert [segments[-1]] in merges
+
+
+def test_merge_scheduler():
+    schema = fields.Schema(id=fields.ID(stored=True))
+    ix = RamStorage().create_index(schema)
+    policy = writing.TieredMergePolicy(segments_per_tier=2, floor_mb=0.01)
+
+    deleted = []
+
+    class Scheduler(writing.MergeScheduler):
+        def _merge_group(self, writer, schema, group):
+            # Delete a document from a source segment while the merge runs
+            with ix.writer() as w:
+                w.delete_by_term("id", u"1")
+                w.merge = False
+            deleted.append(True)
+            return writing.MergeScheduler._merge_group(self, writer, schema,
+                                                       group)
+
+    scheduler = Scheduler(ix, policy)
+    for i in xrange(3):
+        with ix.writer() as w:
+            w.add_document(id=text_type(i))
+            w.merge = False
+    assert len(ix._segments()) == 3
+
+    with ix.writer() as w:
+        w.add_document(id=u"3")
+        w.mergetype = scheduler
+    # The commit doesn't merge anything itself
+    assert len(ix._segments()) >= 3
+    scheduler.wait()
+
+    assert deleted
+    assert len(ix._segments()) < 4
+    with ix.searcher() as s:
+        ids = sorted(s.stored_fields(d)["id"] for d in s.reader().all_doc_ids())
+        assert ids == [u"0", u"2", u"3"]
+        assert not s.document_number(id=u"1")
+        assert s.document_number(id=u"2") is not None
+
+
+def test_merge_scheduler_cleanup():
+    import os
+
+    schema = fields.Schema(id=fields.ID(stored=True))
+    policy = writing.TieredMergePolicy(segments_per_tier=2, floor_mb=0.01)
+
+    def tempdirs(ix):
+        return [name for name in os.listdir(ix.storage.folder)
+                if name.endswith(".tmp")]
+
+    class FailingScheduler(writing.MergeScheduler):
+        def _merge_group(self, writer, schema, group):
+            writing.MergeScheduler._merge_group(self, writer, schema, group)
+            raise ValueError("merge failed")
+
+    with TempIndex(schema, "mergecleanup") as ix:
+        schedulers = (writing.MergeScheduler(ix, policy),
+                      FailingScheduler(ix, policy))
+        for n, scheduler in enumerate(schedulers):
+            for i in xrange(3):
+                with ix.writer() as w:
+                    w.add_document(id=text_type(i))
+                    w.mergetype = scheduler
+
+            if isinstance(scheduler, FailingScheduler):
+                # The error in the merge thread is raised by wait()
+                with pytest.raises(ValueError):
+                    scheduler.wait()
+                # It's only reported once
+                scheduler.wait()
+            else:
+                scheduler.wait()
+
+            # The merge writer's temporary files are gone either way
+            assert tempdirs(ix) == []
+            with ix.reader() as r:
+                assert r.doc_count() == 3 * (n + 1)
+
+
+def test_nrt_reader():
+    schema = fields.Schema(id=fields.ID(stored=True, unique=True),
+                           text=fields.TEXT)
+    ix = RamStorage().create_index(schema)
+    with ix.writer() as w:
+        w.add_document(id=u"a", text=u"alfa bravo")
+        w.add_document(id=u"b", text=u"bravo charlie")
+
+    w = ix.writer()
+    s = w.nrt_searcher()
+    assert s.doc_count() == 2
+
+    w.add_document(id=u"c", text=u"charlie delta")
+    assert s.up_to_date()
+    assert w.flush() is not None
+    assert w.flush() is None
+    assert not s.up_to_date()
+    s = s.refresh()
+    assert s.up_to_date()
+    assert s.doc_count() == 3
+    ids = [hit["id"] for hit in s.search(query.Term("text", u"charlie"))]
+    assert sorted(ids) == [u"b", u"c"]
+
+    # Deletions show up without committing, and unchanged segments are reused
+    leaves = [r for r, _ in s.reader().leaf_readers()]
+    w.update_document(id=u"b", text=u"echo")
+    s = s.refresh()
+    assert [r for r, _ in s.reader().leaf_readers()][:2] == leaves
+    ids = [hit["id"] for hit in s.search(query.Term("text", u"charlie"))]
+    assert ids == [u"c"]
+    assert [hit["id"] for hit in s.search(query.Term("text", u"echo"))] == [u"b"]
+
+    # Nothing is visible to other readers until the writer commits
+    with ix.searcher() as s2:
+        assert s2.doc_count() == 2
+    w.commit()
+    with ix.searcher() as s2:
+        assert s2.doc_count() == 3
+        assert sorted(s2.reader().all_stored_fields(),
+                      key=lambda d: d["id"]) == [{"id": u"a"}, {"id": u"b"},
+                                                  {"id": u"c"}]
+
+
+def test_flushmb():
+    schema = fields.Schema(id=fields.ID(stored=True), text=fields.TEXT)
+    ix = RamStorage().create_index(schema)
+    domain = u"alfa bravo charlie delta echo foxtrot golf hotel".split()
+
+    w = ix.writer(flushmb=0.002)
+    for i in xrange(40):
+        w.add_document(id=text_type(i), text=u" ".join(domain))
+        assert w.pool.addedsize < 0.002 * 1024 * 1024
+    flushed = len(w.segments)
+    assert flushed > 1
+
+    # A group of documents isn't split between segments
+    with w.group():
+        for i in xrange(40, 60):
+            w.add_document(id=text_type(i), text=u" ".join(domain))
+    assert len(w.segments) == flushed + 1
+    assert w.segments[-1].doc_count_all() == 20
+
+    w.commit(merge=False)
+    assert len(ix._segments()) == flushed + 1
+    with ix.searcher() as s:
+        assert s.doc_count() == 60
+        assert len(list(s.documents(text=u"golf"))) == 60
+
+
+def test_flushed_segments():
+    schema = fields.Schema(id=fields.ID(stored=True), text=fields.TEXT)
+    domain = u"alfa bravo charlie delta echo foxtrot golf hotel".split()
+    with TempIndex(schema, "flushed") as ix:
+        w = ix.writer(flushmb=0.002)
+        for i in xrange(40):
+            w.add_document(id=text_type(i), text=u" ".join(domain))
+            # The count includes documents in already flushed segments
+            assert w.doc_count() == i + 1
+        assert len(w._flushed) > 1
+
+        # Flushed segments are assembled into compound files
+        for segment in w._flushed:
+            assert segment.is_compound()
+            assert segment.list_files(ix.storage) == [
+                segment.make_filename(segment.COMPOUND_EXT)]
+
+        with w.nrt_searcher() as s:
+            assert s.doc_count() == 40
+
+        # Cancelling deletes the flushed segments' files
+        flushed = list(w._flushed)
+        w.cancel()
+        for segment in flushed:
+            assert segment.list_files(ix.storage) == []
+        with ix.searcher() as s:
+            assert s.doc_count() == 0
+
+        w = ix.writer(flushmb=0.002)
+        for i in xrange(40):
+            w.add_document(id=text_type(i), text=u" ".join(domain))
+        w.commit(merge=False)
+        with ix.searcher() as s:
+            assert s.doc_count() == 40
+            assert len(list(s.documents(text=u"golf"))) == 40
+
+
+def test_posting_pool_buffer():
+    from whoosh.codec import default_codec
+    from whoosh.util.testing import TempStorage
+
+    items = []
+    for docnum in xrange(200):
+        for t in (b("alfa"), b("bravo"), b("charlie")[:docnum % 5 + 1]):
+            vbytes = b("v%d" % docnum) if docnum % 3 == 0 else None
+            items.append(("text", t, docnum, float(docnum % 4 + 1), vbytes))
+        items.append(("id", b("%05d" % docnum), docnum, 1.0, None))
+
+    with TempStorage("postingpool") as st:
+        segment = default_codec().new_segment(st, "test")
+
+        # Everything in memory
+        pool = writing.PostingPool(st, segment)
+        for item in items:
+            pool.add(item)
+        assert list(pool.iter_postings()) == sorted(items)
+
+        # Spilled to runs
+        pool = writing.PostingPool(st, segment, limitmb=0.001)
+        for item in items:
+            pool.add(item)
+        assert len(pool.runs) > 1
+        assert list(pool.iter_postings()) == sorted(items)
+        assert pool.fieldnames == set(["text", "id"])
+
+
+def test_add_documents():
+    schema = fields.Schema(id=fields.ID(stored=True), text=fields.TEXT,
+                           tag=fields.KEYWORD(stored=True))
+
+    def docs():
+        for i in xrange(30):
+            doc = {"id": text_type(i),
+                   "text": u"alfa " + (u"bravo", u"charlie", u"delta")[i % 3]}
+            if i % 2:
+                doc["tag"] = u"odd"
+                doc["_stored_id"] = u"x%d" % i
+            if i == 5:
+                doc["_text_boost"] = 3.0
+            yield doc
+
+    def check(ix):
+        with ix.searcher() as s:
+            assert s.doc_count() == 30
+            assert len(s.search(query.Term("tag", u"odd"), limit=None)) == 15
+            r = s.search(query.Term("text", u"delta"), limit=None)
+            assert len(r) == 10
+            r = s.search(query.Term("text", u"alfa"))
+            assert r[0]["id"] == u"x5"
+            assert s.document(id=u"4") == {"id": u"4"}
+
+    with TempIndex(schema, "adddocs") as ix:
+        with ix.writer() as w:
+            w.add_documents(docs())
+        check(ix)
+
+    with TempIndex(schema, "adddocsmp") as ix:
+        from whoosh.multiproc import SerialMpWriter
+        w = SerialMpWriter(ix, procs=2, batchsize=4)
+        w.add_documents(docs())
+        w.commit()
+        check(ix)
+
+    with TempIndex(schema, "adddocsbuf") as ix:
+        w = writing.BufferedWriter(ix, period=None, limit=7)
+        w.add_documents(docs())
+        assert w.searcher().doc_count() == 30
+        w.close()
+        check(ix)
+
+    with TempIndex(schema, "adddocsbad") as ix:
+        with pytest.raises(fields.UnknownFieldError):
+            with ix.writer() as w:
+                w.add_documents([{"id": u"1"}, {"id": u"2", "bogus": u"x"}])
+
+
+def test_update_documents():
+    schema = fields.Schema(id=fields.ID(stored=True, unique=True),
+                           num=fields.NUMERIC(stored=True, unique=True),
+                           text=fields.TEXT(stored=True))
+
+    with TempIndex(schema, "updatedocs") as ix:
+        for start in (0, 10):
+            with ix.writer() as w:
+                for i in xrange(start, start + 10):
+                    w.add_document(id=text_type(i), num=100 + i, text=u"old")
+                w.merge = False
+        with ix.writer() as w:
+            w.delete_by_term("id", u"3")
+            w.merge = False
+
+        def docs():
+            for i in (3, 4, 12, 25):
+                yield {"id": text_type(i), "text": u"new"}
+            # Replace by the other unique field
+            yield {"num": 115, "id": u"x", "text": u"new"}
+
+        with ix.writer() as w:
+            w.update_documents(docs(), batchsize=2)
+
+        with ix.searcher() as s:
+            old = sorted(s.stored_fields(d)["id"] for d
+                         in s.document_numbers(text=u"old"))
+            new = sorted(s.stored_fields(d)["id"] for d
+                         in s.document_numbers(text=u"new"))
+            assert old == sorted(text_type(i) for i in xrange(20)
+                                 if i not in (3, 4, 12, 15))
+            assert new == [u"12", u"25", u"3", u"4", u"x"]
+
+            r = s.reader()
+            assert r.docs_for_terms("id", [u"x", u"zz", u"0"]) == set(
+                [s.document_number(id=u"x"), s.document_number(id=u"0")])